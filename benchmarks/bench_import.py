@@ -0,0 +1,85 @@
+"""
+Import-time and constructor-time benchmark for lampscores.
+
+Each measurement runs in a fresh interpreter so module caching does not hide regressions:
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --repeat 10 --max-import-ms 100 --max-construct-ms 50
+
+Exits with status 1 if a median exceeds its --max-* limit, so it can guard against regressions in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+CASES = {
+    # Bare package import: should not load pandas, numpy, or tqdm
+    "import lampscores": """
+import time
+start = time.perf_counter()
+import lampscores
+elapsed = time.perf_counter() - start
+import sys
+heavy = [m for m in ("pandas", "numpy", "tqdm", "openai") if m in sys.modules]
+print(json.dumps({"seconds": elapsed, "heavy_modules": heavy}))
+""",
+    # Importing the main class (pulls in pandas and numpy)
+    "from lampscores import LaMPscores": """
+import time
+start = time.perf_counter()
+from lampscores import LaMPscores
+print(json.dumps({"seconds": time.perf_counter() - start}))
+""",
+    # Constructing LaMPscores without a voteview_df: reference data must not be loaded here
+    "LaMPscores(...)": """
+import time
+from lampscores import LaMPscores
+start = time.perf_counter()
+lamp = LaMPscores(client=None, model="gpt-4o-mini", congress_number=118, chamber="S", politician_type="senator")
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "data_loaded": lamp._data_loaded}))
+""",
+}
+
+def run_case(code):
+    env = dict(os.environ, PYTHONPATH=SRC + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    output = subprocess.run([sys.executable, "-c", "import json\n" + code], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=None, help="limit for the bare 'import lampscores'")
+    parser.add_argument("--max-construct-ms", type=float, default=None, help="limit for LaMPscores(...)")
+    args = parser.parse_args()
+
+    failures = []
+    for name, code in CASES.items():
+        runs = [run_case(code) for _ in range(args.repeat)]
+        median_ms = statistics.median(run["seconds"] for run in runs) * 1000
+        extra = {key: value for key, value in runs[-1].items() if key != "seconds"}
+        print(f"{name:40s} median {median_ms:8.1f} ms over {args.repeat} runs  {extra if extra else ''}")
+
+        if name == "import lampscores":
+            if extra["heavy_modules"]:
+                failures.append(f"'import lampscores' loaded {extra['heavy_modules']}")
+            if args.max_import_ms is not None and median_ms > args.max_import_ms:
+                failures.append(f"'import lampscores' took {median_ms:.1f} ms (limit {args.max_import_ms} ms)")
+        if name == "LaMPscores(...)":
+            if extra["data_loaded"]:
+                failures.append("LaMPscores(...) loaded reference data in the constructor")
+            if args.max_construct_ms is not None and median_ms > args.max_construct_ms:
+                failures.append(f"LaMPscores(...) took {median_ms:.1f} ms (limit {args.max_construct_ms} ms)")
+
+    for failure in failures:
+        print("FAIL:", failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark of packed (listwise) prompting against one pair per call.
+
+Runs the same matchups against FakeAsyncOpenAI, with a latency of a fixed per-request overhead plus per-token
+prefill and decode costs, and reports calls, tokens, and wall-clock time:
+
+    python benchmarks/bench_packing.py
+    python benchmarks/bench_packing.py --members 100 --per-item 10 --pack-sizes 5 10 20 --drop-rate 0.05
+
+Token counts are estimated as characters / 4, so they compare the modes rather than predict a bill.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from lampscores import FakeAsyncOpenAI, LaMPscores  # noqa: E402
+
+def roster(n, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"bioname_canonical": [f"Member {i}" for i in range(n)],
+                         "bioguide_id": [f"M{i:06d}" for i in range(n)],
+                         "chamber": "Senate",
+                         "congress": 118,
+                         "party_code": rng.choice([100, 200], n),
+                         "state_abbrev": "NY"})
+
+async def run_mode(args, voteview_df, scores, **kwargs):
+    client = FakeAsyncOpenAI(scores=scores,
+                             latency=args.overhead,
+                             input_token_latency=args.prefill_per_token,
+                             output_token_latency=args.decode_per_token,
+                             malformed_rate=args.drop_rate,
+                             seed=args.seed)
+
+    async def quiet(completed, total):
+        pass
+
+    lamp = LaMPscores(client,
+                      "simulated",
+                      voteview_df=voteview_df,
+                      politician_type="senator",
+                      sample_per_item=args.per_item,
+                      concurrency=args.concurrency,
+                      progress_callback=quiet,
+                      **kwargs)
+    start = time.perf_counter()
+    await lamp.run()
+    elapsed = time.perf_counter() - start
+    return client, elapsed, lamp.matchup_results_df
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=100)
+    parser.add_argument("--per-item", type=int, default=10)
+    parser.add_argument("--pack-sizes", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--overhead", type=float, default=0.05, help="seconds per request")
+    parser.add_argument("--prefill-per-token", type=float, default=0.00002)
+    parser.add_argument("--decode-per-token", type=float, default=0.001)
+    parser.add_argument("--drop-rate", type=float, default=0.0,
+                        help="share of packed verdicts the model leaves out (and of malformed extractions)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    voteview_df = roster(args.members, args.seed)
+    scores = dict(zip(voteview_df["bioname_canonical"], np.random.default_rng(args.seed + 1).normal(size=args.members)))
+
+    modes = [("two calls per pair", {}), ("structured, 1 per call", {"structured_output": True})]
+    modes += [(f"packed, {k} per call", {"pack_size": k}) for k in args.pack_sizes]
+
+    rows = []
+    baseline = None
+    for name, kwargs in modes:
+        client, elapsed, df = asyncio.run(run_mode(args, voteview_df, scores, **kwargs))
+        if baseline is None:
+            baseline = df
+        rows.append({"mode": name,
+                     "matchups": len(df),
+                     "calls": client.calls,
+                     "input_tokens": client.input_tokens,
+                     "output_tokens": client.output_tokens,
+                     "seconds": round(elapsed, 2),
+                     "errors": int(df["extraction_error"].sum()),
+                     "agreement": float((df["win0"].to_numpy() == baseline["win0"].to_numpy()).mean())})
+
+    print()
+    print(pd.DataFrame(rows).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+End-to-end throughput benchmark for LaMPscores.run() against the in-process FakeAsyncOpenAI backend.
+
+Each (scenario, concurrency) case runs in a fresh interpreter and reports wall-clock time, requests per second,
+peak resident memory, scheduler overhead (CPU time per request), and efficiency (the wall-clock time a perfect
+scheduler would need, given the simulated latencies and the concurrency limit, divided by the actual time):
+
+    python benchmarks/bench_throughput.py
+    python benchmarks/bench_throughput.py --scenarios senate house --concurrency 25 125 500 --output base.json
+    python benchmarks/bench_throughput.py --baseline base.json --tolerance 0.2
+
+Scenarios are "senate" (100 members), "house" (435 members), and "multi" (three Senates and three Houses run
+together by LaMPscoresBatch). With --baseline, exits with status 1 if any case loses more than --tolerance of
+its throughput or grows its memory peak by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+SCENARIOS = {"senate": [("S", 118, 100)],
+             "house": [("H", 118, 435)],
+             "multi": [("S", 116, 100), ("S", 117, 100), ("S", 118, 100),
+                       ("H", 116, 435), ("H", 117, 435), ("H", 118, 435)]}
+
+def roster(chamber, congress, n):
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(congress * 1000 + n)
+    return pd.DataFrame({"bioname_canonical": [f"{chamber}{congress} Member {i}" for i in range(n)],
+                         "bioguide_id": [f"{chamber}{congress}{i:05d}" for i in range(n)],
+                         "chamber": "Senate" if chamber == "S" else "House",
+                         "congress": congress,
+                         "party_code": rng.choice([100, 200], n),
+                         "state_abbrev": "NY"})
+
+async def run_case(case):
+    from lampscores import FakeAsyncOpenAI, LaMPscores, LaMPscoresBatch
+
+    fake = FakeAsyncOpenAI(latency=("lognormal", case["latency"], case["latency_sigma"]),
+                           output_token_latency=case["output_token_latency"],
+                           malformed_rate=case["malformed_rate"],
+                           seed=case["seed"])
+
+    async def quiet(completed, total):
+        pass
+
+    rosters = SCENARIOS[case["scenario"]]
+    lamp_kwargs = {"sample_per_item": case["per_item"], "temperature": 0.0, "progress_callback": quiet}
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    if len(rosters) == 1:
+        chamber, congress, n = rosters[0]
+        lamp = LaMPscores(fake, "fake", congress_number=congress, chamber=chamber,
+                          politician_type="senator" if chamber == "S" else "representative",
+                          voteview_df=roster(chamber, congress, n), concurrency=case["concurrency"], **lamp_kwargs)
+        await lamp.run()
+        matchups = len(lamp.matchup_results_df)
+    else:
+        jobs = [{"name": f"{chamber}{congress}", "congress_number": congress, "chamber": chamber,
+                 "voteview_df": roster(chamber, congress, n),
+                 "politician_type": "senator" if chamber == "S" else "representative"}
+                for chamber, congress, n in rosters]
+        batch = LaMPscoresBatch(fake, "fake", jobs, concurrency=case["concurrency"], max_active_jobs=len(jobs), **lamp_kwargs)
+        matchups = len(await batch.run())
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    stats = fake.stats()
+    ideal = stats["simulated_seconds"] / case["concurrency"]
+    return {"matchups": matchups,
+            "requests": stats["calls"],
+            "wall_seconds": round(wall, 3),
+            "requests_per_second": round(stats["calls"] / wall, 1),
+            "cpu_us_per_request": round(cpu / stats["calls"] * 1e6, 1),
+            "efficiency": round(ideal / wall, 3),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "max_in_flight": stats["max_in_flight"]}
+
+def run_in_subprocess(case):
+    env = dict(os.environ, PYTHONPATH=SRC + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case)],
+                            env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+CASE_FIELDS = ("scenario", "concurrency", "per_item", "latency", "latency_sigma", "output_token_latency",
+               "malformed_rate", "seed")
+
+def compare(results, baseline, tolerance):
+    # Returns a description of every case that regressed by more than tolerance; only identical cases are compared
+    failures = []
+    previous = {tuple(row[field] for field in CASE_FIELDS): row for row in baseline["results"]}
+    for row in results:
+        old = previous.get(tuple(row[field] for field in CASE_FIELDS))
+        if old is None:
+            continue
+        name = f"{row['scenario']} @ {row['concurrency']}"
+        throughput = row["requests_per_second"] / old["requests_per_second"]
+        memory = row["peak_rss_mb"] / old["peak_rss_mb"]
+        print(f"{name:20s} throughput x{throughput:.2f}  peak memory x{memory:.2f}")
+        if throughput < 1 - tolerance:
+            failures.append(f"{name}: throughput fell to {row['requests_per_second']} requests/s "
+                            f"from {old['requests_per_second']}")
+        if memory > 1 + tolerance:
+            failures.append(f"{name}: peak memory rose to {row['peak_rss_mb']} MB from {old['peak_rss_mb']}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=["senate", "house", "multi"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[25, 125, 500])
+    parser.add_argument("--per-item", type=int, default=10, help="sampled matchups per member")
+    parser.add_argument("--latency", type=float, default=0.05, help="median request latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal spread of the latency")
+    parser.add_argument("--output-token-latency", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.02, help="share of malformed extractions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--baseline", help="compare with results saved by --output")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        import asyncio
+        import contextlib
+        # Progress messages from the run go to stderr so stdout carries only the result
+        with contextlib.redirect_stdout(sys.stderr):
+            result = asyncio.run(run_case(json.loads(args.run_case)))
+        print(json.dumps(result))
+        return
+
+    results = []
+    print(f"{'scenario':10s} {'conc.':>6s} {'requests':>9s} {'wall s':>8s} {'req/s':>8s} {'cpu us/req':>11s} "
+          f"{'efficiency':>10s} {'peak MB':>8s}")
+    for scenario in args.scenarios:
+        for concurrency in args.concurrency:
+            case = {"scenario": scenario,
+                    "concurrency": concurrency,
+                    "per_item": args.per_item,
+                    "latency": args.latency,
+                    "latency_sigma": args.latency_sigma,
+                    "output_token_latency": args.output_token_latency,
+                    "malformed_rate": args.malformed_rate,
+                    "seed": args.seed}
+            row = {**case, **run_in_subprocess(case)}
+            results.append(row)
+            print(f"{scenario:10s} {concurrency:6d} {row['requests']:9d} {row['wall_seconds']:8.2f} "
+                  f"{row['requests_per_second']:8.1f} {row['cpu_us_per_request']:11.1f} {row['efficiency']:10.3f} "
+                  f"{row['peak_rss_mb']:8.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "results": results}, f, indent=1)
+        print(f"Saved results to {args.output}")
+
+    failures = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures = compare(results, json.load(f), args.tolerance)
+    for failure in failures:
+        print("FAIL:", failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
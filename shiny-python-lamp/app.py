@@ -1,13 +1,15 @@
-import io
+import os
 import asyncio
+import tempfile
+import urllib.parse
 from openai import AsyncOpenAI
-import traceback
-import sys
-from contextlib import contextmanager
 
+import pandas as pd
 from shiny import App, ui, reactive, render
 
-from lampscores import LaMPscores
+from lampscores import LaMPscores, write_results
+
+from jobs import JobManager
 
 DEEPINFRA_BASE_URL = "https://api.deepinfra.com/v1/openai"
 congress_choices = {str(n): str(n) for n in range(37, 120)}
@@ -23,7 +25,8 @@ model_config_card = ui.card(
     ui.input_text("model", "Model", placeholder="gpt-4.1-mini"),
     ui.input_slider("temperature", "Temperature", 0.0, 2.0, 1.0, step=0.1),
     ui.input_slider("top_p", "top‑p", 0.0, 1.0, 1.0, step=0.05),
-    ui.input_slider("concurrency", "Number of calls in parallel", 1, 200, 125, step=1)
+    ui.input_slider("concurrency", "Number of calls in parallel", 1, 200, 125, step=1),
+    ui.tooltip(ui.input_checkbox("adaptive_rate_limit", "Adapt calls in parallel to the provider's rate limits", value=True), "Lowers the number of calls in parallel when the provider returns rate-limit (429) or server errors, and raises it back up to the maximum above as calls succeed.")
 )
 
 ## Voteview Configuration Card
@@ -44,6 +47,7 @@ voteview_config_card = ui.card(
         ui.tooltip(ui.input_checkbox("use_canonical_names", "Merge in canonical (i.e., commonly used) names"), "Canonical names may be provided as a variable \"bioname_canonical\". Canonical names are the names we commonly refer to politicians as, such as the title of their Wikipedia page. If canonical names are not provided, check to automatically merge these in.")
     ),
     ui.input_text("num_sample", "Number of samples per politician. Leave blank to make all pairwise comparisons."),
+    ui.tooltip(ui.input_select("sampling_strategy", "How to sample pairwise comparisons", {"per_item": "Each politician starts the number of samples above", "balanced": "Each politician appears exactly the number of samples above", "uniform": "Uniformly random pairs", "stratified": "Half within party, half across parties"}), "Only used if the number of samples per politician is set."),
     ui.tooltip(ui.input_text("seed", "Random seed for sampling and pairing", value="42", placeholder="42"), "Defaults to seed 42")
 )
 
@@ -88,7 +92,21 @@ console_output_card = ui.card(
     ui.output_text_verbatim("console_output_verbatim", placeholder=True)
 )
 
-run_button = ui.input_action_button("run_button", "Run pairwise comparisons", class_="btn-primary mt-3")
+## Job Card
+job_card = ui.card(
+    ui.card_header("Run"),
+    ui.output_ui("job_status_ui"),
+    ui.layout_columns(
+        ui.input_action_button("run_button", "Run pairwise comparisons", class_="btn-primary"),
+        ui.input_action_button("cancel_button", "Cancel run", class_="btn-outline-danger"),
+        col_widths=[6, 6]
+    ),
+    ui.layout_columns(
+        ui.tooltip(ui.input_text("job_id", "Job ID", placeholder="Reconnect to a run by its job ID"), "Runs continue in the background if you close or reload this page. Enter the job ID shown above, or open this page with ?job=<job ID>, to follow the run again and download its results."),
+        ui.input_action_button("reconnect_button", "Reconnect", class_="mt-4"),
+        col_widths=[8, 4]
+    )
+)
 
 download_button = ui.output_ui("download_ui")
 
@@ -97,185 +115,210 @@ app_ui = ui.page_fluid(
     ui.layout_columns(model_config_card, voteview_config_card, col_widths=[6, 6]),
     ui.layout_columns(prompt_config_card, extraction_prompt_config_card, col_widths=[6, 6]),
     ui.layout_columns(console_output_card, col_widths=[12]),
-    ui.layout_columns(run_button, col_widths=[4]),
+    ui.layout_columns(job_card, col_widths=[6]),
     ui.layout_columns(download_button, col_widths=[4])
 )
 
-class StreamToReactive:
-    def __init__(self, reactive_val):
-        self.reactive_val = reactive_val
-
-    def write(self, text):
-        current_value = self.reactive_val.get()
-        self.reactive_val.set(current_value + text)
-
-    def flush(self):
-        # This method is required for file-like objects
-        pass
-
-
-@contextmanager
-def reactive_console_output(reactive_val):
-    old_stdout = sys.stdout
-    sys.stdout = StreamToReactive(reactive_val)
-    try:
-        yield
-    finally:
-        sys.stdout = old_stdout
+# Shared by every session, so a run keeps going (and can be reconnected to) after its page is closed
+jobs = JobManager(max_running=4)
 
 def server(input, output, session):
-    results_df_store = reactive.Value(None)
-    console_log = reactive.Value("")
+    job_id = reactive.Value(None)
+    job_version = reactive.Value(-1)
 
-    async def do_run():
-        console_log.set("")
+    def current_job():
+        return jobs.get(job_id.get())
 
-        progress_info = {"bar": None, "phase": ""}
+    @reactive.effect
+    def _():
+        query = urllib.parse.parse_qs(session.clientdata.url_search().lstrip("?"))
+        with reactive.isolate():
+            if job_id.get() is None and jobs.get(query.get("job", [""])[0]) is not None:
+                job_id.set(query["job"][0].strip())
 
-        async def batch_progress_callback(completed, total):
-            if progress_info["bar"]:
-                progress_info["bar"].set(value=completed, message=f"{progress_info['phase']}: {completed}/{total}")
-            await asyncio.sleep(0.001)
+    @reactive.effect
+    def _poll_job():
+        job = current_job()
+        if job is None:
+            return
+        # Polling reads a few attributes of the job, and redraws happen at most 10 times a second however fast it progresses
+        if job.active:
+            reactive.invalidate_later(0.1)
+        job_version.set(job.version)
+
+    def submit_run():
+        if not input.api_key():
+            ui.modal_show(ui.modal("Please enter API key.", easy_close=True))
+            return
+
+        seed_value = None
+        if input.seed() != "":
+            try:
+                seed_value = int(input.seed())
+            except ValueError:
+                ui.modal_show(ui.modal("Seed must be an integer.", easy_close=True))
+                return
 
-        with reactive_console_output(console_log):
+        num_sample = None
+        if input.num_sample() != "":
             try:
-                if not input.api_key():
-                    ui.modal_show(ui.modal("Please enter API key.", easy_close=True))
-                    return 
-
-                seed_value = None
-                if input.seed() != "":
-                    try:
-                        seed_value = int(input.seed())
-                    except ValueError:
-                        ui.modal_show(ui.modal("Seed must be an integer.", easy_close=True))
-                        return
-                    
-                num_sample = None
-                if input.num_sample() != "":
-                    try:
-                        num_sample = int(input.num_sample())
-                    except ValueError:
-                        ui.modal_show(ui.modal("Number of samples must be an integer.", easy_close=True))
-                        return
-                
-                results_df_store.set(None)
-                    
-                # Read the API key and setup client 
-                client_kwargs = dict(api_key=input.api_key())
-                if input.provider() == 'deepinfra':
-                    client_kwargs['base_url'] = DEEPINFRA_BASE_URL
-                client = AsyncOpenAI(**client_kwargs)
-
-                prompt = input.prompt_unidirectional() if input.prompt_unidirectional() != "" else None
-                liberal_direction_prompt = input.liberal_direction_prompt() if input.liberal_direction_prompt() != "" else None
-                conservative_direction_prompt = input.conservative_direction_prompt() if input.conservative_direction_prompt() != "" else None
-
-                extraction_prompt = input.extraction_prompt_unidirectional() if input.extraction_prompt_unidirectional() != "" else None
-                liberal_extraction_prompt = input.liberal_extraction_prompt() if input.liberal_extraction_prompt() != "" else None
-                conservative_extraction_prompt = input.conservative_extraction_prompt() if input.conservative_extraction_prompt() != "" else None
-
-                common_lamp_kwargs = {
-                    "client": client,
-                    "model": input.model(),
-                    "voteview_df": input.custom_voteview_data(),
-                    "unidirectional": not input.bidirectional_comparisons(),
-                    "prompt": prompt,
-                    "liberal_direction_prompt": liberal_direction_prompt,
-                    "conservative_direction_prompt": conservative_direction_prompt,
-                    "extraction_prompt": extraction_prompt,
-                    "liberal_extraction_prompt": liberal_extraction_prompt,
-                    "conservative_extraction_prompt": conservative_extraction_prompt,
-                    "scale_increasing_intensity": not input.scale_increasing_intensity(),
-                    "randomize_pairwise_order_seed": seed_value,
-                    "sample_per_item": num_sample if num_sample != "" else None,
-                    "concurrency": int(input.concurrency()), 
-                    "temperature": input.temperature(),
-                    "top_p": input.top_p(),
-                    "progress_callback": batch_progress_callback
-                }
-
-                if input.use_own_voteview(): 
-                    lamp_kwargs = {
-                        **common_lamp_kwargs,
-                        "voteview_df": input.custom_voteview_data(),
-                        "politician_type": input.custom_politician_type(),
-                        "canonical_names": input.use_canonical_names(),
-                    }
-
-                else:   
-                    lamp_kwargs = {
-                        **common_lamp_kwargs,
-                        "congress_number": int(input.congress_numbers()),
-                        "chamber": input.chamber(),
-                        "politician_type": "senator" if input.chamber()=="S" else ("representative" if input.chamber()=="H" else "politician"),
-                    }
-
-                lamp = LaMPscores(**lamp_kwargs)
-
-                lamp.create_matchups()
-                total_comparisons = len(lamp.matchups_by_id_og)
-
-                if lamp.unidirectional:
-                    lamp.create_pairwise_comparison_prompt_ideology_unidirectional()
-                    lamp.create_extraction_prompts_unidirectional()
-                else:
-                    lamp.create_pairwise_comparison_prompt_ideology_bidirectional()
-                    lamp.create_extraction_prompts_bidirectional()
-
-                with ui.Progress(min=0, max=total_comparisons) as progress:
-                    progress_info["bar"] = progress
-                    
-                    # Pairwise comparisons
-                    progress_info["phase"] = "Running pairwise comparisons"
-                    progress.set(0, message=f"{progress_info['phase']}: 0/{total_comparisons}")
-                    await lamp.run_pairwise_comparisons()
-                    
-                    # Extraction
-                    progress_info["phase"] = "Extracting answers"
-                    progress.set(0, message=f"{progress_info['phase']}: 0/{total_comparisons}")
-                    await lamp.run_extraction()
-                
-                if lamp.unidirectional:
-                    lamp.make_final_df_undirectional()
-                else:
-                    lamp.make_final_df_bidirectional()
-                
-                results_df = getattr(lamp, "matchup_results_df", None)
-
-                if results_df is not None:
-                    results_df_store.set(results_df)
-                    print("\n\nRun complete. Results are ready for download.")
-                else:
-                    print("\n\nWARNING: Run finished, but no results were generated.")
-        
-            except Exception as e:
-                print(f"An error occurred: {e}")
-                traceback.print_exc()
+                num_sample = int(input.num_sample())
+            except ValueError:
+                ui.modal_show(ui.modal("Number of samples must be an integer.", easy_close=True))
+                return
+
+        voteview_path = None
+        if input.use_own_voteview():
+            if not input.custom_voteview_data():
+                ui.modal_show(ui.modal("Please upload a Voteview CSV.", easy_close=True))
+                return
+            voteview_path = input.custom_voteview_data()[0]["datapath"]
+
+        # Read the API key for the client, which is created on the job's own event loop
+        client_kwargs = dict(api_key=input.api_key())
+        if input.provider() == 'deepinfra':
+            client_kwargs['base_url'] = DEEPINFRA_BASE_URL
+
+        prompt = input.prompt_unidirectional() if input.prompt_unidirectional() != "" else None
+        liberal_direction_prompt = input.liberal_direction_prompt() if input.liberal_direction_prompt() != "" else None
+        conservative_direction_prompt = input.conservative_direction_prompt() if input.conservative_direction_prompt() != "" else None
+
+        extraction_prompt = input.extraction_prompt_unidirectional() if input.extraction_prompt_unidirectional() != "" else None
+        liberal_extraction_prompt = input.liberal_extraction_prompt() if input.liberal_extraction_prompt() != "" else None
+        conservative_extraction_prompt = input.conservative_extraction_prompt() if input.conservative_extraction_prompt() != "" else None
+
+        common_lamp_kwargs = {
+            "model": input.model(),
+            "unidirectional": not input.bidirectional_comparisons(),
+            "prompt": prompt,
+            "liberal_direction_prompt": liberal_direction_prompt,
+            "conservative_direction_prompt": conservative_direction_prompt,
+            "extraction_prompt": extraction_prompt,
+            "liberal_extraction_prompt": liberal_extraction_prompt,
+            "conservative_extraction_prompt": conservative_extraction_prompt,
+            "scale_increasing_intensity": not input.scale_increasing_intensity(),
+            "randomize_pairwise_order_seed": seed_value,
+            "sample_per_item": num_sample,
+            "sampling_strategy": input.sampling_strategy(),
+            "concurrency": int(input.concurrency()),
+            "rate_limiter": input.adaptive_rate_limit(),
+            "temperature": input.temperature(),
+            "top_p": input.top_p(),
+        }
+
+        if input.use_own_voteview():
+            lamp_kwargs = {
+                **common_lamp_kwargs,
+                "politician_type": input.custom_politician_type(),
+                "canonical_names": input.use_canonical_names(),
+            }
+
+        else:
+            lamp_kwargs = {
+                **common_lamp_kwargs,
+                "congress_number": int(input.congress_numbers()),
+                "chamber": input.chamber(),
+                "politician_type": "senator" if input.chamber()=="S" else ("representative" if input.chamber()=="H" else "politician"),
+            }
+
+        async def run_lamp(job):
+            client = AsyncOpenAI(**client_kwargs)
+            voteview_df = None
+            if voteview_path is not None:
+                voteview_df = await asyncio.to_thread(pd.read_csv, voteview_path)
+            lamp = await LaMPscores.create(client=client, voteview_df=voteview_df, progress_callback=job.progress, **lamp_kwargs)
+            await lamp.run()
+
+            results_df = getattr(lamp, "matchup_results_df", None)
+            if results_df is not None:
+                print("\n\nRun complete. Results are ready for download.")
+            else:
+                print("\n\nWARNING: Run finished, but no results were generated.")
+            return results_df
+
+        job = jobs.submit(run_lamp)
+        job_id.set(job.id)
+        ui.update_text("job_id", value=job.id)
 
     @reactive.effect
     @reactive.event(input.run_button)
-    async def _():
-        await do_run()
+    def _():
+        job = current_job()
+        if job is not None and job.active:
+            ui.modal_show(ui.modal("A run is already in progress. Cancel it or wait for it to finish before starting another.", easy_close=True))
+            return
+        submit_run()
+
+    @reactive.effect
+    @reactive.event(input.cancel_button)
+    def _():
+        job = current_job()
+        if job is not None:
+            job.cancel()
+
+    @reactive.effect
+    @reactive.event(input.reconnect_button)
+    def _():
+        job = jobs.get(input.job_id())
+        if job is None:
+            ui.modal_show(ui.modal("No run with this job ID was found. Finished runs are kept until the app restarts or many newer runs have finished.", easy_close=True))
+            return
+        job_id.set(job.id)
+
+    @render.ui
+    def job_status_ui():
+        job_version.get()
+        job = current_job()
+        if job is None:
+            return ui.p("No run started yet.")
+
+        percent = 100 * job.completed / job.total if job.total else 0
+        message = job.message() if job.status == "running" else ""
+        return ui.div(
+            ui.p(ui.strong("Job ID: "), ui.code(job.id), f" ({job.status})"),
+            ui.div(ui.div(class_="progress-bar", role="progressbar", style=f"width: {percent:.1f}%"), class_="progress mb-2"),
+            ui.p(f"{message}: {job.completed}/{job.total}" if message and job.total else message, class_="small text-muted")
+        )
 
     @render.text
     def console_output_verbatim():
-        return console_log.get()
+        job_version.get()
+        job = current_job()
+        return job.console.text() if job is not None else ""
 
     @render.ui
     def download_ui():
-        if results_df_store.get() is not None:
-            return ui.download_button("download_results", "Download Pairwise Comparison Results", class_="btn-secondary mt-3")
-        
-    
+        job_version.get()
+        job = current_job()
+        if job is not None and job.result is not None:
+            return ui.div(
+                ui.download_button("download_results", "Download Pairwise Comparison Results (CSV)", class_="btn-secondary mt-3 me-2"),
+                ui.tooltip(ui.download_button("download_results_parquet", "Download (Parquet)", class_="btn-secondary mt-3"),
+                           "Much smaller and faster to load than CSV for large runs; the R Bradley-Terry app reads it directly.")
+            )
+
+
     @render.download(filename="lamp_pairwise_comparisons.csv")
     def download_results():
-        df = results_df_store.get()
-        if df is None:
+        job = current_job()
+        if job is None or job.result is None:
+            return
+
+        # Encoded a block of rows at a time, rather than as one string of the whole table
+        rows = 50000
+        for start in range(0, len(job.result), rows):
+            yield job.result.iloc[start:start + rows].to_csv(index=False, header=start == 0).encode("utf-8")
+
+    @render.download(filename="lamp_pairwise_comparisons.parquet")
+    def download_results_parquet():
+        job = current_job()
+        if job is None or job.result is None:
             return
 
-        with io.StringIO() as buf:
-            df.to_csv(buf, index=False)
-            yield buf.getvalue().encode("utf-8")
+        with tempfile.TemporaryDirectory() as directory:
+            path = write_results(job.result, os.path.join(directory, "results.parquet"))
+            with open(path, "rb") as f:
+                while chunk := f.read(1 << 20):
+                    yield chunk
 
 app = App(app_ui, server)
\ No newline at end of file
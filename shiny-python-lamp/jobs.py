@@ -0,0 +1,185 @@
+import asyncio
+import collections
+import contextvars
+import sys
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+class ConsoleBuffer:
+    """
+    Console output of a job, keeping only its last max_lines lines
+    """
+    def __init__(self, max_lines=2000, max_line_length=10000):
+        self.lines = collections.deque(maxlen=max_lines)
+        self.partial = ""
+        self.dropped = 0
+        self.max_line_length = max_line_length
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        with self.lock:
+            lines = (self.partial + text).split("\n")
+            self.partial = lines.pop()[-self.max_line_length:]
+            self.dropped += max(0, len(self.lines) + len(lines) - self.lines.maxlen)
+            self.lines.extend(line[-self.max_line_length:] for line in lines)
+
+    def text(self):
+        with self.lock:
+            lines = list(self.lines)
+            if self.partial:
+                lines.append(self.partial)
+            dropped = self.dropped
+        header = f"[{dropped} earlier lines not shown]\n" if dropped else ""
+        return header + "\n".join(lines)
+
+    def last_line(self):
+        with self.lock:
+            if self.partial.strip():
+                return self.partial.strip()
+            for line in reversed(self.lines):
+                if line.strip():
+                    return line.strip()
+        return ""
+
+class _JobStream:
+    # Replaces sys.stdout and sys.stderr, sending what a job prints to its own console and everything else on
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def write(self, text):
+        job = _current_job.get()
+        if job is None:
+            return self.fallback.write(text)
+        job.write(text)
+        return len(text)
+
+    def flush(self):
+        if _current_job.get() is None:
+            self.fallback.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.fallback, name)
+
+class Job:
+    """
+    One run in the background. run is an async function that is given the job (for job.progress as the
+    progress_callback) and returns the results; it runs on its own event loop in a worker thread
+    """
+    def __init__(self, job_id, run, max_console_lines=2000):
+        self.id = job_id
+        self.run = run
+        self.status = "queued"
+        self.completed = 0
+        self.total = 0
+        self.console = ConsoleBuffer(max_console_lines)
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        # Increases with every change, so viewers can skip redrawing a job that has not changed
+        self.version = 0
+        self._future = None
+        self._loop = None
+        self._task = None
+        self._cancel_requested = False
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def message(self):
+        return self.console.last_line()
+
+    async def progress(self, completed, total):
+        self.completed = completed
+        self.total = total
+        self.version += 1
+
+    def write(self, text):
+        self.console.write(text)
+        self.version += 1
+
+    def cancel(self):
+        if not self.active:
+            return
+        self._cancel_requested = True
+        if self._future is not None and self._future.cancel():
+            self._finish("cancelled")
+            return
+        loop, task = self._loop, self._task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # The job's event loop has already closed
+                pass
+
+    def _finish(self, status):
+        self.status = status
+        self.finished_at = time.time()
+        self.version += 1
+
+    def _execute(self):
+        token = _current_job.set(self)
+        try:
+            self.status = "running"
+            self.version += 1
+            asyncio.run(self._main())
+        finally:
+            _current_job.reset(token)
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        try:
+            if self._cancel_requested:
+                raise asyncio.CancelledError()
+            self.result = await self.run(self)
+            self._finish("finished")
+        except asyncio.CancelledError:
+            print("\n\nRun cancelled.")
+            self._finish("cancelled")
+        except Exception as e:
+            self.error = e
+            print(f"An error occurred: {e}")
+            traceback.print_exc()
+            self._finish("failed")
+
+class JobManager:
+    """
+    Runs jobs in a pool of max_running worker threads, each with its own event loop, so runs neither block the
+    app's event loop nor slow down other users' sessions. Jobs are looked up by ID, so a session can reconnect
+    to a run in progress; the max_finished most recent finished jobs are kept
+    """
+    def __init__(self, max_running=4, max_finished=100, max_console_lines=2000):
+        self.max_finished = max_finished
+        self.max_console_lines = max_console_lines
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="lamp-job")
+        for name in ("stdout", "stderr"):
+            if not isinstance(getattr(sys, name), _JobStream):
+                setattr(sys, name, _JobStream(getattr(sys, name)))
+
+    def submit(self, run):
+        job = Job(uuid.uuid4().hex[:12], run, self.max_console_lines)
+        with self.lock:
+            self._prune()
+            self.jobs[job.id] = job
+        job._future = self.executor.submit(job._execute)
+        return job
+
+    def get(self, job_id):
+        if not job_id:
+            return None
+        return self.jobs.get(job_id.strip())
+
+    def _prune(self):
+        finished = sorted((job for job in self.jobs.values() if not job.active), key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - self.max_finished + 1)]:
+            del self.jobs[job.id]
@@ -1,9 +1,57 @@
-from .lampscores import LaMPscores
-from .congress_canonical_names import CongressCanonicalNames
-from .llm_openai_client import LLMOpenAIClient
-
-__all__ = [
-    "LaMPscores",
-    "CongressCanonicalNames",
-    "LLMOpenAIClient",
-]
\ No newline at end of file
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+# Submodules are imported on first attribute access, so "import lampscores" does not pull in pandas,
+# numpy, or tqdm until they are needed
+_EXPORTS = {
+    "LaMPscores": ".lampscores",
+    "LaMPscoresBatch": ".batch_runner",
+    "ShardedLaMPscores": ".sharded_runner",
+    "ShardQueue": ".sharded_runner",
+    "CongressCanonicalNames": ".congress_canonical_names",
+    "ReferenceDataStore": ".reference_data",
+    "LLMOpenAIClient": ".llm_openai_client",
+    "LLMOpenAIBatchClient": ".llm_openai_batch_client",
+    "ResponseCache": ".response_cache",
+    "AdaptiveRateLimiter": ".rate_limiter",
+    "fit_bradley_terry": ".bradley_terry",
+    "collapse_matchups": ".bradley_terry",
+    "FakeAsyncOpenAI": ".fake_openai",
+    "FakeAPIError": ".fake_openai",
+    "Telemetry": ".telemetry",
+    "CallbackSink": ".telemetry",
+    "LoggingSink": ".telemetry",
+    "JSONLinesSink": ".telemetry",
+    "JSONReportSink": ".telemetry",
+    "ResultSink": ".result_sink",
+    "write_results": ".result_sink",
+    "read_results": ".result_sink",
+    "compact_results": ".result_sink",
+}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .lampscores import LaMPscores
+    from .batch_runner import LaMPscoresBatch
+    from .sharded_runner import ShardedLaMPscores, ShardQueue
+    from .congress_canonical_names import CongressCanonicalNames
+    from .reference_data import ReferenceDataStore
+    from .llm_openai_client import LLMOpenAIClient
+    from .llm_openai_batch_client import LLMOpenAIBatchClient
+    from .response_cache import ResponseCache
+    from .rate_limiter import AdaptiveRateLimiter
+    from .bradley_terry import fit_bradley_terry, collapse_matchups
+    from .fake_openai import FakeAsyncOpenAI, FakeAPIError
+    from .telemetry import Telemetry, CallbackSink, LoggingSink, JSONLinesSink, JSONReportSink
+    from .result_sink import ResultSink, write_results, read_results, compact_results
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,100 @@
+import numpy as np
+
+def select_informative_pairs(ability, se, compared_codes, batch_size, target_se, window=3, max_new_per_member=2):
+    """
+    Picks up to batch_size pairs of members that are close in the current ranking, scoring each
+    candidate by its outcome variance p * (1 - p) times the summed variance of the two abilities
+    (a proxy for expected information gain), discounted by how often the pair was already compared.
+    Only pairs with at least one member above target_se are considered.
+    compared_codes holds min(i, j) * n + max(i, j) for every matchup run so far
+    """
+    n = len(ability)
+    order = np.argsort(ability, kind="stable")
+
+    a = np.concatenate([order[:-d] for d in range(1, min(window, n - 1) + 1)])
+    b = np.concatenate([order[d:] for d in range(1, min(window, n - 1) + 1)])
+    codes = np.minimum(a, b).astype(np.int64) * n + np.maximum(a, b)
+
+    times_compared = np.zeros(len(codes))
+    unique_codes, counts = np.unique(compared_codes, return_counts=True)
+    if len(unique_codes) > 0:
+        positions = np.minimum(np.searchsorted(unique_codes, codes), len(unique_codes) - 1)
+        found = unique_codes[positions] == codes
+        times_compared[found] = counts[positions[found]]
+
+    p = 1.0 / (1.0 + np.exp(ability[b] - ability[a]))
+    score = p * (1 - p) * (se[a] ** 2 + se[b] ** 2) / (1 + times_compared)
+    score[np.maximum(se[a], se[b]) <= target_se] = -np.inf
+
+    # Greedy pick by score, spreading new matchups across members
+    new_per_member = np.zeros(n, dtype=np.int64)
+    chosen = []
+    for k in np.argsort(-score, kind="stable"):
+        if len(chosen) >= batch_size or score[k] == -np.inf:
+            break
+        if new_per_member[a[k]] >= max_new_per_member or new_per_member[b[k]] >= max_new_per_member:
+            continue
+        chosen.append(k)
+        new_per_member[a[k]] += 1
+        new_per_member[b[k]] += 1
+
+    chosen = np.array(chosen, dtype=np.int64)
+    return a[chosen], b[chosen]
+
+def select_anchor_partners(new, new_ability, anchors, anchor_ability, compared_codes, n, per_member=2):
+    """
+    For each new member (roster index in new, current estimate in new_ability), picks the per_member anchors
+    nearest to it in ability that it has not been compared with yet. anchors are roster indices of existing
+    members sorted by anchor_ability; compared_codes holds min(i, j) * n + max(i, j) for every matchup run so far
+    """
+    compared = set(np.asarray(compared_codes, dtype=np.int64).tolist())
+    idx0 = []
+    idx1 = []
+    for member, ability in zip(new, new_ability):
+        right = int(np.searchsorted(anchor_ability, ability))
+        left = right - 1
+        picked = 0
+        while picked < per_member and (left >= 0 or right < len(anchors)):
+            # Walks outwards from the member's position, taking the closer side first
+            if right >= len(anchors) or (left >= 0 and ability - anchor_ability[left] <= anchor_ability[right] - ability):
+                partner = anchors[left]
+                left -= 1
+            else:
+                partner = anchors[right]
+                right += 1
+            if min(member, partner) * n + max(member, partner) in compared:
+                continue
+            idx0.append(member)
+            idx1.append(partner)
+            picked += 1
+    return np.array(idx0, dtype=np.int64), np.array(idx1, dtype=np.int64)
+
+def comparison_components(idx0, idx1, n):
+    """
+    Connected components of the graph of matchups idx0[k]-idx1[k] over n members, as one label per member
+    (the smallest member index in its component). A member without matchups is its own component
+    """
+    labels = np.arange(n)
+    idx0 = np.asarray(idx0, dtype=np.int64)
+    idx1 = np.asarray(idx1, dtype=np.int64)
+    while True:
+        # Each member takes the smallest label among its neighbors, then follows labels to their roots
+        low = np.minimum(labels[idx0], labels[idx1])
+        updated = labels.copy()
+        np.minimum.at(updated, idx0, low)
+        np.minimum.at(updated, idx1, low)
+        np.minimum.at(updated, labels, updated)
+        updated = updated[updated]
+        if (updated == labels).all():
+            return labels
+        labels = updated
+
+def bridging_pairs(labels, rng):
+    """
+    Pairs that join the components given by labels into one: the components in random order, each linked to
+    the next through a randomly chosen member of each
+    """
+    perm = rng.permutation(len(labels))
+    _, first = np.unique(labels[perm], return_index=True)
+    picks = rng.permutation(perm[first])
+    return picks[:-1].astype(np.int64), picks[1:].astype(np.int64)
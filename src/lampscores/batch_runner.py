@@ -0,0 +1,150 @@
+import asyncio
+import traceback
+
+import pandas as pd
+
+from .lampscores import LaMPscores
+from .reference_data import ReferenceDataStore
+from .response_cache import ResponseCache
+
+class LaMPscoresBatch:
+    """
+    Runs many LaMPscores jobs (e.g. every Congress in both chambers) through one shared LLM client, so all of
+    their requests draw on a single concurrency limit, rate limiter, and response cache, and reference data is
+    loaded once. At most max_active_jobs jobs run at a time; together they keep the shared client busy.
+
+    Each job is (congress_number, chamber), (congress_number, chamber, {LaMPscores keyword arguments}) such as a
+    prompt set, or a dict of LaMPscores keyword arguments with an optional "name". Remaining keyword arguments
+    apply to every job; journal_path may contain "{name}" to give each job its own journal
+    """
+    def __init__(self,
+                 client,
+                 model,
+                 jobs,
+                 concurrency=125,
+                 max_active_jobs=4,
+                 rate_limiter=None,
+                 cache=None,
+                 backend="async",
+                 batch_poll_interval=30.0,
+                 reference_data=None,
+                 progress_callback=None,
+                 coalesce=True,
+                 telemetry=None,
+                 **lamp_kwargs):
+        self.client = client
+        self.model = model
+        self.max_active_jobs = max_active_jobs
+        self.progress_callback = progress_callback
+        self.reference_data = reference_data if isinstance(reference_data, ReferenceDataStore) else ReferenceDataStore(reference_data)
+
+        if "journal_path" in lamp_kwargs and lamp_kwargs["journal_path"] is not None and "{name}" not in lamp_kwargs["journal_path"]:
+            raise ValueError("A shared 'journal_path' must contain '{name}' so each job gets its own journal.")
+
+        # Per-request progress bars of concurrent jobs would interleave, so the batch reports finished jobs instead
+        async def quiet_progress(completed, total):
+            pass
+
+        self.llm_client = LaMPscores.make_llm_client(client,
+                                                     backend=backend,
+                                                     concurrency=concurrency,
+                                                     progress_callback=quiet_progress,
+                                                     cache=ResponseCache(cache) if isinstance(cache, str) else cache,
+                                                     rate_limiter=rate_limiter,
+                                                     batch_poll_interval=batch_poll_interval,
+                                                     coalesce=coalesce,
+                                                     telemetry=telemetry)
+
+        self.lamps = {}
+        for job in jobs:
+            name, kwargs = self._job_kwargs(job)
+            if name in self.lamps:
+                raise ValueError(f"Duplicate job name '{name}'; give repeated jobs distinct 'name' values.")
+            kwargs = {**lamp_kwargs, **kwargs}
+            if kwargs.get("journal_path") is not None:
+                kwargs["journal_path"] = kwargs["journal_path"].format(name=name)
+            self.lamps[name] = LaMPscores(client,
+                                          model,
+                                          reference_data=self.reference_data,
+                                          llm_client=self.llm_client,
+                                          **kwargs)
+
+        self.results = {}
+        self.errors = {}
+        self.combined_df = None
+
+    @staticmethod
+    def _job_kwargs(job):
+        if isinstance(job, dict):
+            kwargs = dict(job)
+            name = kwargs.pop("name", None)
+        else:
+            congress_number, chamber, *rest = job
+            kwargs = {"congress_number": congress_number, "chamber": chamber, **(rest[0] if rest else {})}
+            name = None
+
+        chamber = kwargs.get("chamber")
+        if name is None:
+            name = f"{chamber}{kwargs.get('congress_number')}"
+        if kwargs.get("politician_type") is None and kwargs.get("voteview_df") is None:
+            kwargs["politician_type"] = "senator" if chamber=="S" else ("representative" if chamber=="H" else "politician")
+        return name, kwargs
+
+    def _load_data(self):
+        # Runs in one worker thread, so the reference data shared by all jobs is fetched (or read) once
+        for name, lamp in self.lamps.items():
+            try:
+                lamp.load_data()
+            except Exception as e:
+                print(f"Could not load data for {name}: {e}")
+                self.errors[name] = e
+
+    async def _run_job(self, name, lamp):
+        try:
+            await lamp.run()
+            return name, None
+        except Exception as e:
+            traceback.print_exc()
+            return name, e
+
+    async def run(self):
+        """
+        Runs every job and returns the combined results; per-job results are in results, failures in errors
+        """
+        await asyncio.to_thread(self._load_data)
+        pending = [(name, lamp) for name, lamp in self.lamps.items() if name not in self.errors]
+        total = len(pending)
+        completed = 0
+
+        async for name, error in self.llm_client.run_bounded((self._run_job(name, lamp) for name, lamp in pending),
+                                                             window=self.max_active_jobs or total):
+            completed += 1
+            if error is None:
+                self.results[name] = self.lamps[name].matchup_results_df
+            else:
+                self.errors[name] = error
+
+            if self.progress_callback:
+                await self.progress_callback(completed, total)
+            print(f"Job {name} {'finished' if error is None else 'failed'} ({completed}/{total})")
+
+        self.combined_df = self.combine()
+        if self.llm_client.telemetry is not None:
+            self.telemetry_summary = self.llm_client.telemetry.report()
+            self.combined_df.attrs["telemetry"] = self.telemetry_summary
+        return self.combined_df
+
+    def combine(self):
+        """
+        One table of every finished job's matchup results, with the job name, Congress, and chamber
+        """
+        frames = []
+        for name, lamp in self.lamps.items():
+            if name not in self.results:
+                continue
+            df = self.results[name].copy()
+            df.insert(0, "job", name)
+            df.insert(1, "congress_number", lamp.congress_number)
+            df.insert(2, "chamber", lamp.chamber)
+            frames.append(df)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
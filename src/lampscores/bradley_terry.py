@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+from .adaptive import comparison_components
+
+DISCONNECTED_MESSAGE = "The comparison graph is not connected, so the politicians cannot be placed on one scale."
+
+def collapse_matchups(matchup_results_df):
+    """
+    Sum win0/win1 over repeated matchups of the same two politicians, as the R app does before fitting.
+    Rows without a valid outcome (win0 + win1 == 0) are dropped
+    """
+    df = matchup_results_df[(matchup_results_df["win0"] + matchup_results_df["win1"]) > 0]
+    swap = (df["bioguide_id0"] > df["bioguide_id1"]).to_numpy()
+
+    collapsed = pd.DataFrame({"bioguide_id0": np.where(swap, df["bioguide_id1"], df["bioguide_id0"]),
+                              "bioguide_id1": np.where(swap, df["bioguide_id0"], df["bioguide_id1"]),
+                              "win0": np.where(swap, df["win1"], df["win0"]).astype(float),
+                              "win1": np.where(swap, df["win0"], df["win1"]).astype(float)})
+    return collapsed.groupby(["bioguide_id0", "bioguide_id1"], as_index=False, sort=False)[["win0", "win1"]].sum()
+
+def _laplacian(idx0, idx1, weight, n, sparse):
+    # Fisher information of the abilities: a weighted graph Laplacian over the comparison graph
+    diagonal = np.bincount(idx0, weight, minlength=n) + np.bincount(idx1, weight, minlength=n)
+    if sparse:
+        from scipy import sparse as sp
+        rows = np.concatenate([idx0, idx1, np.arange(n)])
+        cols = np.concatenate([idx1, idx0, np.arange(n)])
+        return sp.csr_matrix((np.concatenate([-weight, -weight, diagonal]), (rows, cols)), shape=(n, n)), diagonal
+
+    information = np.zeros((n, n))
+    np.add.at(information, (idx0, idx1), -weight)
+    np.add.at(information, (idx1, idx0), -weight)
+    information[np.diag_indices(n)] += diagonal
+    return information, diagonal
+
+def _pseudo_inverse(information):
+    # Covariance of the sum-to-zero abilities. Adding J/n removes the Laplacian's null direction
+    n = len(information)
+    try:
+        return np.linalg.inv(information + 1.0 / n) - 1.0 / n
+    except np.linalg.LinAlgError:
+        raise ValueError(DISCONNECTED_MESSAGE)
+
+def _quasi_variances(covariance, max_iter=100, tol=1e-10):
+    # Quasi-variances q such that var(a_i - a_j) ~= q_i + q_j for every pair, chosen by the
+    # KL-divergence criterion of Firth and de Menezes (2004): a gamma GLM with identity link,
+    # fitted to all pairwise contrast variances by IRLS
+    n = len(covariance)
+    d = np.diag(covariance)
+    contrast_variance = d[:, None] + d[None, :] - 2 * covariance
+    off_diagonal = ~np.eye(n, dtype=bool)
+    q = np.full(n, contrast_variance[off_diagonal].mean() / 2) if n > 1 else np.zeros(n)
+    if n < 3 or not q[0] > 0:
+        return q
+
+    # The gamma weights need q_i + q_j > 0, which an IRLS step on a near-singular covariance can break
+    floor = q[0] * 1e-8
+    for _ in range(max_iter):
+        weight = 1.0 / (q[:, None] + q[None, :]) ** 2
+        weight[~off_diagonal] = 0.0
+        q_new = np.maximum(np.linalg.solve(np.diag(weight.sum(axis=1)) + weight, (weight * contrast_variance).sum(axis=1)),
+                           floor)
+        if np.max(np.abs(q_new - q)) < tol * np.max(np.abs(q)):
+            q = q_new
+            break
+        q = q_new
+    return q
+
+def fit_bradley_terry_arrays(idx0, idx1, win0, win1, n, firth=True, init=None, max_iter=100, tol=1e-8, dense_limit=2000,
+                             max_step=5.0):
+    """
+    Fit Bradley-Terry abilities by Newton's method, with Firth bias reduction (as BTm(br=TRUE)) by default.
+    idx0/idx1 are integer member indices of each (collapsed) matchup. Returns (abilities, quasi-variances),
+    with abilities centered to sum to zero.
+
+    Up to dense_limit members the information matrix is inverted exactly. Larger rosters use SciPy sparse
+    matrices and conjugate gradients; there the hat values for the Firth adjustment and the quasi-variances
+    use the diagonal approximation var(a_i) ~= 1 / information_ii, which is accurate for well-connected
+    comparison graphs. Steps larger than max_step (on the logit scale) are shortened. Raises ValueError if the
+    matchups with an outcome do not connect all n members
+    """
+    idx0 = np.asarray(idx0, dtype=np.int64)
+    idx1 = np.asarray(idx1, dtype=np.int64)
+    win0 = np.asarray(win0, dtype=float)
+    win1 = np.asarray(win1, dtype=float)
+    trials = win0 + win1
+    if n > 1 and (comparison_components(idx0[trials > 0], idx1[trials > 0], n) != 0).any():
+        raise ValueError(DISCONNECTED_MESSAGE)
+    sparse = n > dense_limit
+    if sparse:
+        from scipy.sparse import diags
+        from scipy.sparse.linalg import cg
+
+    theta = np.zeros(n) if init is None else np.array(init, dtype=float)
+    theta -= theta.mean()
+
+    for _ in range(max_iter):
+        p = 1.0 / (1.0 + np.exp(theta[idx1] - theta[idx0]))
+        weight = trials * p * (1 - p)
+        information, diagonal = _laplacian(idx0, idx1, weight, n, sparse)
+
+        residual = win0 - trials * p
+        if sparse:
+            covariance = None
+            if firth:
+                hat = weight * (1.0 / diagonal[idx0] + 1.0 / diagonal[idx1])
+                residual = residual + hat * (0.5 - p)
+        else:
+            covariance = _pseudo_inverse(information)
+            if firth:
+                hat = weight * (covariance[idx0, idx0] + covariance[idx1, idx1] - 2 * covariance[idx0, idx1])
+                residual = residual + hat * (0.5 - p)
+
+        score = np.bincount(idx0, residual, minlength=n) - np.bincount(idx1, residual, minlength=n)
+        if sparse:
+            # Jacobi preconditioning keeps CG fast when some members' matchups are nearly certain
+            step, _ = cg(information, score, rtol=1e-10, maxiter=1000, M=diags(1.0 / np.maximum(diagonal, 1e-12)))
+        else:
+            step = covariance @ score
+        step -= step.mean()
+        # Damped when a start (e.g. a warm start from an earlier fit) is far from the optimum, where full
+        # Newton steps on nearly separated data can overshoot until the weights underflow
+        largest = np.max(np.abs(step))
+        if largest > max_step:
+            step *= max_step / largest
+
+        theta += step
+        if np.max(np.abs(step)) < tol:
+            break
+
+    if sparse:
+        quasi_variance = 1.0 / diagonal
+    else:
+        quasi_variance = _quasi_variances(_pseudo_inverse(information))
+    return theta, quasi_variance
+
+def fit_bradley_terry(matchup_results_df, firth=True, init=None, max_iter=100, tol=1e-8, dense_limit=2000):
+    """
+    Native Python version of the R app's estimation: collapses duplicate matchups, fits a bias-reduced
+    Bradley-Terry model, and rescales abilities to [0, 1]. Returns a DataFrame with bioguide_id,
+    bioname_canonical, party_abbrev, lampscore, and qse (as in the R app's download), plus the unscaled
+    ability and quasi_se. init optionally maps bioguide IDs to starting abilities
+    """
+    collapsed = collapse_matchups(matchup_results_df)
+    ids = pd.Index(pd.unique(pd.concat([collapsed["bioguide_id0"], collapsed["bioguide_id1"]], ignore_index=True)))
+    idx0 = ids.get_indexer(collapsed["bioguide_id0"])
+    idx1 = ids.get_indexer(collapsed["bioguide_id1"])
+    if init is not None:
+        init = pd.Series(init).reindex(ids).fillna(0.0).to_numpy()
+
+    ability, quasi_variance = fit_bradley_terry_arrays(idx0, idx1, collapsed["win0"].to_numpy(), collapsed["win1"].to_numpy(),
+                                                       len(ids), firth=firth, init=init, max_iter=max_iter, tol=tol,
+                                                       dense_limit=dense_limit)
+
+    scale = ability.max() - ability.min() if len(ability) > 1 else 1.0
+    quasi_se = np.sqrt(np.maximum(quasi_variance, 0.0))
+
+    members = pd.DataFrame({"bioguide_id": pd.concat([matchup_results_df["bioguide_id0"], matchup_results_df["bioguide_id1"]], ignore_index=True),
+                            "bioname_canonical": pd.concat([matchup_results_df["name0"], matchup_results_df["name1"]], ignore_index=True),
+                            "party_abbrev": pd.concat([matchup_results_df["party0"], matchup_results_df["party1"]], ignore_index=True)})
+    members = members.drop_duplicates("bioguide_id")
+
+    scores = pd.DataFrame({"bioguide_id": ids,
+                           "lampscore": (ability - ability.min()) / scale,
+                           "qse": quasi_se / scale,
+                           "ability": ability,
+                           "quasi_se": quasi_se})
+    scores = scores.merge(members, how="left", on="bioguide_id").sort_values("bioguide_id", ignore_index=True)
+    return scores[["bioguide_id", "bioname_canonical", "party_abbrev", "lampscore", "qse", "ability", "quasi_se"]]
@@ -1,9 +1,11 @@
 import re
 import pandas as pd
 
+from .reference_data import ReferenceDataStore
+
 class CongressCanonicalNames:
-    _CURRENT_URL = "https://unitedstates.github.io/congress-legislators/legislators-current.csv"
-    _HISTORICAL_URL = "https://unitedstates.github.io/congress-legislators/legislators-historical.csv"
+    _CURRENT_URL = ReferenceDataStore.LEGISLATORS_CURRENT_URL
+    _HISTORICAL_URL = ReferenceDataStore.LEGISLATORS_HISTORICAL_URL
 
 
     @staticmethod
@@ -20,9 +22,14 @@ class CongressCanonicalNames:
         return df
 
     @classmethod
-    def get_canonical_names(cls):
+    def get_canonical_names(cls, store=None):
         """
-        Return a (bioguide_id, bioname_canonical) DataFrame
+        Return a (bioguide_id, bioname_canonical) DataFrame, read from a local ReferenceDataStore
+        (downloaded and stored on first use) unless store=False
         """
-        df = cls._load_dataframe()
-        return df[["bioguide_id", "bioname_canonical"]].copy()
\ No newline at end of file
+        if store is False:
+            df = cls._load_dataframe()
+            return df[["bioguide_id", "bioname_canonical"]].copy()
+        if store is None:
+            store = ReferenceDataStore()
+        return store.canonical_names()
@@ -0,0 +1,287 @@
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+import types
+import zlib
+
+QUESTION = re.compile(r"^(?:(\d+)\. )?.*?: (.+?) or (.+?)\?", re.MULTILINE)
+
+class FakeAPIError(Exception):
+    """
+    Error raised by FakeAsyncOpenAI, with the status_code and response.headers attributes of an openai.APIStatusError
+    """
+    def __init__(self, status_code, message, headers=None):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(status_code=status_code, headers=dict(headers or {}))
+
+class FakeAsyncOpenAI:
+    """
+    In-process stand-in for openai.AsyncOpenAI that answers LaMPscores requests without network access or cost.
+    Supports chat.completions.create (also via with_raw_response), files, and batches.
+
+    Each politician has a hidden score (scores, or a stable pseudo-random one per name); lower is more liberal,
+    and pairs closer than tie_margin are ties. Comparisons, extractions, structured, and packed requests are
+    answered from the scores, unless answer(messages, response_format) returns a string instead.
+
+    latency is a number of seconds or one of ("constant", s), ("uniform", low, high), ("lognormal", median, sigma),
+    and ("exponential", mean), plus input_token_latency and output_token_latency per token. rate_limit_rate and
+    server_error_rate inject 429 and 500 errors, and requests beyond max_in_flight concurrent ones get a 429.
+    malformed_rate is the share of extractions that name neither politician, and of packed verdicts that are left out.
+    Randomness depends only on the seed, the request, and how many times it has been sent, so results do not
+    depend on scheduling
+    """
+    def __init__(self,
+                 scores=None,
+                 tie_margin=0.0,
+                 latency=0.0,
+                 input_token_latency=0.0,
+                 output_token_latency=0.0,
+                 rate_limit_rate=0.0,
+                 server_error_rate=0.0,
+                 retry_after=1.0,
+                 max_in_flight=None,
+                 malformed_rate=0.0,
+                 answer=None,
+                 batch_latency=0.0,
+                 seed=0):
+        self.scores = dict(scores or {})
+        self.tie_margin = tie_margin
+        self.latency = latency
+        self.input_token_latency = input_token_latency
+        self.output_token_latency = output_token_latency
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.retry_after = retry_after
+        self.max_in_flight = max_in_flight
+        self.malformed_rate = malformed_rate
+        self.answer = answer
+        self.batch_latency = batch_latency
+        self.seed = seed
+
+        self.chat = types.SimpleNamespace(completions=_Completions(self))
+        self.files = _Files(self)
+        self.batches = _Batches(self)
+        self._sent = {}
+        self._ids = itertools.count(1)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.rate_limited = 0
+        self.server_errors = 0
+        self.malformed = 0
+        self.in_flight = 0
+        self.max_in_flight_seen = 0
+        self.simulated_seconds = 0.0
+
+    def stats(self):
+        return {"calls": self.calls,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "rate_limited": self.rate_limited,
+                "server_errors": self.server_errors,
+                "malformed": self.malformed,
+                "max_in_flight": self.max_in_flight_seen,
+                "simulated_seconds": self.simulated_seconds}
+
+    def score(self, name):
+        if name not in self.scores:
+            self.scores[name] = random.Random(zlib.crc32(f"{self.seed}:{name}".encode())).gauss(0.0, 1.0)
+        return self.scores[name]
+
+    def _rng(self, body):
+        # The k-th send of the same request always draws the same numbers
+        key = zlib.crc32(json.dumps(body, sort_keys=True, ensure_ascii=False).encode())
+        attempt = self._sent.get(key, 0)
+        self._sent[key] = attempt + 1
+        return random.Random(f"{self.seed}:{key}:{attempt}")
+
+    def _draw_latency(self, rng):
+        if isinstance(self.latency, (int, float)):
+            return float(self.latency)
+        kind, *params = self.latency
+        if kind == "constant":
+            return float(params[0])
+        if kind == "uniform":
+            return rng.uniform(params[0], params[1])
+        if kind == "lognormal":
+            return params[0] * rng.lognormvariate(0.0, params[1])
+        if kind == "exponential":
+            return rng.expovariate(1.0 / params[0])
+        raise ValueError(f"Unknown latency distribution '{kind}'.")
+
+    def _winner(self, question, name0, name1):
+        score0, score1 = self.score(name0), self.score(name1)
+        if abs(score0 - score1) < self.tie_margin:
+            return "Tie"
+        more_liberal, more_conservative = (name0, name1) if score0 < score1 else (name1, name0)
+        conservative = question.find("more conservative")
+        liberal = question.find("more liberal")
+        if conservative >= 0 and (liberal < 0 or conservative < liberal):
+            return more_conservative
+        return more_liberal
+
+    def _content(self, messages, response_format, rng):
+        if self.answer is not None:
+            content = self.answer(messages, response_format)
+            if content is not None:
+                return content
+
+        prompt = messages[-1]["content"]
+        if response_format is not None and response_format["json_schema"]["name"] == "pairwise_comparisons":
+            verdicts = []
+            for match in QUESTION.finditer(prompt):
+                if match.group(1) is None:
+                    continue
+                if rng.random() < self.malformed_rate:
+                    self.malformed += 1
+                    continue
+                verdicts.append({"question": int(match.group(1)),
+                                 "rationale": "Based on their voting records.",
+                                 "winner": self._winner(match.group(0), *match.group(2, 3))})
+            return json.dumps({"verdicts": verdicts})
+
+        match = QUESTION.search(prompt)
+        if match is None:
+            return "I am not sure what you are asking."
+        winner = self._winner(match.group(0), *match.group(2, 3))
+        if response_format is not None:
+            return json.dumps({"rationale": "Based on their voting records.", "winner": winner})
+        if len(messages) == 1:
+            return f"{winner}." if winner != "Tie" else "They are about equally placed."
+        if rng.random() < self.malformed_rate:
+            self.malformed += 1
+            return "It is not possible to tell from the answer."
+        return winner
+
+    async def _complete(self, body, sleep=True):
+        rng = self._rng(body)
+        messages = body["messages"]
+        response_format = body.get("response_format")
+
+        self.in_flight += 1
+        self.max_in_flight_seen = max(self.max_in_flight_seen, self.in_flight)
+        try:
+            self.calls += 1
+            if self.max_in_flight is not None and self.in_flight > self.max_in_flight:
+                self.rate_limited += 1
+                raise FakeAPIError(429, "Too many concurrent requests", {"retry-after": str(self.retry_after)})
+            roll = rng.random()
+            if roll < self.rate_limit_rate:
+                self.rate_limited += 1
+                raise FakeAPIError(429, "Rate limit reached", {"retry-after": str(self.retry_after)})
+            if roll < self.rate_limit_rate + self.server_error_rate:
+                self.server_errors += 1
+                raise FakeAPIError(500, "Internal server error")
+
+            content = self._content(messages, response_format, rng)
+            input_tokens = sum(len(m["content"]) for m in messages) // 4
+            if response_format is not None:
+                input_tokens += len(json.dumps(response_format)) // 4
+            output_tokens = max(1, len(content) // 4)
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+
+            delay = (self._draw_latency(rng) + input_tokens * self.input_token_latency
+                     + output_tokens * self.output_token_latency)
+            self.simulated_seconds += delay
+            if sleep:
+                await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+
+        return _completion(body.get("model"), content, input_tokens, output_tokens)
+
+def _completion(model, content, input_tokens, output_tokens):
+    message = types.SimpleNamespace(role="assistant", content=content)
+    usage = types.SimpleNamespace(prompt_tokens=input_tokens,
+                                  completion_tokens=output_tokens,
+                                  total_tokens=input_tokens + output_tokens)
+    return types.SimpleNamespace(model=model,
+                                 choices=[types.SimpleNamespace(index=0, message=message, finish_reason="stop")],
+                                 usage=usage)
+
+class _Completions:
+    def __init__(self, fake):
+        self._fake = fake
+        self.with_raw_response = _RawCompletions(fake)
+
+    async def create(self, **kwargs):
+        return await self._fake._complete(kwargs)
+
+class _RawCompletions:
+    def __init__(self, fake):
+        self._fake = fake
+
+    async def create(self, **kwargs):
+        completion = await self._fake._complete(kwargs)
+        return types.SimpleNamespace(parse=lambda: completion, headers={})
+
+class _Files:
+    def __init__(self, fake):
+        self._fake = fake
+        self._contents = {}
+
+    async def create(self, file, purpose):
+        data = file.read()
+        file_id = f"file-{next(self._fake._ids)}"
+        self._contents[file_id] = data.decode("utf-8") if isinstance(data, bytes) else data
+        return types.SimpleNamespace(id=file_id, purpose=purpose, bytes=len(data))
+
+    async def content(self, file_id):
+        return types.SimpleNamespace(text=self._contents[file_id])
+
+class _Batches:
+    def __init__(self, fake):
+        self._fake = fake
+        self._batches = {}
+
+    async def create(self, input_file_id, endpoint, completion_window):
+        batch_id = f"batch-{next(self._fake._ids)}"
+        batch = types.SimpleNamespace(id=batch_id, status="in_progress", input_file_id=input_file_id,
+                                      output_file_id=None, error_file_id=None, endpoint=endpoint,
+                                      completion_window=completion_window, created_at=time.time())
+        self._batches[batch_id] = batch
+        if self._fake.batch_latency <= 0:
+            await self._process(batch)
+        return batch
+
+    async def retrieve(self, batch_id):
+        batch = self._batches[batch_id]
+        if batch.status == "in_progress" and time.time() - batch.created_at >= self._fake.batch_latency:
+            await self._process(batch)
+        return batch
+
+    async def _process(self, batch):
+        # Batch requests are answered without per-request latency; failures go to the error file
+        outputs, errors = [], []
+        for line in self._fake.files._contents[batch.input_file_id].splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            try:
+                completion = await self._fake._complete(request["body"], sleep=False)
+                outputs.append({"custom_id": request["custom_id"],
+                                "response": {"status_code": 200,
+                                             "body": {"choices": [{"index": 0,
+                                                                   "message": {"role": "assistant",
+                                                                               "content": completion.choices[0].message.content}}],
+                                                      "usage": vars(completion.usage)}},
+                                "error": None})
+            except FakeAPIError as e:
+                errors.append({"custom_id": request["custom_id"],
+                               "response": {"status_code": e.status_code, "body": {"error": {"message": str(e)}}},
+                               "error": None})
+
+        for rows, attribute in ((outputs, "output_file_id"), (errors, "error_file_id")):
+            if rows:
+                file_id = f"file-{next(self._fake._ids)}"
+                self._fake.files._contents[file_id] = "\n".join(json.dumps(row) for row in rows) + "\n"
+                setattr(batch, attribute, file_id)
+        batch.status = "completed"
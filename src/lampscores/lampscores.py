@@ -1,8 +1,20 @@
 from .congress_canonical_names import CongressCanonicalNames
+from .reference_data import ReferenceDataStore
 from .llm_openai_client import LLMOpenAIClient
+from .llm_openai_batch_client import LLMOpenAIBatchClient
+from .telemetry import Telemetry
+from .run_journal import RunJournal
+from .result_sink import ResultSink
+from .matchup_sampler import sample_matchups, sample_balanced, sample_anchor_partners, PairColumn, SAMPLING_STRATEGIES
+from .adaptive import select_informative_pairs, select_anchor_partners, comparison_components, bridging_pairs
+from .bradley_terry import fit_bradley_terry
+from .prompt_renderer import PromptRenderer, PromptColumn
 import pandas as pd
-import itertools
-import random
+import numpy as np
+import asyncio
+import json
+import re
+import difflib
 
 class LaMPscores:
     def __init__(self,
@@ -23,10 +35,39 @@ class LaMPscores:
                  scale_increasing_intensity=False,
                  randomize_pairwise_order_seed=42,
                  sample_per_item=None,
+                 sampling_strategy="per_item",
+                 within_party_share=0.5,
                  concurrency=125,
                  temperature=0.0,
                  top_p=1.0,
-                 progress_callback=None):
+                 progress_callback=None,
+                 cache=None,
+                 journal_path=None,
+                 resume=False,
+                 pipeline=False,
+                 extraction_retries=5,
+                 fuzzy_matching=True,
+                 sentence_matching=False,
+                 rate_limiter=None,
+                 backend="async",
+                 batch_poll_interval=30.0,
+                 adaptive=False,
+                 adaptive_initial_per_item=4,
+                 adaptive_batch_size=None,
+                 adaptive_target_se=0.1,
+                 adaptive_max_rounds=20,
+                 lazy_prompts=True,
+                 reference_data=None,
+                 llm_client=None,
+                 structured_output=False,
+                 structured_rationale=True,
+                 pack_size=None,
+                 pack_prompt=None,
+                 coalesce=True,
+                 telemetry=None,
+                 results_path=None,
+                 results_text_path=None,
+                 results_row_group_size=65536):
 
         self.client = client
         self.congress_number = congress_number
@@ -44,11 +85,55 @@ class LaMPscores:
         self.scale_increasing_intensity = scale_increasing_intensity
         self.randomize_pairwise_order_seed = randomize_pairwise_order_seed
         self.sample_per_item = sample_per_item
+        self.sampling_strategy = sampling_strategy
+        self.within_party_share = within_party_share
         self.concurrency = concurrency
         self.model = model
         self.temperature = temperature
         self.top_p = top_p
         self.progress_callback = progress_callback
+        self.cache = cache
+        self.journal_path = journal_path
+        self.resume = resume
+        self.journal = None
+        self.pipeline = pipeline
+        self.extraction_retries = extraction_retries
+        self.fuzzy_matching = fuzzy_matching
+        self.sentence_matching = sentence_matching
+        self.rate_limiter = rate_limiter
+        self.backend = backend
+        self.batch_poll_interval = batch_poll_interval
+        self.adaptive = adaptive
+        self.adaptive_initial_per_item = adaptive_initial_per_item
+        self.adaptive_batch_size = adaptive_batch_size
+        self.adaptive_target_se = adaptive_target_se
+        self.adaptive_max_rounds = adaptive_max_rounds
+        self.lazy_prompts = lazy_prompts
+        self.reference_data = reference_data
+        self.llm_client = llm_client
+        self.structured_output = structured_output
+        self.structured_rationale = structured_rationale
+        self.pack_size = pack_size
+        self.pack_prompt = pack_prompt
+        self.coalesce = coalesce
+        self.telemetry = telemetry
+        self.results_path = results_path
+        self.results_text_path = results_text_path
+        self.results_row_group_size = results_row_group_size
+        self.result_sink = None
+
+        if self.resume and self.journal_path is None:
+            raise ValueError("'resume=True' requires a 'journal_path'.")
+        if self.sampling_strategy not in SAMPLING_STRATEGIES:
+            raise ValueError(f"'sampling_strategy' must be one of {SAMPLING_STRATEGIES}.")
+        if self.backend not in ("async", "batch"):
+            raise ValueError("'backend' must be either 'async' or 'batch'.")
+        if self.backend == "batch" and self.pipeline:
+            raise ValueError("'pipeline=True' cannot be used with the 'batch' backend.")
+        if self.pack_size is not None and self.pack_size < 1:
+            raise ValueError("'pack_size' must be at least 1.")
+        if self.results_text_path is not None and self.results_path is None:
+            raise ValueError("'results_text_path' requires a 'results_path'.")
 
         # Check configuration of prompts to ensure corresponding prompts are supplied
         if self.prompt is not None and self.extraction_prompt is None:
@@ -58,20 +143,11 @@ class LaMPscores:
         if self.conservative_direction_prompt is not None and self.conservative_extraction_prompt is None:
             raise ValueError("If 'conservative_direction_prompt' is supplied, 'conservative_extraction_prompt' must also be supplied.")
 
-        # Load data - treat differently if multiple datasets are needed, and only run this if voteview_df is not provided
-        # Otherwise, it is assumed that the dataset inputted is in the format of voteview_df
-        if voteview_df is None:
-            self.voteview_df = pd.read_csv(f'https://voteview.com/static/data/out/members/{self.chamber}{self.congress_number}_members.csv')
-            self.voteview_df = self.voteview_df[self.voteview_df['chamber'] != "President"]
-
-        # Merge in the "canonical" names if needed, or if the dataset is directly from the internet
-        if canonical_names or voteview_df is None:
-            self.canonical_names = CongressCanonicalNames.get_canonical_names()
-            self.voteview_df = self.voteview_df.merge(self.canonical_names, how="left", on="bioguide_id")
+        # The member list and canonical names are loaded on first use (see load_data) rather than here,
+        # so constructing the object never blocks on network I/O
+        self._data_loaded = False
 
         # Set default prompts
-        if self.politician_type is None and self.voteview_df is None:
-            self.politican_type = "senator" if self.chamber=="S" else ("representative" if self.chamber=="H" else "politician")
         if self.prompt is None:
             self.prompt = "During the {congress_number0} U.S. Congress, which {politician_type} was more liberal: {name0} or {name1}?"
         if self.liberal_direction_prompt is None:
@@ -87,361 +163,747 @@ class LaMPscores:
         if self.conservative_extraction_prompt is None:
             self.conservative_extraction_prompt = "According to your answer, who is described to be the more conservative or less liberal {politician_type}: {name0} or {name1}? Return only the name of the {politician_type}, and nothing else. If one {politician_type} is described as more liberal, return the other {politician_type}\'s name. If one {politician_type} is described as more moderate, return the other {politician_type}\'s name. If neither {politician_type} is described to be more conservative, less liberal, more liberal, or more moderate, reply with \"Tie\"."
 
-        # Create the LLM client
-        self.llm_client = LLMOpenAIClient(self.client, 
-                                          concurrency=self.concurrency, 
-                                          progress_callback=self.progress_callback)
-
-    def create_matchups(self):
-        name_list = self.voteview_df['bioname_canonical'].tolist()
-        bioguide_list = self.voteview_df['bioguide_id'].tolist()
-        chamber_list = self.voteview_df['chamber'].tolist()
-        congress_list = self.voteview_df['congress'].tolist()
-        party_code_list = self.voteview_df['party_code'].tolist()
-        party_list = ['R' if j==200 else 'D' if j==100 else 'I' for j in list(self.voteview_df['party_code'])]
-        state_list = self.voteview_df['state_abbrev'].tolist()
-
-        # Create the dictionary of id to names, chambers, and congress number
-        self.id_names_dict = {}
-
-        for i in range(len(name_list)):
-            self.id_names_dict[bioguide_list[i]] = {"name": name_list[i],
-                                                    "chamber": chamber_list[i],
-                                                    "congress": congress_list[i],
-                                                    "party_code": party_code_list[i],
-                                                    "party": party_list[i],
-                                                    "state_abbrev": state_list[i]}
-
-        # Get the list of IDs
-        id_list = list(self.id_names_dict.keys())
-
-        # Set the seed
-        random.seed(self.randomize_pairwise_order_seed)
-
-        # Situation where we want all matchups
-        if self.sample_per_item is None:
-            self.matchups_by_id_og = list(itertools.combinations(id_list, 2))
-
-        # Situation where we just want a subset of matchups
-        else:
-            self.matchups_by_id_og = []
-            seen_matchups = []
-
-            for id1 in id_list:
-                other_ids = [id for id in id_list if id != id1]
-                sampled_count = 0
+        # Set the default instructions for packed requests
+        if self.pack_prompt is None:
+            self.pack_prompt = "Answer each of the following {count} questions independently. For each question, give its number and the name of the {politician_type} that answers it, or \"Tie\" if neither does."
+
+        # Create the LLM client, unless one is shared with other runs (e.g. by LaMPscoresBatch)
+        if self.llm_client is None:
+            self.llm_client = self.make_llm_client(self.client,
+                                                   backend=self.backend,
+                                                   concurrency=self.concurrency,
+                                                   progress_callback=self.progress_callback,
+                                                   cache=self.cache,
+                                                   rate_limiter=self.rate_limiter,
+                                                   batch_poll_interval=self.batch_poll_interval,
+                                                   coalesce=self.coalesce,
+                                                   telemetry=self.telemetry)
+        self.telemetry = self.llm_client.telemetry
+
+    @staticmethod
+    def make_llm_client(client, backend="async", concurrency=125, progress_callback=None, cache=None, rate_limiter=None,
+                        batch_poll_interval=30.0, coalesce=True, telemetry=None):
+        if backend == "batch":
+            return LLMOpenAIBatchClient(client,
+                                        concurrency=concurrency,
+                                        progress_callback=progress_callback,
+                                        cache=cache,
+                                        poll_interval=batch_poll_interval,
+                                        coalesce=coalesce,
+                                        telemetry=telemetry)
+        return LLMOpenAIClient(client, 
+                               concurrency=concurrency, 
+                               progress_callback=progress_callback,
+                               cache=cache,
+                               rate_limiter=rate_limiter,
+                               coalesce=coalesce,
+                               telemetry=telemetry)
+
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        """
+        Async alternative to LaMPscores(...) that also loads the reference data, in a worker thread so the
+        event loop is not blocked
+        """
+        lamp = cls(*args, **kwargs)
+        await asyncio.to_thread(lamp.load_data)
+        return lamp
+
+    @property
+    def voteview_df(self):
+        if not self._data_loaded:
+            self.load_data()
+        return self._voteview_df
+
+    @voteview_df.setter
+    def voteview_df(self, value):
+        self._voteview_df = value
+
+    def load_data(self):
+        """
+        Loads the Voteview member list (unless voteview_df was supplied) and merges in the canonical names
+        """
+        if self._data_loaded:
+            return
+        supplied = self._voteview_df is not None
 
-                while sampled_count < self.sample_per_item:
-                    id2 = random.choice(other_ids)
-                    # Create a consistent representation of the pair (sorted tuple) to check for uniqueness
-                    sorted_pair = sorted([id1, id2])
+        # Load data - treat differently if multiple datasets are needed, and only run this if voteview_df is not provided
+        # Otherwise, it is assumed that the dataset inputted is in the format of voteview_df
+        # Downloads are kept in a local ReferenceDataStore, so repeated runs do not fetch them again
+        if not supplied or self.canonical_names:
+            if not isinstance(self.reference_data, ReferenceDataStore):
+                self.reference_data = ReferenceDataStore(self.reference_data)
+        if not supplied:
+            self._voteview_df = self.reference_data.voteview_members(self.chamber, self.congress_number)
+            self._voteview_df = self._voteview_df[self._voteview_df['chamber'] != "President"]
 
-                    if sorted_pair not in seen_matchups:
-                        self.matchups_by_id_og.append((id1, id2))
-                        seen_matchups.append(sorted_pair)
-                        sampled_count += 1
+        # Merge in the "canonical" names if needed, or if the dataset is directly from the internet
+        if self.canonical_names or not supplied:
+            self.canonical_names = CongressCanonicalNames.get_canonical_names(self.reference_data)
+            self._voteview_df = self._voteview_df.merge(self.canonical_names, how="left", on="bioguide_id")
 
-        # These are the matchups to actually use in prompts
-        self.matchup = [tuple(random.sample(pair, 2)) for pair in self.matchups_by_id_og]
+        if self.politician_type is None and self._voteview_df is None:
+            self.politican_type = "senator" if self.chamber=="S" else ("representative" if self.chamber=="H" else "politician")
+        self._data_loaded = True
 
-        # These are the matchups sorted so we have a consistent way to identify matchups, esp if there are repeat matchups
-        self.matchup_id = [tuple(sorted(pair)) for pair in self.matchup]
+    def create_matchups(self):
+        parties = self._index_members()
+
+        # All matchups if sample_per_item is None, otherwise a sampled subset; reproducible from the seed
+        idx0, idx1, flip = sample_matchups(len(self.id_list),
+                                           self.sample_per_item,
+                                           strategy=self.sampling_strategy,
+                                           seed=self.randomize_pairwise_order_seed,
+                                           groups=parties,
+                                           within_share=self.within_party_share)
+
+        self._reset_matchups()
+        self._add_matchups(idx0, idx1, flip)
+
+    def _index_members(self):
+        # Builds the member table, id_list, and the prompt renderer from voteview_df, and returns each member's party.
+        # Matchups refer to members by their row in this table. As in a dict keyed by bioguide ID, a member listed
+        # twice keeps the position of their first row and the values of their last one
+        codes, ids = pd.factorize(self.voteview_df['bioguide_id'], use_na_sentinel=False)
+        last_row = np.zeros(len(ids), dtype=np.int64)
+        last_row[codes] = np.arange(len(codes))
+        rows = self.voteview_df.iloc[last_row]
+
+        party_code_list = rows['party_code'].tolist()
+        self.members = pd.DataFrame({"bioguide_id": rows['bioguide_id'].tolist(),
+                                     "name": rows['bioname_canonical'].tolist(),
+                                     "chamber": rows['chamber'].tolist(),
+                                     "congress": rows['congress'].tolist(),
+                                     "party_code": party_code_list,
+                                     "party": ['R' if j==200 else 'D' if j==100 else 'I' for j in party_code_list],
+                                     "state_abbrev": rows['state_abbrev'].tolist()})
+        self.id_list = np.array(rows['bioguide_id'].tolist(), dtype=object)
+        self._member_names = np.array(self.members["name"].tolist(), dtype=object)
+        parties = np.array(self.members["party"].tolist())
+
+        self._create_prompt_renderer()
+        return parties
+
+    @property
+    def id_names_dict(self):
+        # Member fields by bioguide ID, built when read
+        fields = self.members.drop(columns="bioguide_id").to_dict("records")
+        return dict(zip(self.id_list.tolist(), fields))
+
+    def _reset_matchups(self):
+        self.matchup_idx0 = np.zeros(0, dtype=np.int32)
+        self.matchup_idx1 = np.zeros(0, dtype=np.int32)
+        self.matchup_flip = np.zeros(0, dtype=bool)
+        self.matchup_direction = np.zeros(0, dtype=np.int8)
+
+    def _add_matchups(self, idx0, idx1, flip):
+        # Appends matchups given as member indices into self.id_list. matchup_idx0/matchup_idx1 are in the order
+        # used in prompts; matchup_flip records whether that swaps the sampled order
+        flip = np.asarray(flip, dtype=bool)
+        self.matchup_idx0 = np.concatenate([self.matchup_idx0, np.where(flip, idx1, idx0)]).astype(np.int32)
+        self.matchup_idx1 = np.concatenate([self.matchup_idx1, np.where(flip, idx0, idx1)]).astype(np.int32)
+        self.matchup_flip = np.concatenate([self.matchup_flip, flip])
+
+    @property
+    def matchup(self):
+        # (bioguide_id, bioguide_id) of each matchup in prompt order, built when read
+        return PairColumn(self.id_list, self.matchup_idx0, self.matchup_idx1)
+
+    @property
+    def matchup_id(self):
+        # Matchups in sorted-ID order, a consistent way to identify repeat matchups
+        return PairColumn(self.id_list, self.matchup_idx0, self.matchup_idx1, sort=True)
+
+    @property
+    def matchups_by_id_og(self):
+        # Matchups in the order they were sampled
+        return PairColumn(self.id_list, np.where(self.matchup_flip, self.matchup_idx1, self.matchup_idx0),
+                          np.where(self.matchup_flip, self.matchup_idx0, self.matchup_idx1))
+
+    @property
+    def comparison_direction(self):
+        return np.where(self.matchup_direction == 1, 'conservative', 'liberal').tolist()
+
+    def _matchup_ids(self, i):
+        return (self.id_list[self.matchup_idx0[i]], self.id_list[self.matchup_idx1[i]])
+
+    def _create_prompt_renderer(self):
+        # Per-member prompt fields, formatted once for all matchups
+        members = self.members
+        self.prompt_renderer = PromptRenderer({"name": members["name"].tolist(),
+                                               "congress_number": [str(c) + self._get_ordinal_suffix(c) for c in members["congress"].tolist()],
+                                               "chamber": members["chamber"].tolist(),
+                                               "state": members["state_abbrev"].tolist()},
+                                              constants={"politician_type": self.politician_type})
+        self._member_is_republican = (members["party"] == 'R').to_numpy()
+
+    def _render_prompts(self, templates, choice):
+        if self.lazy_prompts:
+            return PromptColumn(self.prompt_renderer, templates, choice, self.matchup_idx0, self.matchup_idx1)
+        return self.prompt_renderer.render_choice(templates, choice, self.matchup_idx0, self.matchup_idx1)
+
+    def _comparison_choice(self):
+        # 1 (conservative prompt) when both politicians are Republicans, otherwise 0 (liberal prompt)
+        return (self._member_is_republican[self.matchup_idx0] & self._member_is_republican[self.matchup_idx1]).astype(np.int8)
 
     def create_pairwise_comparison_prompt_ideology_bidirectional(self):
-        prompts = []
-        comparison_direction = []
-
-        for j in self.matchup:
-            if (self.id_names_dict[j[0]]["party"]=='R') and (self.id_names_dict[j[1]]["party"]=='R'):
-                sent = self.conservative_direction_prompt.format(name0=self.id_names_dict[j[0]]["name"],
-                                                                 name1=self.id_names_dict[j[1]]["name"],
-                                                                 congress_number0=str(self.id_names_dict[j[0]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[0]]["congress"]),
-                                                                 congress_number1=str(self.id_names_dict[j[1]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[1]]["congress"]),
-                                                                 chamber0=self.id_names_dict[j[0]]["chamber"],
-                                                                 chamber1=self.id_names_dict[j[1]]["chamber"],
-                                                                 state0=self.id_names_dict[j[0]]["state_abbrev"],
-                                                                 state1=self.id_names_dict[j[1]]["state_abbrev"],
-                                                                 politician_type=self.politician_type)
-                comparison_direction.append('conservative')
-            else:
-                sent = self.liberal_direction_prompt.format(name0=self.id_names_dict[j[0]]["name"],
-                                                            name1=self.id_names_dict[j[1]]["name"],
-                                                            congress_number0=str(self.id_names_dict[j[0]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[0]]["congress"]),
-                                                            congress_number1=str(self.id_names_dict[j[1]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[1]]["congress"]),
-                                                            chamber0=self.id_names_dict[j[0]]["chamber"],
-                                                            chamber1=self.id_names_dict[j[1]]["chamber"],
-                                                            state0=self.id_names_dict[j[0]]["state_abbrev"],
-                                                            state1=self.id_names_dict[j[1]]["state_abbrev"],
-                                                            politician_type=self.politician_type)
-                comparison_direction.append('liberal')
-
-            prompts.append(sent)
-
-        self.prompts = prompts
-        self.comparison_direction = comparison_direction
+        self.matchup_direction = self._comparison_choice()
+        self.prompts = self._render_prompts((self.liberal_direction_prompt, self.conservative_direction_prompt), self.matchup_direction)
 
     def create_pairwise_comparison_prompt_ideology_unidirectional(self):
-        prompts = []
-
-        for j in self.matchup:
-            sent = self.prompt.format(name0=self.id_names_dict[j[0]]["name"],
-                                      name1=self.id_names_dict[j[1]]["name"],
-                                      congress_number0=str(self.id_names_dict[j[0]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[0]]["congress"]),
-                                      congress_number1=str(self.id_names_dict[j[1]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[1]]["congress"]),
-                                      chamber0=self.id_names_dict[j[0]]["chamber"],
-                                      chamber1=self.id_names_dict[j[1]]["chamber"],
-                                      state0=self.id_names_dict[j[0]]["state_abbrev"],
-                                      state1=self.id_names_dict[j[1]]["state_abbrev"],
-                                      politician_type=self.politician_type)
-            prompts.append(sent)
-
-        self.prompts = prompts
+        self.matchup_direction = np.zeros(len(self.matchup_idx0), dtype=np.int8)
+        self.prompts = self._render_prompts((self.prompt,), self.matchup_direction)
 
     def create_extraction_prompts_bidirectional(self):
-        extraction_prompts = []
-
-        for j in self.matchup:
-            if (self.id_names_dict[j[0]]["party"]=='R') and (self.id_names_dict[j[1]]["party"]=='R'):
-                sent = self.conservative_extraction_prompt.format(name0=self.id_names_dict[j[0]]["name"],
-                                                                  name1=self.id_names_dict[j[1]]["name"],
-                                                                  congress_number0=str(self.id_names_dict[j[0]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[0]]["congress"]),
-                                                                  congress_number1=str(self.id_names_dict[j[1]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[1]]["congress"]),
-                                                                  chamber0=self.id_names_dict[j[0]]["chamber"],
-                                                                  chamber1=self.id_names_dict[j[1]]["chamber"],
-                                                                  state0=self.id_names_dict[j[0]]["state_abbrev"],
-                                                                  state1=self.id_names_dict[j[1]]["state_abbrev"],
-                                                                  politician_type=self.politician_type)
-            else:
-                sent = self.liberal_extraction_prompt.format(name0=self.id_names_dict[j[0]]["name"],
-                                                             name1=self.id_names_dict[j[1]]["name"],
-                                                             congress_number0=str(self.id_names_dict[j[0]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[0]]["congress"]),
-                                                             congress_number1=str(self.id_names_dict[j[1]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[1]]["congress"]),
-                                                             chamber0=self.id_names_dict[j[0]]["chamber"],
-                                                             chamber1=self.id_names_dict[j[1]]["chamber"],
-                                                             state0=self.id_names_dict[j[0]]["state_abbrev"],
-                                                             state1=self.id_names_dict[j[1]]["state_abbrev"],
-                                                             politician_type=self.politician_type)
-
-            extraction_prompts.append(sent)
-
-        self.extraction_prompts = extraction_prompts
+        self.extraction_prompts = self._render_prompts((self.liberal_extraction_prompt, self.conservative_extraction_prompt),
+                                                       self._comparison_choice())
 
     def create_extraction_prompts_unidirectional(self):
-        extraction_prompts = []
-
-        for j in self.matchup:
-            sent = self.extraction_prompt.format(name0=self.id_names_dict[j[0]]["name"],
-                                                 name1=self.id_names_dict[j[1]]["name"],
-                                                 congress_number0=str(self.id_names_dict[j[0]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[0]]["congress"]),
-                                                 congress_number1=str(self.id_names_dict[j[1]]["congress"]) + self._get_ordinal_suffix(self.id_names_dict[j[1]]["congress"]),
-                                                 chamber0=self.id_names_dict[j[0]]["chamber"],
-                                                 chamber1=self.id_names_dict[j[1]]["chamber"],
-                                                 politician_type=self.politician_type)
-
-            extraction_prompts.append(sent)
-
-        self.extraction_prompts = extraction_prompts
+        self.extraction_prompts = self._render_prompts((self.extraction_prompt,), np.zeros(len(self.matchup_idx0), dtype=np.int8))
+
+    def _open_journal(self):
+        if self.journal_path is not None and self.journal is None:
+            self.journal = RunJournal(self.journal_path, resume=self.resume)
+
+    def _prepare_results(self, name, fill, indices):
+        # A full run starts new result lists; a run over some indices (e.g. an adaptive round) extends the existing ones
+        results = getattr(self, name, None)
+        if indices is None or results is None:
+            results = []
+        setattr(self, name, results + [fill]*(len(self.prompts) - len(results)))
+        return list(range(len(self.prompts))) if indices is None else list(indices)
+
+    def _pending_indices(self, phase, results, indices):
+        # Fills in results already recorded in the journal and returns the indices that still need to be run
+        if self.journal is None:
+            return list(indices)
+
+        pending = []
+        for i in indices:
+            record = self.journal.completed(phase, i, self._matchup_ids(i))
+            if record is None:
+                pending.append(i)
+            else:
+                results[i] = record["result"]
+
+        if len(pending) < len(indices):
+            print(f"Resuming: {len(indices) - len(pending)} of {len(indices)} {phase} results loaded from {self.journal_path}")
+        return pending
+
+    def _journal_result(self, phase, i, result, error=None):
+        if self.journal is not None:
+            self.journal.append(phase, i, self._matchup_ids(i), result, error)
+
+    def _comparison_messages(self, i):
+        # Message lists are built on demand rather than kept for every matchup
+        return [{"role": "user", "content": self.prompts[i]}]
+
+    def _extraction_messages(self, i):
+        return self._comparison_messages(i) + [{"role": "assistant", "content": self.pc_results[i]},
+                                               {"role": "user", "content": self.extraction_prompts[i]}]
+
+    def _comparison_response_format(self, i):
+        # JSON schema for structured output: the winner can only be one of the two names or "Tie"
+        names = [self._member_names[self.matchup_idx0[i]], self._member_names[self.matchup_idx1[i]]]
+        properties = {}
+        if self.structured_rationale:
+            properties["rationale"] = {"type": "string",
+                                       "description": "A brief explanation of the answer"}
+        properties["winner"] = {"type": "string",
+                                "enum": [name for name in names if isinstance(name, str)] + ["Tie"],
+                                "description": f"The name of the {self.politician_type} that answers the question, "
+                                               f"or \"Tie\" if neither does"}
+        return {"type": "json_schema",
+                "json_schema": {"name": "pairwise_comparison",
+                                "strict": True,
+                                "schema": {"type": "object",
+                                           "properties": properties,
+                                           "required": list(properties),
+                                           "additionalProperties": False}}}
+
+    def _parse_structured_response(self, response):
+        # Returns (rationale, winner) from a structured-output response, or (None, None) if it is not valid JSON
+        try:
+            parsed = json.loads(response)
+        except (TypeError, ValueError):
+            return None, None
+        if not isinstance(parsed, dict):
+            return None, None
+        winner = parsed.get("winner")
+        return parsed.get("rationale"), winner if isinstance(winner, str) else None
+
+    def _packed_messages(self, pack):
+        questions = "\n".join(f"{k}. {self.prompts[i]}" for k, i in enumerate(pack, start=1))
+        instructions = self.pack_prompt.format(count=len(pack), politician_type=self.politician_type)
+        return [{"role": "user", "content": f"{instructions}\n\n{questions}"}]
+
+    def _packed_response_format(self, pack):
+        # One verdict per question; the winner can be any name in the pack, and is checked per question when unpacked
+        names = list(dict.fromkeys(self._member_names[np.column_stack([self.matchup_idx0[pack], self.matchup_idx1[pack]]).ravel()].tolist()))
+        properties = {"question": {"type": "integer", "description": "The number of the question"}}
+        if self.structured_rationale:
+            properties["rationale"] = {"type": "string",
+                                       "description": "A brief explanation of the answer"}
+        properties["winner"] = {"type": "string",
+                                "enum": [name for name in names if isinstance(name, str)] + ["Tie"],
+                                "description": f"The name of the {self.politician_type} that answers the question, "
+                                               f"or \"Tie\" if neither does"}
+        verdict = {"type": "object",
+                   "properties": properties,
+                   "required": list(properties),
+                   "additionalProperties": False}
+        return {"type": "json_schema",
+                "json_schema": {"name": "pairwise_comparisons",
+                                "strict": True,
+                                "schema": {"type": "object",
+                                           "properties": {"verdicts": {"type": "array", "items": verdict}},
+                                           "required": ["verdicts"],
+                                           "additionalProperties": False}}}
+
+    def _unpack_verdicts(self, pack, response):
+        # Returns {matchup index: single-matchup structured response} for every question with a valid verdict
+        try:
+            verdicts = json.loads(response)["verdicts"]
+        except (TypeError, ValueError, KeyError):
+            return {}
+        if not isinstance(verdicts, list):
+            return {}
+
+        unpacked = {}
+        for verdict in verdicts:
+            if not isinstance(verdict, dict) or not isinstance(verdict.get("question"), int):
+                continue
+            k = verdict["question"] - 1
+            if not 0 <= k < len(pack) or pack[k] in unpacked:
+                continue
+            item = {key: verdict[key] for key in ("rationale", "winner") if key in verdict}
+            winner = item.get("winner")
+            if isinstance(winner, str) and self._match_extracted_answer(pack[k], winner) is not None:
+                unpacked[pack[k]] = json.dumps(item, ensure_ascii=False)
+        return unpacked
+
+    async def _run_packed_comparisons(self, indices):
+        # Sends the matchups pack_size at a time. Returns the matchups without a valid verdict, including all
+        # matchups of a failed request, so they can be asked again on their own
+        packs = [indices[k:k + self.pack_size] for k in range(0, len(indices), self.pack_size)]
+        requests = ((p, self._packed_messages(pack), 0, self._packed_response_format(pack)) for p, pack in enumerate(packs))
+
+        missing = []
+        async for p, result, error in self.llm_client.stream_process(requests,
+                                                                     model=self.model,
+                                                                     temperature=self.temperature,
+                                                                     top_p=self.top_p,
+                                                                     return_exceptions=True,
+                                                                     total=len(packs),
+                                                                     phase="comparison"):
+            verdicts = self._unpack_verdicts(packs[p], result)
+            for i in packs[p]:
+                if i in verdicts:
+                    self.pc_results[i] = verdicts[i]
+                    self._journal_result("comparison", i, verdicts[i])
+                else:
+                    missing.append(i)
+
+        if len(missing) > 0:
+            print(f"\n{len(missing)} of {len(indices)} matchups had no valid verdict in their pack and are asked on their own")
+        return missing
+
+    async def run_structured_comparisons(self, indices=None):
+        # One call per matchup: the comparison returns the winner as structured output, so there is no extraction phase.
+        # pc_results holds the raw JSON responses until they are parsed at the end
+        print("Running pairwise comparisons with structured output")
+        self._open_journal()
+
+        indices = self._prepare_results("pc_results", None, indices)
+        self._prepare_results("extraction_results", None, indices)
+        self._prepare_results("extraction_error", 1, indices)
+        pending = self._pending_indices("comparison", self.pc_results, indices)
+        sample_indices = self.llm_client._sample_indices((self._comparison_messages(i) for i in range(len(self.prompts))),
+                                                         self.model, self.temperature, self.top_p)
+
+        def sample_index(i, retry_round):
+            # Retries get sample indices that no repeat of the same prompt uses
+            if sample_indices is None:
+                return retry_round
+            return sample_indices[i] + retry_round * (max(sample_indices) + 1)
+
+        def answer_of(i, response):
+            return self._match_extracted_answer(i, self._parse_structured_response(response)[1])
+
+        invalid = pending
+        if self.pack_size is not None and self.pack_size > 1:
+            invalid = await self._run_packed_comparisons(pending)
+
+        self.extraction_retry_stats = []
+        for retry_round in range(0, self.extraction_retries + 1):
+            if len(invalid) == 0:
+                break
+
+            still_invalid = []
+            requests = ((i, self._comparison_messages(i), sample_index(i, retry_round), self._comparison_response_format(i))
+                        for i in invalid)
+            async for i, result, error in self.llm_client.stream_process(requests,
+                                                                         model=self.model,
+                                                                         temperature=self.temperature,
+                                                                         top_p=self.top_p,
+                                                                         return_exceptions=True,
+                                                                         total=len(invalid),
+                                                                         phase="comparison" if retry_round == 0 else "retry"):
+                valid = answer_of(i, result) is not None
+                if retry_round == 0 or valid:
+                    self.pc_results[i] = result
+                    self._journal_result("comparison", i, result, error)
+                if result is not None and not valid:
+                    still_invalid.append(i)
+
+            if retry_round == 0:
+                # Responses loaded from the journal are checked too
+                requested = set(pending)
+                still_invalid += [i for i in indices if i not in requested
+                                  and self.pc_results[i] is not None and answer_of(i, self.pc_results[i]) is None]
+            else:
+                self.extraction_retry_stats.append({"round": retry_round,
+                                                    "retried": len(invalid),
+                                                    "fixed": len(invalid) - len(still_invalid),
+                                                    "remaining": len(still_invalid)})
+                print(f"Retry round {retry_round}: {len(invalid) - len(still_invalid)} of {len(invalid)} answers fixed")
+            invalid = still_invalid
+
+        for i in indices:
+            if self.pc_results[i] is None:
+                continue
+            rationale, winner = self._parse_structured_response(self.pc_results[i])
+            answer = self._match_extracted_answer(i, winner)
+            self.extraction_results[i] = winner if answer is None else answer
+            self.extraction_error[i] = 0 if answer is not None else 1
+            if self.structured_rationale and rationale is not None:
+                self.pc_results[i] = rationale
+
+        failed = sum(self.pc_results[i] is None for i in indices)
+        if failed > 0:
+            print(f"\n{failed} pairwise comparisons failed and were recorded as failures")
+        if sum(self.extraction_error)==0:
+            print("\nNo extraction errors found")
+        else:
+            print("\nSome extraction errors found---manual review needed")
 
-    async def run_pairwise_comparisons(self):
+    async def run_pairwise_comparisons(self, indices=None):
         print("Running pairwise comparisons")
+        self._open_journal()
 
-        self.pc_prompts_formatted = [[{"role": "user", "content": p}] for p in self.prompts]
+        indices = self._prepare_results("pc_results", None, indices)
+        pending = self._pending_indices("comparison", self.pc_results, indices)
+        sample_indices = self.llm_client._sample_indices((self._comparison_messages(i) for i in range(len(self.prompts))),
+                                                         self.model, self.temperature, self.top_p)
 
-        pc_results = await self.llm_client.prompting_process(messages_list=self.pc_prompts_formatted,
-                                                             model=self.model,
-                                                             temperature=self.temperature,
-                                                             top_p=self.top_p)
-
-        pc_results_clean = [self._remove_period(p) for p in pc_results]
-        pc_results_clean = [self._remove_senator_representative_prefix(p) for p in pc_results_clean]
-
-        self.pc_results = pc_results_clean
-
-    async def run_extraction(self):
+        requests = ((i, self._comparison_messages(i), 0 if sample_indices is None else sample_indices[i]) for i in pending)
+        async for i, result, error in self.llm_client.stream_process(requests,
+                                                                     model=self.model,
+                                                                     temperature=self.temperature,
+                                                                     top_p=self.top_p,
+                                                                     return_exceptions=True,
+                                                                     total=len(pending),
+                                                                     phase="comparison"):
+            if result is not None:
+                result = self._remove_senator_representative_prefix(self._remove_period(result))
+            self.pc_results[i] = result
+            self._journal_result("comparison", i, result, error)
+
+        failed = sum(self.pc_results[i] is None for i in indices)
+        if failed > 0:
+            print(f"\n{failed} pairwise comparisons failed and were recorded as failures")
+
+    async def run_extraction(self, indices=None):
         print("\nExtracting answers")
+        self._open_journal()
 
-        self.extraction_prompts_formatted = [q + [{"role": "assistant", "content": p}] for q,p in zip(self.pc_prompts_formatted, self.pc_results)]
-        self.extraction_prompts_formatted = [q + [{"role": "user", "content": p}] for q,p in zip(self.extraction_prompts_formatted, self.extraction_prompts)]
+        indices = self._prepare_results("extraction_results", None, indices)
+        self._prepare_results("extraction_error", 1, indices)
+        # Failed comparisons have no response to extract from
+        pending = [i for i in self._pending_indices("extraction", self.extraction_results, indices)
+                   if self.pc_results[i] is not None]
 
-        extraction_results = await self.llm_client.prompting_process(messages_list=self.extraction_prompts_formatted,
+        requests = ((i, self._extraction_messages(i)) for i in pending)
+        async for i, result, error in self.llm_client.stream_process(requests,
                                                                      model=self.model,
-                                                                     temperature=0.0)
-
-        self.extraction_results = extraction_results
+                                                                     temperature=0.0,
+                                                                     return_exceptions=True,
+                                                                     total=len(pending),
+                                                                     phase="extraction"):
+            self.extraction_results[i] = result
+            self._journal_result("extraction", i, result, error)
 
         # Verifying that the results are correct
         print("\nVerifying results")
 
-        self.extraction_error = []
+        invalid = []
+        for i in indices:
+            if self.pc_results[i] is None:
+                continue
+            answer = self._match_extracted_answer(i, self.extraction_results[i])
+            if answer is None:
+                invalid.append(i)
+            elif answer != self.extraction_results[i]:
+                self.extraction_results[i] = answer
+                self._journal_result("extraction", i, answer)
+
+        # Invalid answers are retried together, one concurrent round per retry
+        self.extraction_retry_stats = []
+        for retry_round in range(1, self.extraction_retries + 1):
+            if len(invalid) == 0:
+                break
+
+            still_invalid = []
+            requests = ((i, self._extraction_messages(i), retry_round) for i in invalid)
+            async for i, result, error in self.llm_client.stream_process(requests,
+                                                                         model=self.model,
+                                                                         temperature=0.0,
+                                                                         return_exceptions=True,
+                                                                         total=len(invalid),
+                                                                         phase="retry"):
+                answer = self._match_extracted_answer(i, result)
+                if answer is None:
+                    still_invalid.append(i)
+                else:
+                    self.extraction_results[i] = answer
+                    self._journal_result("extraction", i, answer)
+
+            self.extraction_retry_stats.append({"round": retry_round,
+                                                "retried": len(invalid),
+                                                "fixed": len(invalid) - len(still_invalid),
+                                                "remaining": len(still_invalid)})
+            print(f"Retry round {retry_round}: {len(invalid) - len(still_invalid)} of {len(invalid)} extractions fixed")
+            invalid = still_invalid
 
-        for i in range(len(self.extraction_results)):
-            if self.extraction_results[i] not in (self.id_names_dict[self.matchup[i][0]]["name"], self.id_names_dict[self.matchup[i][1]]["name"], "Tie"):
-                # it will retry for 5 times
-                for j in range(5):
-                    retry_result = await self.llm_client.prompting_process(messages_list=[self.extraction_prompts_formatted[i]],
-                                                                           model=self.model,
-                                                                           temperature=0.0)
+        invalid = set(invalid)
+        for i in indices:
+            self.extraction_error[i] = 1 if self.pc_results[i] is None or i in invalid else 0
 
-                    if retry_result[0] in (self.id_names_dict[self.matchup[i][0]]["name"], self.id_names_dict[self.matchup[i][1]]["name"], "Tie"):
-                        self.extraction_results[i] = retry_result[0]
-                        self.extraction_error.append(0)
+        if sum(self.extraction_error)==0:
+            print("\nNo extraction errors found")
+        else:
+            print("\nSome extraction errors found---manual review needed")
+
+    def _match_extracted_answer(self, i, answer):
+        # Returns the matching name (or "Tie") for an extracted answer, or None if it cannot be matched
+        if answer is None:
+            return None
+
+        name0 = self._member_names[self.matchup_idx0[i]]
+        name1 = self._member_names[self.matchup_idx1[i]]
+        if answer in (name0, name1, "Tie"):
+            return answer
+        if not self.fuzzy_matching:
+            return None
+
+        # Members without a canonical name (NaN after the merge) can only be matched exactly
+        names = [name for name in (name0, name1) if isinstance(name, str)]
+        candidates = {name.casefold(): name for name in names}
+        candidates["tie"] = "Tie"
+        cleaned = answer.strip().strip("\"'*`").strip()
+        cleaned = self._remove_senator_representative_prefix(self._remove_period(cleaned)).strip().casefold()
+        if cleaned in candidates:
+            return candidates[cleaned]
+
+        # A longer answer that contains a name is a sentence, and a sentence such as "X is more moderate" or
+        # "Not X" can mean the other politician, so it is retried rather than credited to the one it names.
+        # With sentence_matching, a sentence naming exactly one of them is credited to that one
+        found = [name for name in names
+                 if re.search(r"(?<!\w)" + re.escape(name.casefold()) + r"(?!\w)", cleaned)]
+        if found:
+            return found[0] if self.sentence_matching and len(found) == 1 else None
+
+        close = difflib.get_close_matches(cleaned, list(candidates), n=1, cutoff=0.85)
+        return candidates[close[0]] if close else None
+
+    async def run_pipeline(self, indices=None):
+        # Each matchup runs comparison -> extraction -> verification as its own task chain, all sharing
+        # the client's concurrency budget, so there is no barrier between the two phases
+        print("Running pairwise comparisons and extraction as a pipeline")
+        self._open_journal()
+
+        indices = self._prepare_results("pc_results", None, indices)
+        self._prepare_results("extraction_results", None, indices)
+        self._prepare_results("extraction_error", 1, indices)
+        total = len(indices)
+
+        pending_comparisons = set(self._pending_indices("comparison", self.pc_results, indices))
+        self._pending_indices("extraction", self.extraction_results, indices)
+        sample_indices = self.llm_client._sample_indices((self._comparison_messages(i) for i in range(len(self.prompts))),
+                                                         self.model, self.temperature, self.top_p)
+
+        async def call(messages, temperature, top_p, sample_index, phase):
+            try:
+                return await self.llm_client.calling_llm(messages, self.model, temperature, top_p, sample_index=sample_index,
+                                                         phase=phase), None
+            except Exception as e:
+                return None, e
+
+        async def chain(i):
+            if i in pending_comparisons:
+                result, error = await call(self._comparison_messages(i), self.temperature, self.top_p,
+                                           0 if sample_indices is None else sample_indices[i], "comparison")
+                if result is not None:
+                    result = self._remove_senator_representative_prefix(self._remove_period(result))
+                self.pc_results[i] = result
+                self._journal_result("comparison", i, result, error)
+
+            if self.pc_results[i] is not None:
+                if self.extraction_results[i] is None:
+                    result, error = await call(self._extraction_messages(i), 0.0, 1.0, 0, "extraction")
+                    self.extraction_results[i] = result
+                    self._journal_result("extraction", i, result, error)
+
+                answer = self._match_extracted_answer(i, self.extraction_results[i])
+                for retry_round in range(1, self.extraction_retries + 1):
+                    if answer is not None:
                         break
-                else:
-                    self.extraction_error.append(1)
+                    result, error = await call(self._extraction_messages(i), 0.0, 1.0, retry_round, "retry")
+                    answer = self._match_extracted_answer(i, result)
+
+                if answer is not None:
+                    if answer != self.extraction_results[i]:
+                        self.extraction_results[i] = answer
+                        self._journal_result("extraction", i, answer)
+                    self.extraction_error[i] = 0
+            return i
+
+        # Only a bounded window of chains is alive at any time
+        progress_bar = None
+        if not self.progress_callback:
+            from tqdm.asyncio import tqdm_asyncio
+            progress_bar = tqdm_asyncio(total=total)
+        completed = 0
+        finished = []
+        async for i in self.llm_client.run_bounded(chain(i) for i in indices):
+            completed += 1
+            # A matchup is final once its chain finishes, so results are written as they complete
+            if self.result_sink is not None:
+                finished.append(i)
+                if len(finished) >= self.results_row_group_size:
+                    self._stream_results(finished)
+                    finished = []
+            if self.progress_callback:
+                await self.progress_callback(completed, total)
             else:
-                self.extraction_error.append(0)
+                progress_bar.update(1)
+        if progress_bar is not None:
+            progress_bar.close()
+        self._stream_results(finished)
+
+        failed = sum(self.pc_results[i] is None for i in indices)
+        if failed > 0:
+            print(f"\n{failed} pairwise comparisons failed and were recorded as failures")
 
         if sum(self.extraction_error)==0:
             print("\nNo extraction errors found")
         else:
             print("\nSome extraction errors found---manual review needed")
 
-    def make_final_df_bidirectional(self):
-        name0 = [self.id_names_dict[j[0]]["name"] for j in self.matchup_id]
-        name1 = [self.id_names_dict[j[1]]["name"] for j in self.matchup_id]
-        id0 = [j[0] for j in self.matchup_id]
-        id1 = [j[1] for j in self.matchup_id]
-        chamber0 = [self.id_names_dict[j[0]]["chamber"] for j in self.matchup_id]
-        chamber1 = [self.id_names_dict[j[1]]["chamber"] for j in self.matchup_id]
-        congress0 = [self.id_names_dict[j[0]]["congress"] for j in self.matchup_id]
-        congress1 = [self.id_names_dict[j[1]]["congress"] for j in self.matchup_id]
-        party_code0 = [self.id_names_dict[j[0]]["party_code"] for j in self.matchup_id]
-        party_code1 = [self.id_names_dict[j[1]]["party_code"] for j in self.matchup_id]
-        party0 = [self.id_names_dict[j[0]]["party"] for j in self.matchup_id]
-        party1 = [self.id_names_dict[j[1]]["party"] for j in self.matchup_id]
-
-        matchup_results_df = pd.DataFrame({"name0": name0,
-                                           "name1": name1,
-                                           "bioguide_id0": id0,
-                                           "bioguide_id1": id1,
-                                           "chamber0": chamber0,
-                                           "chamber1": chamber1,
-                                           "congress0": congress0,
-                                           "congress1": congress1,
-                                           "party_code0": party_code0,
-                                           "party_code1": party_code1,
-                                           "party0": party0,
-                                           "party1": party1,
-                                           "prompt": self.prompts,
-                                           "llm_response": self.pc_results,
-                                           "extracted_answer": self.extraction_results,
-                                           "comparison_direction": self.comparison_direction,
-                                           "extraction_error": self.extraction_error})
-
-        name0_win = []
-        name1_win = []
-
-        for i in range(len(matchup_results_df)):
-            if matchup_results_df['comparison_direction'][i]=='liberal':
-                if matchup_results_df['extracted_answer'][i]==matchup_results_df['name0'][i]:
-                    if self.scale_increasing_intensity:
-                        name0_win.append(1.0)
-                        name1_win.append(0.0)
-                    else:
-                        name0_win.append(0.0)
-                        name1_win.append(1.0)
-                elif matchup_results_df['extracted_answer'][i]==matchup_results_df['name1'][i]:
-                    if self.scale_increasing_intensity:
-                        name0_win.append(0.0)
-                        name1_win.append(1.0)
-                    else:
-                        name0_win.append(1.0)
-                        name1_win.append(0.0)
-                elif matchup_results_df['extracted_answer'][i]=='Tie':
-                    name0_win.append(0.5)
-                    name1_win.append(0.5)
-                else:
-                    name0_win.append(0.0)
-                    name1_win.append(0.0)
-            elif matchup_results_df['comparison_direction'][i]=='conservative':
-                if matchup_results_df['extracted_answer'][i]==matchup_results_df['name0'][i]:
-                    if self.scale_increasing_intensity:
-                        name0_win.append(0.0)
-                        name1_win.append(1.0)
-                    else:
-                        name0_win.append(1.0)
-                        name1_win.append(0.0)
-                elif matchup_results_df['extracted_answer'][i]==matchup_results_df['name1'][i]:
-                    if self.scale_increasing_intensity:
-                        name0_win.append(1.0)
-                        name1_win.append(0.0)
-                    else:
-                        name0_win.append(0.0)
-                        name1_win.append(1.0)
-                elif matchup_results_df['extracted_answer'][i]=='Tie':
-                    name0_win.append(0.5)
-                    name1_win.append(0.5)
-                else:
-                    name0_win.append(0.0)
-                    name1_win.append(0.0)
-
-        matchup_results_df['win0'] = name0_win
-        matchup_results_df['win1'] = name1_win
+    def _open_results(self):
+        if self.results_path is not None and self.result_sink is None:
+            self.result_sink = ResultSink(self.results_path,
+                                          text_path=self.results_text_path,
+                                          row_group_size=self.results_row_group_size)
+
+    def _stream_results(self, indices):
+        # Writes the finished matchups at indices to results_path, one row group at a time
+        if self.result_sink is None:
+            return
+        indices = np.asarray(indices, dtype=np.int64)
+        for start in range(0, len(indices), self.results_row_group_size):
+            frame, _ = self._result_frame(not self.unidirectional, indices[start:start + self.results_row_group_size])
+            self.result_sink.write(frame)
+
+    def _close_results(self):
+        if self.result_sink is not None:
+            self.result_sink.close()
+            print(f"\n{self.result_sink.rows} matchup results written to {self.results_path}")
+            self.result_sink = None
+
+    def _make_final_df(self, directional=False):
+        matchup_results_df, defective = self._result_frame(directional)
+        # Anything else (a failed request or an answer that names neither politician) counts as no outcome
+        if defective.any():
+            print(f"{int(defective.sum())} defective outcomes (win0 = win1 = 0): {np.flatnonzero(defective).tolist()[:20]}")
 
         self.matchup_results_df = matchup_results_df
 
-    def make_final_df_undirectional(self):
-        name0 = [self.id_names_dict[j[0]]["name"] for j in self.matchup_id]
-        name1 = [self.id_names_dict[j[1]]["name"] for j in self.matchup_id]
-        id0 = [j[0] for j in self.matchup_id]
-        id1 = [j[1] for j in self.matchup_id]
-        chamber0 = [self.id_names_dict[j[0]]["chamber"] for j in self.matchup_id]
-        chamber1 = [self.id_names_dict[j[1]]["chamber"] for j in self.matchup_id]
-        congress0 = [self.id_names_dict[j[0]]["congress"] for j in self.matchup_id]
-        congress1 = [self.id_names_dict[j[1]]["congress"] for j in self.matchup_id]
-        party_code0 = [self.id_names_dict[j[0]]["party_code"] for j in self.matchup_id]
-        party_code1 = [self.id_names_dict[j[1]]["party_code"] for j in self.matchup_id]
-        party0 = [self.id_names_dict[j[0]]["party"] for j in self.matchup_id]
-        party1 = [self.id_names_dict[j[1]]["party"] for j in self.matchup_id]
-
-        matchup_results_df = pd.DataFrame({"name0": name0,
-                                           "name1": name1,
-                                           "bioguide_id0": id0,
-                                           "bioguide_id1": id1,
-                                           "chamber0": chamber0,
-                                           "chamber1": chamber1,
-                                           "congress0": congress0,
-                                           "congress1": congress1,
-                                           "party_code0": party_code0,
-                                           "party_code1": party_code1,
-                                           "party0": party0,
-                                           "party1": party1,
-                                           "prompt": self.prompts,
-                                           "llm_response": self.pc_results,
-                                           "extracted_answer": self.extraction_results,
-                                           "extraction_error": self.extraction_error})
-
-        name0_win = []
-        name1_win = []
-
-        for i in range(len(matchup_results_df)):
-            if matchup_results_df['extracted_answer'][i]==matchup_results_df['name0'][i]:
-                if self.scale_increasing_intensity:
-                    name0_win.append(1.0)
-                    name1_win.append(0.0)
-                else:
-                    name0_win.append(0.0)
-                    name1_win.append(1.0)
-            elif matchup_results_df['extracted_answer'][i]==matchup_results_df['name1'][i]:
-                if self.scale_increasing_intensity:
-                    name0_win.append(0.0)
-                    name1_win.append(1.0)
-                else:
-                    name0_win.append(1.0)
-                    name1_win.append(0.0)
-            elif matchup_results_df['extracted_answer'][i]=='Tie':
-                name0_win.append(0.5)
-                name1_win.append(0.5)
-            else:
-                print(str(i) + ' is a defective outcome')
+    def _result_frame(self, directional, indices=None):
+        # Rows of matchup_results_df for the matchups at indices (all of them if None), indexed by matchup, and
+        # which of them have no valid outcome. Matchups are reported in their sorted-ID orientation (as in
+        # self.matchup_id), whatever order the prompt used
+        members = self.members
+        if indices is None:
+            idx0, idx1, direction = self.matchup_idx0, self.matchup_idx1, self.matchup_direction
+            prompts = self.prompts if isinstance(self.prompts, list) else self.prompts.to_array()
+            pc_results, extraction_results, extraction_error = self.pc_results, self.extraction_results, self.extraction_error
+        else:
+            indices = np.asarray(indices, dtype=np.int64)
+            idx0, idx1, direction = self.matchup_idx0[indices], self.matchup_idx1[indices], self.matchup_direction[indices]
+            prompts = [self.prompts[i] for i in indices] if isinstance(self.prompts, list) else self.prompts.to_array(indices)
+            pc_results = [self.pc_results[i] for i in indices]
+            extraction_results = [self.extraction_results[i] for i in indices]
+            extraction_error = [self.extraction_error[i] for i in indices]
+
+        id_rank = np.empty(len(self.id_list), dtype=np.int64)
+        id_rank[np.argsort(self.id_list)] = np.arange(len(self.id_list))
+        swap = id_rank[idx0] > id_rank[idx1]
+        positions = {0: np.where(swap, idx1, idx0),
+                     1: np.where(swap, idx0, idx1)}
+
+        columns = {}
+        for field in ("name", "bioguide_id", "chamber", "congress", "party_code", "party"):
+            # Taking from the member column keeps its dtype, so 1M-row columns are not re-inferred from objects
+            for side in (0, 1):
+                columns[f"{field}{side}"] = members[field].array.take(positions[side])
+
+        columns["prompt"] = prompts
+        columns["llm_response"] = pc_results
+        columns["extracted_answer"] = None
+        if directional:
+            columns["comparison_direction"] = pd.array(["liberal", "conservative"], dtype="str").take((direction == 1).astype(np.int64))
+        columns["extraction_error"] = np.array(extraction_error, dtype=np.int64)
+
+        # The answer names whoever is more liberal (or, for conservative prompts, more conservative). By default
+        # win0/win1 credit the more conservative politician; scale_increasing_intensity credits the named one.
+        # Answers are compared as codes into the distinct member names (then "Tie"), not string by string
+        answer = np.array(extraction_results, dtype=object)
+        name_code, names = pd.factorize(members["name"].to_numpy(dtype=object))
+        lookup = {name: code for code, name in enumerate(names)}
+        lookup.setdefault("Tie", len(names))
+        answer_code, answers = pd.factorize(answer)
+        answer_code = np.array([lookup.get(value, -1) for value in answers] + [-1], dtype=np.int64)[answer_code]
+        picked0 = answer_code == name_code[positions[0]]
+        picked1 = (answer_code == name_code[positions[1]]) & ~picked0
+        tie = (answer_code == lookup["Tie"]) & ~picked0 & ~picked1
+        if directional:
+            conservative = direction == 1
+        else:
+            conservative = np.zeros(len(answer), dtype=bool)
+
+        name0_credited = np.where(conservative == self.scale_increasing_intensity, picked1, picked0)
+        name1_credited = np.where(conservative == self.scale_increasing_intensity, picked0, picked1)
+        columns["win0"] = np.where(name0_credited, 1.0, np.where(tie, 0.5, 0.0))
+        columns["win1"] = np.where(name1_credited, 1.0, np.where(tie, 0.5, 0.0))
+
+        # Answers that name a member or a tie are taken from the distinct names; only the others are converted
+        unknown = answer_code < 0
+        extracted_answer = pd.array(np.append(names, "Tie").astype(object), dtype="str").take(np.maximum(answer_code, 0))
+        if unknown.any():
+            extracted_answer[unknown] = answer[unknown]
+        columns["extracted_answer"] = extracted_answer
+        # One constructor call; adding 1M-row columns one at a time re-checks the frame on every insert
+        matchup_results_df = pd.DataFrame(columns, index=indices, copy=False)
+        return matchup_results_df, ~(picked0 | picked1 | tie)
 
-        matchup_results_df['win0'] = name0_win
-        matchup_results_df['win1'] = name1_win
+    def make_final_df_bidirectional(self):
+        self._make_final_df(directional=True)
 
-        self.matchup_results_df = matchup_results_df
+    def make_final_df_undirectional(self):
+        self._make_final_df()
 
-    async def run(self):
-        self.create_matchups()
+    def create_prompts(self):
         if self.unidirectional:
             self.create_pairwise_comparison_prompt_ideology_unidirectional()
             self.create_extraction_prompts_unidirectional()
@@ -449,14 +911,243 @@ class LaMPscores:
             self.create_pairwise_comparison_prompt_ideology_bidirectional()
             self.create_extraction_prompts_bidirectional()
 
-        await self.run_pairwise_comparisons()
-        await self.run_extraction()
-
+    def make_final_df(self):
         if self.unidirectional:
             self.make_final_df_undirectional()
         else:
             self.make_final_df_bidirectional()
 
+    async def _run_llm(self, indices=None):
+        if self.structured_output or self.pack_size is not None:
+            await self.run_structured_comparisons(indices)
+        elif self.pipeline:
+            await self.run_pipeline(indices)
+            return
+        else:
+            await self.run_pairwise_comparisons(indices)
+            await self.run_extraction(indices)
+        # These phases settle every matchup (including retries) before any is final
+        self._stream_results(range(len(self.matchup_idx0)) if indices is None else indices)
+
+    async def run_adaptive(self):
+        # Starts from a small balanced design, then in each round fits interim Bradley-Terry abilities and
+        # compares the pairs whose outcomes are most uncertain, until every standard error reaches the target.
+        # The balanced design has at least 2 matchups per member, which makes it connected
+        self.create_matchups()
+        n = len(self.id_list)
+        rng = np.random.default_rng(self.randomize_pairwise_order_seed)
+        batch_size = self.adaptive_batch_size or n
+
+        idx0, idx1 = sample_balanced(n, max(2, self.adaptive_initial_per_item), rng)
+        self._reset_matchups()
+        self._add_matchups(idx0, idx1, rng.random(len(idx0)) < 0.5)
+        self.create_prompts()
+        await self._run_llm()
+
+        self.adaptive_stats = []
+        for adaptive_round in range(1, self.adaptive_max_rounds + 1):
+            self.make_final_df()
+            # Failed comparisons and extraction errors can split the valid outcomes into separate groups (or leave
+            # a member without any). The largest group is fitted, and this round also compares across the groups
+            valid = (self.matchup_results_df["win0"] + self.matchup_results_df["win1"]).to_numpy() > 0
+            labels = comparison_components(self.matchup_idx0[valid], self.matchup_idx1[valid], n)
+            main = labels == np.bincount(labels).argmax()
+            bridge0, bridge1 = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+            if not main.all():
+                bridge0, bridge1 = bridging_pairs(labels, rng)
+                print(f"\nAdaptive round {adaptive_round}: the valid outcomes form {len(bridge0) + 1} separate groups; "
+                      f"adding {len(bridge0)} bridging comparisons")
+
+            idx0, idx1 = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+            if main.sum() > 1:
+                # Standard errors on the lampscore scale: consistent outcomes keep stretching the logit scale, so
+                # logit standard errors need not shrink as comparisons are added. Members outside the fitted
+                # group cannot be placed yet, and count as uncertain across the whole scale
+                in_main = main[self.matchup_idx0] & main[self.matchup_idx1]
+                fit = fit_bradley_terry(self.matchup_results_df[in_main]).set_index("bioguide_id")
+                ability = fit["ability"].reindex(self.id_list).to_numpy()
+                se = fit["qse"].reindex(self.id_list).fillna(1.0).to_numpy()
+
+                self.adaptive_stats.append({"round": adaptive_round,
+                                            "comparisons": len(self.matchup_idx0),
+                                            "max_se": float(se.max()),
+                                            "median_se": float(np.median(se))})
+                print(f"\nAdaptive round {adaptive_round}: {len(self.matchup_idx0)} comparisons, max standard error {se.max():.3f}")
+                if se.max() <= self.adaptive_target_se:
+                    break
+
+                # Pairs are chosen within the fitted group, by their positions in it
+                members = np.flatnonzero(main)
+                position = np.full(n, -1, dtype=np.int64)
+                position[members] = np.arange(len(members))
+                compared0, compared1 = position[self.matchup_idx0[in_main]], position[self.matchup_idx1[in_main]]
+                codes = np.minimum(compared0, compared1) * len(members) + np.maximum(compared0, compared1)
+                idx0, idx1 = select_informative_pairs(ability[members], se[members], codes,
+                                                      max(batch_size - len(bridge0), 0), self.adaptive_target_se)
+                idx0, idx1 = members[idx0], members[idx1]
+
+            idx0, idx1 = np.concatenate([bridge0, idx0]), np.concatenate([bridge1, idx1])
+            if len(idx0) == 0:
+                break
+
+            start = len(self.matchup_idx0)
+            self._add_matchups(idx0, idx1, rng.random(len(idx0)) < 0.5)
+            self.create_prompts()
+            await self._run_llm(range(start, len(self.matchup_idx0)))
+
+        self.make_final_df()
+
+    async def run_incremental(self, previous_results_df, previous_scores=None):
+        """
+        Scores the members of the roster who do not appear in previous_results_df (e.g. after a special election
+        or an appointment) without repeating earlier comparisons, so the cost grows with the number of new members.
+        previous_results_df should come from a run with the same prompts and settings. Each new member is compared
+        with sample_per_item existing members (all of them if None) drawn from across the previous scale. With
+        adaptive=True it starts with adaptive_initial_per_item of them, and each round adds the existing members
+        nearest its interim position until its standard error on the lampscore scale reaches adaptive_target_se.
+
+        matchup_results_df is previous_results_df with the new matchups appended (new_matchup_results_df holds
+        only the new ones), and scores_df is refit starting from the previous abilities, taken from
+        previous_scores (a fit_bradley_terry result) or from a fit of previous_results_df
+        """
+        if not self._data_loaded:
+            await asyncio.to_thread(self.load_data)
+        self._index_members()
+        self._reset_matchups()
+
+        previous_ids = set(pd.concat([previous_results_df["bioguide_id0"], previous_results_df["bioguide_id1"]]).astype(str))
+        is_new = np.array([str(bioguide_id) not in previous_ids for bioguide_id in self.id_list], dtype=bool)
+        new = np.flatnonzero(is_new)
+        existing = np.flatnonzero(~is_new)
+        if len(existing) == 0:
+            raise ValueError("No member of the roster appears in 'previous_results_df'.")
+
+        if previous_scores is None:
+            previous_scores = await asyncio.to_thread(fit_bradley_terry, previous_results_df)
+        previous_ability = previous_scores.set_index("bioguide_id")["ability"]
+
+        self.incremental_stats = []
+        if len(new) == 0:
+            print("No new members; the previous results are kept")
+            self.new_matchup_results_df = None
+            self.matchup_results_df = previous_results_df
+            self.scores_df = previous_scores
+            return
+
+        # Existing members ordered by their previous abilities, so that sampled partners span the whole scale
+        anchor_ability = previous_ability.reindex(self.id_list[existing]).fillna(0.0).to_numpy()
+        anchors = existing[np.argsort(anchor_ability, kind="stable")]
+        rng = np.random.default_rng(self.randomize_pairwise_order_seed)
+        idx0, idx1 = sample_anchor_partners(new, anchors, self.adaptive_initial_per_item if self.adaptive else self.sample_per_item, rng)
+
+        print(f"Scoring {len(new)} new members against {len(existing)} existing members")
+        self._open_results()
+        try:
+            self._add_matchups(idx0, idx1, rng.random(len(idx0)) < 0.5)
+            self.create_prompts()
+            await self._run_llm()
+            self._refit_incremental(previous_results_df, previous_ability)
+
+            # Round 0 is the fit to the initial partners; every refit is recorded, including the last one
+            n = len(self.id_list)
+            for adaptive_round in range(self.adaptive_max_rounds + 1):
+                fit = self.scores_df.set_index("bioguide_id")
+                new_ability = fit["ability"].reindex(self.id_list[new]).fillna(0.0).to_numpy()
+                se = fit["qse"].reindex(self.id_list[new]).fillna(1.0).to_numpy()
+                self.incremental_stats.append({"round": adaptive_round,
+                                               "new_comparisons": len(self.matchup_idx0),
+                                               "max_se": float(se.max()),
+                                               "median_se": float(np.median(se))})
+                print(f"\nIncremental round {adaptive_round}: {len(self.matchup_idx0)} new comparisons, "
+                      f"max standard error of new members {se.max():.3f}")
+                if not self.adaptive or se.max() <= self.adaptive_target_se or adaptive_round == self.adaptive_max_rounds:
+                    break
+
+                anchor_ability = fit["ability"].reindex(self.id_list[anchors]).fillna(0.0).to_numpy()
+                order = np.argsort(anchor_ability, kind="stable")
+                needy = se > self.adaptive_target_se
+                idx0, idx1 = self.matchup_idx0.astype(np.int64), self.matchup_idx1.astype(np.int64)
+                codes = np.minimum(idx0, idx1) * n + np.maximum(idx0, idx1)
+                idx0, idx1 = select_anchor_partners(new[needy], new_ability[needy], anchors[order], anchor_ability[order], codes, n)
+                if len(idx0) == 0:
+                    break
+
+                start = len(self.matchup_idx0)
+                self._add_matchups(idx0, idx1, rng.random(len(idx0)) < 0.5)
+                self.create_prompts()
+                await self._run_llm(range(start, len(self.matchup_idx0)))
+                self._refit_incremental(previous_results_df, previous_ability)
+        finally:
+            self._close_results()
+
+        self._finish_run()
+
+    def _refit_incremental(self, previous_results_df, previous_ability):
+        # Appends the new matchups to the previous ones and refits from the previous abilities. A new member starts
+        # at its maximum-likelihood ability against its partners held at their previous abilities, smoothed by half a
+        # win and half a loss against their mean and found by bisection, since the expected wins increase with it
+        self.make_final_df()
+        new_df = self.new_matchup_results_df = self.matchup_results_df
+        outcomes = pd.DataFrame({"member": pd.concat([new_df["bioguide_id0"], new_df["bioguide_id1"]], ignore_index=True),
+                                 "partner": pd.concat([new_df["bioguide_id1"], new_df["bioguide_id0"]], ignore_index=True),
+                                 "win": pd.concat([new_df["win0"], new_df["win1"]], ignore_index=True),
+                                 "loss": pd.concat([new_df["win1"], new_df["win0"]], ignore_index=True)})
+        outcomes = outcomes[~outcomes["member"].isin(previous_ability.index)]
+        codes, members = pd.factorize(outcomes["member"])
+        partner_ability = outcomes["partner"].map(previous_ability).fillna(0.0).to_numpy()
+        wins = outcomes["win"].to_numpy()
+        trials = wins + outcomes["loss"].to_numpy()
+        center = np.bincount(codes, partner_ability, minlength=len(members)) / np.bincount(codes, minlength=len(members))
+        low = np.full(len(members), previous_ability.min() - 10.0)
+        high = np.full(len(members), previous_ability.max() + 10.0)
+        for _ in range(60):
+            middle = (low + high) / 2
+            surplus = (np.bincount(codes, wins - trials / (1 + np.exp(partner_ability - middle[codes])), minlength=len(members))
+                       + 0.5 - 1 / (1 + np.exp(center - middle)))
+            low = np.where(surplus > 0, middle, low)
+            high = np.where(surplus > 0, high, middle)
+        start = pd.Series((low + high) / 2, index=members)
+
+        self.matchup_results_df = pd.concat([previous_results_df, new_df], ignore_index=True)
+        self.scores_df = fit_bradley_terry(self.matchup_results_df, init=pd.concat([previous_ability, start]))
+
+    async def run(self):
+        if not self._data_loaded:
+            await asyncio.to_thread(self.load_data)
+
+        self._open_results()
+        try:
+            if self.adaptive:
+                await self.run_adaptive()
+            else:
+                self.create_matchups()
+                self.create_prompts()
+                await self._run_llm()
+                self.make_final_df()
+        finally:
+            # Results written so far stay readable if the run fails or is cancelled
+            self._close_results()
+        self._finish_run()
+
+    def _finish_run(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self._close_results()
+
+        if self.llm_client.cache is not None:
+            stats = self.llm_client.cache_stats()
+            print(f"\nResponse cache: {stats['hits']} hits, {stats['misses']} misses")
+        stats = self.llm_client.coalesce_stats()
+        if stats["saved"] > 0:
+            print(f"\nDuplicate requests: {stats['saved']} calls saved ({stats['in_flight']} shared in flight, {stats['reused']} reused)")
+
+        # The run summary covers every request made through the client, including other runs sharing it
+        if self.llm_client.telemetry is not None:
+            self.telemetry_summary = self.llm_client.telemetry.report()
+            self.matchup_results_df.attrs["telemetry"] = self.telemetry_summary
+            print(f"\nLLM telemetry: {Telemetry.format_summary(self.telemetry_summary)}")
+
     # helper function to add an ordinal suffix
     def _get_ordinal_suffix(self, number):
         if 11 <= number % 100 <= 13:
@@ -0,0 +1,283 @@
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from .llm_openai_client import LLMOpenAIClient
+from .response_cache import ResponseCache
+
+class LLMOpenAIBatchClient(LLMOpenAIClient):
+    """
+    Runs prompting_process through the OpenAI Batch API instead of one request per message. The batch JSONL files
+    are kept in work_dir if given; otherwise they go to a temporary directory that is removed once the results are read
+    """
+    MAX_REQUESTS_PER_FILE = 50000
+    MAX_BYTES_PER_FILE = 200 * 1024 * 1024
+    ENDPOINT = "/v1/chat/completions"
+
+    def __init__(self,
+                 client,
+                 concurrency=100,
+                 progress_callback=None,
+                 cache=None,
+                 rate_limiter=None,
+                 work_dir=None,
+                 poll_interval=30.0,
+                 completion_window="24h",
+                 max_requests_per_file=MAX_REQUESTS_PER_FILE,
+                 max_bytes_per_file=MAX_BYTES_PER_FILE,
+                 coalesce=True,
+                 coalesce_max_results=100000,
+                 telemetry=None):
+        super().__init__(client,
+                         concurrency=concurrency,
+                         progress_callback=progress_callback,
+                         cache=cache,
+                         rate_limiter=rate_limiter,
+                         coalesce=coalesce,
+                         coalesce_max_results=coalesce_max_results,
+                         telemetry=telemetry)
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.max_requests_per_file = max_requests_per_file
+        self.max_bytes_per_file = max_bytes_per_file
+        self._submissions = 0
+
+    def _write_shards(self, requests, work_dir):
+        # Splits (index, body) pairs into JSONL files under the per-file request-count and size limits
+        os.makedirs(work_dir, exist_ok=True)
+
+        shards = []
+        lines = []
+        size = 0
+
+        for index, body in requests:
+            line = (json.dumps({"custom_id": f"request-{index}",
+                                "method": "POST",
+                                "url": self.ENDPOINT,
+                                "body": body}, ensure_ascii=False) + "\n").encode("utf-8")
+
+            if lines and (len(lines) >= self.max_requests_per_file or size + len(line) > self.max_bytes_per_file):
+                shards.append(lines)
+                lines = []
+                size = 0
+            lines.append(line)
+            size += len(line)
+
+        if lines:
+            shards.append(lines)
+
+        self._submissions += 1
+        paths = []
+        for k, shard in enumerate(shards):
+            path = os.path.join(work_dir, f"batch_{self._submissions}_{k}.jsonl")
+            with open(path, "wb") as f:
+                f.writelines(shard)
+            paths.append(path)
+        return paths
+
+    async def _submit_shard(self, path):
+        with open(path, "rb") as f:
+            input_file = await self.client.files.create(file=f, purpose="batch")
+        batch = await self.client.batches.create(input_file_id=input_file.id,
+                                                 endpoint=self.ENDPOINT,
+                                                 completion_window=self.completion_window)
+        return batch.id
+
+    async def _wait_for_batch(self, batch_id):
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status in ("completed", "failed", "expired", "cancelled"):
+                return batch
+            await asyncio.sleep(self.poll_interval)
+
+    async def _read_file(self, file_id):
+        if file_id is None:
+            return []
+        content = await self.client.files.content(file_id)
+        text = content.text if hasattr(content, "text") else content.read().decode("utf-8")
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    async def _run_shard(self, path):
+        # Returns {index: (result, error, usage)} for every request in the shard that came back
+        batch_id = await self._submit_shard(path)
+        batch = await self._wait_for_batch(batch_id)
+        if batch.status != "completed":
+            print(f"Batch {batch_id} ended with status {batch.status}", file=sys.stderr)
+
+        outputs = {}
+        for row in await self._read_file(getattr(batch, "output_file_id", None)) + await self._read_file(getattr(batch, "error_file_id", None)):
+            index = int(row["custom_id"].rsplit("-", 1)[1])
+            response = row.get("response") or {}
+            if response.get("status_code") == 200:
+                outputs[index] = (response["body"]["choices"][0]["message"]["content"], None, response["body"].get("usage"))
+            else:
+                error = RuntimeError(str(row.get("error") or response.get("body")))
+                error.status_code = response.get("status_code")
+                outputs[index] = (None, error, None)
+        return outputs
+
+    async def prompting_process(self,
+                                messages_list: list,
+                                model: str = "gpt-4o-mini",
+                                temperature: float = 1.0,
+                                top_p: float = 1.0,
+                                max_tries: int = 3,
+                                backoff: float = 2.0,
+                                sample_indices: list = None,
+                                on_result=None,
+                                return_exceptions: bool = False,
+                                response_formats: list = None,
+                                phase: str = None):
+        if sample_indices is None:
+            sample_indices = self._sample_indices(messages_list, model, temperature, top_p)
+
+        total = len(messages_list)
+        results = [None]*total
+        completed = 0
+        started = time.perf_counter()
+
+        def record(status, attempts=0, usage=None, error=None):
+            # Batch requests have no queue wait; their latency is the time until their batch came back
+            if self.telemetry is not None:
+                latency = time.perf_counter() - started
+                usage = usage or {}
+                self.telemetry.request(phase, model, status, latency, 0.0, latency if attempts else 0.0, attempts,
+                                       usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0,
+                                       batch=True, error=error)
+
+        async def finish(index, result, error):
+            nonlocal completed
+            results[index] = result
+            if on_result is not None:
+                on_result(index, result, error)
+            completed += 1
+            if self.progress_callback:
+                await self.progress_callback(completed, total)
+
+        # Cache hits never enter a batch. Identical deterministic requests are submitted once, and their
+        # duplicates (in this batch or answered in an earlier one) take the same result
+        coalesce = self.coalesce and temperature == 0
+        cache_keys = [None]*total
+        duplicates = {}
+        pending = []
+        for i, messages in enumerate(messages_list):
+            if self.cache is not None or coalesce:
+                cache_keys[i] = ResponseCache.make_key(model, messages, temperature, top_p,
+                                                       0 if sample_indices is None else sample_indices[i],
+                                                       None if response_formats is None else response_formats[i])
+            if coalesce:
+                recent = self._recent_result(cache_keys[i])
+                if recent is not None:
+                    self.coalesced_reused += 1
+                    record("coalesced")
+                    await finish(i, recent, None)
+                    continue
+                if cache_keys[i] in duplicates:
+                    self.coalesced_in_flight += 1
+                    duplicates[cache_keys[i]].append(i)
+                    continue
+                duplicates[cache_keys[i]] = []
+            if self.cache is not None:
+                cached = self.cache.get(cache_keys[i])
+                if cached is not None:
+                    if coalesce:
+                        # Later duplicates look the result up again rather than waiting on this request
+                        del duplicates[cache_keys[i]]
+                        self._remember_result(cache_keys[i], cached)
+                    record("cached")
+                    await finish(i, cached, None)
+                    continue
+            pending.append(i)
+
+        # Requests that fail inside a batch are resubmitted in a new batch, up to max_tries
+        work_dir = self.work_dir if self.work_dir is not None else tempfile.mkdtemp(prefix="lampscores_batch_")
+        try:
+            for attempt in range(1, max_tries + 1):
+                if len(pending) == 0:
+                    break
+
+                requests = []
+                for i in pending:
+                    body = {"model": model, "messages": messages_list[i], "temperature": temperature, "top_p": top_p}
+                    if response_formats is not None and response_formats[i] is not None:
+                        body["response_format"] = response_formats[i]
+                    requests.append((i, body))
+                paths = self._write_shards(requests, work_dir)
+                print(f"Submitting {len(pending)} requests in {len(paths)} batch file(s)")
+
+                shard_outputs = await asyncio.gather(*[self._run_shard(path) for path in paths])
+                outputs = {index: output for shard in shard_outputs for index, output in shard.items()}
+
+                still_pending = []
+                for i in pending:
+                    result, error, usage = outputs.get(i, (None, RuntimeError(f"request-{i} missing from batch output"), None))
+                    if result is not None:
+                        if self.cache is not None:
+                            self.cache.set(cache_keys[i], result)
+                        if coalesce:
+                            self._remember_result(cache_keys[i], result)
+                        record("ok", attempt, usage)
+                        for _ in duplicates.get(cache_keys[i], []):
+                            record("coalesced")
+                        for j in [i] + duplicates.get(cache_keys[i], []):
+                            await finish(j, result, None)
+                        continue
+
+                    if self.telemetry is not None:
+                        self.telemetry.retry(phase, model, attempt, getattr(error, "status_code", None), error, None)
+                    if attempt >= max_tries:
+                        if not return_exceptions:
+                            raise error
+                        record("failed", attempt, error=error)
+                        for _ in duplicates.get(cache_keys[i], []):
+                            record("failed", error=error)
+                        for j in [i] + duplicates.get(cache_keys[i], []):
+                            await finish(j, None, error)
+                    else:
+                        still_pending.append(i)
+
+                if still_pending:
+                    print(f"Batch attempt {attempt}: {len(still_pending)} requests failed; resubmitting", file=sys.stderr)
+                pending = still_pending
+        finally:
+            if self.work_dir is None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+        return results
+
+    async def stream_process(self,
+                             requests,
+                             model: str = "gpt-4o-mini",
+                             temperature: float = 1.0,
+                             top_p: float = 1.0,
+                             max_tries: int = 3,
+                             backoff: float = 2.0,
+                             return_exceptions: bool = False,
+                             total: int = None,
+                             window: int = None,
+                             phase: str = None):
+        # A batch needs every request up front, so the stream is collected before it is submitted
+        if hasattr(requests, "__aiter__"):
+            requests = [request async for request in requests]
+        requests = [self._unpack_request(request) for request in requests]
+
+        outputs = []
+        await self.prompting_process([messages for _, messages, _, _ in requests],
+                                     model=model,
+                                     temperature=temperature,
+                                     top_p=top_p,
+                                     max_tries=max_tries,
+                                     backoff=backoff,
+                                     sample_indices=[sample_index for _, _, sample_index, _ in requests],
+                                     on_result=lambda k, result, error: outputs.append((requests[k][0], result, error)),
+                                     return_exceptions=return_exceptions,
+                                     response_formats=[response_format for _, _, _, response_format in requests],
+                                     phase=phase)
+
+        for output in outputs:
+            yield output
@@ -1,15 +1,53 @@
 import asyncio
-from tqdm.asyncio import tqdm_asyncio
+from collections import Counter, OrderedDict
 import sys
+import random
+import time
+
+from .response_cache import ResponseCache
+from .rate_limiter import AdaptiveRateLimiter
+from .telemetry import Telemetry
+
+# Result of a coalesced request whose caller was cancelled before it finished
+_ABANDONED = object()
 
 class LLMOpenAIClient:
     def __init__(self,
                  client,
                  concurrency=100,
-                 progress_callback=None):
+                 progress_callback=None,
+                 cache=None,
+                 rate_limiter=None,
+                 coalesce=True,
+                 coalesce_max_results=100000,
+                 telemetry=None):
         self.client = client
-        self.semaphore = asyncio.Semaphore(concurrency)
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._semaphore_loop = None
         self.progress_callback = progress_callback
+        self.cache = ResponseCache(cache) if isinstance(cache, str) else cache
+        # rate_limiter=True builds an AdaptiveRateLimiter that replaces the fixed semaphore
+        self.rate_limiter = AdaptiveRateLimiter(max_concurrency=concurrency) if rate_limiter is True else (rate_limiter or None)
+        # Identical deterministic requests (temperature 0, same sample index) are sent once: concurrent duplicates
+        # wait for the request in flight, and later ones reuse the last coalesce_max_results results
+        self.coalesce = coalesce
+        self.coalesce_max_results = coalesce_max_results
+        self._in_flight = {}
+        self._recent_results = OrderedDict()
+        self.coalesced_in_flight = 0
+        self.coalesced_reused = 0
+        # telemetry=True builds a Telemetry with no sinks, whose summary() is still available
+        self.telemetry = Telemetry() if telemetry is True else (telemetry or None)
+
+    @property
+    def semaphore(self):
+        # Created on first use inside the running event loop (and again if the client is reused from another loop)
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
 
     async def calling_llm(self,
                           messages: list,
@@ -17,59 +55,333 @@ class LLMOpenAIClient:
                           temperature: float,
                           top_p: float,
                           max_tries: int = 3,
-                          backoff: float = 2.0):
+                          backoff: float = 2.0,
+                          sample_index: int = 0,
+                          response_format: dict = None,
+                          phase: str = None):
+        # phase (e.g. "comparison", "extraction", or "retry") only labels the request in telemetry
+        if not self.coalesce or temperature != 0:
+            return await self._calling_llm(messages, model, temperature, top_p, max_tries, backoff, sample_index,
+                                           response_format, phase=phase)
+
+        key = ResponseCache.make_key(model, messages, temperature, top_p, sample_index, response_format)
+        result = self._recent_result(key)
+        if result is not None:
+            self.coalesced_reused += 1
+            if self.telemetry is not None:
+                self.telemetry.request(phase, model, "coalesced", 0.0)
+            return result
+
+        loop = asyncio.get_running_loop()
+        while True:
+            in_flight = self._in_flight.get(key)
+            if in_flight is None or in_flight.get_loop() is not loop:
+                break
+            start = time.perf_counter()
+            # Shielded, so a cancelled duplicate does not cancel the request it is waiting for
+            result = await asyncio.shield(in_flight)
+            if result is not _ABANDONED:
+                self.coalesced_in_flight += 1
+                if self.telemetry is not None:
+                    self.telemetry.request(phase, model, "coalesced", time.perf_counter() - start)
+                return result
+            # The caller that sent the request was cancelled; the first duplicate to wake up sends it again
+
+        future = loop.create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._calling_llm(messages, model, temperature, top_p, max_tries, backoff, sample_index,
+                                             response_format, key, phase)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                # Never cancelled itself, since the duplicates waiting on it were not
+                future.set_result(_ABANDONED)
+            else:
+                future.set_exception(e)
+                # Marks the exception as retrieved when no duplicate is waiting for it
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            self._remember_result(key, result)
+            return result
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _recent_result(self, key):
+        result = self._recent_results.get(key)
+        if result is not None:
+            self._recent_results.move_to_end(key)
+        return result
+
+    def _remember_result(self, key, result):
+        if self.coalesce_max_results <= 0:
+            return
+        self._recent_results[key] = result
+        self._recent_results.move_to_end(key)
+        while len(self._recent_results) > self.coalesce_max_results:
+            self._recent_results.popitem(last=False)
+
+    def coalesce_stats(self):
+        """
+        Calls saved by coalescing: duplicates that waited for an identical request in flight, and duplicates
+        that reused an earlier result
+        """
+        return {"in_flight": self.coalesced_in_flight,
+                "reused": self.coalesced_reused,
+                "saved": self.coalesced_in_flight + self.coalesced_reused}
+
+    async def _calling_llm(self, messages, model, temperature, top_p, max_tries=3, backoff=2.0, sample_index=0,
+                           response_format=None, cache_key=None, phase=None):
+        telemetry = self.telemetry
+        start = time.perf_counter()
+
+        # Cache hits are served without taking the semaphore
+        if self.cache is not None:
+            if cache_key is None:
+                cache_key = ResponseCache.make_key(model, messages, temperature, top_p, sample_index, response_format)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if telemetry is not None:
+                    telemetry.request(phase, model, "cached", time.perf_counter() - start)
+                return cached
+
+        estimated_tokens = self._estimate_tokens(messages)
+        request = {"model": model, "messages": messages, "temperature": temperature, "top_p": top_p}
+        if response_format is not None:
+            request["response_format"] = response_format
+        queue_wait = 0.0
+        service_time = 0.0
         attempt = 1
         while True:
+            # Time waiting for a concurrency slot (queued) and time inside the API call (service)
+            queued_at = time.perf_counter()
+            sent_at = None
             try:
-                async with self.semaphore:
-                    completion = await self.client.chat.completions.create(
-                        model=model,
-                        messages=messages,
-                        temperature=temperature,
-                        top_p=top_p
-                    )
-                return completion.choices[0].message.content
+                if self.rate_limiter is not None:
+                    async with self.rate_limiter.slot(estimated_tokens):
+                        sent_at = time.perf_counter()
+                        completion, headers = await self._create_completion(**request)
+                    usage = getattr(completion, "usage", None)
+                    self.rate_limiter.on_success(headers, estimated_tokens, getattr(usage, "total_tokens", None))
+                else:
+                    async with self.semaphore:
+                        sent_at = time.perf_counter()
+                        completion = await self.client.chat.completions.create(**request)
+                    usage = getattr(completion, "usage", None)
+                queue_wait += sent_at - queued_at
+                service_time += time.perf_counter() - sent_at
+                result = completion.choices[0].message.content
+                if self.cache is not None:
+                    self.cache.set(cache_key, result)
+                if telemetry is not None:
+                    telemetry.request(phase, model, "ok", time.perf_counter() - start, queue_wait, service_time, attempt,
+                                      getattr(usage, "prompt_tokens", None) or 0,
+                                      getattr(usage, "completion_tokens", None) or 0)
+                return result
 
             except Exception as e:
+                if sent_at is None:
+                    queue_wait += time.perf_counter() - queued_at
+                else:
+                    queue_wait += sent_at - queued_at
+                    service_time += time.perf_counter() - sent_at
+                status_code = getattr(e, "status_code", None)
+                response = getattr(e, "response", None)
+                headers = getattr(response, "headers", None)
+                if self.rate_limiter is not None:
+                    self.rate_limiter.on_error(status_code, headers)
+
                 print(f"Attempt {attempt} failed with error {e}", file=sys.stderr)
+                sleep_time = None if attempt >= max_tries else self._backoff_time(attempt, backoff, headers, status_code)
+                if telemetry is not None:
+                    telemetry.retry(phase, model, attempt, status_code, e, sleep_time)
                 if attempt >= max_tries:
+                    if telemetry is not None:
+                        telemetry.request(phase, model, "failed", time.perf_counter() - start, queue_wait, service_time,
+                                          attempt, error=e)
                     raise
-                sleep_time = backoff * attempt
-                print(f"Retrying in {sleep_time} seconds...", file=sys.stderr)
+                print(f"Retrying in {sleep_time:.2f} seconds...", file=sys.stderr)
                 await asyncio.sleep(sleep_time)
                 attempt += 1
 
+    async def _create_completion(self, **kwargs):
+        # The raw response exposes the rate-limit headers the adaptive limiter reads
+        completions = self.client.chat.completions
+        if hasattr(completions, "with_raw_response"):
+            raw = await completions.with_raw_response.create(**kwargs)
+            return raw.parse(), raw.headers
+        return await completions.create(**kwargs), None
+
+    def _backoff_time(self, attempt, backoff, headers=None, status_code=None):
+        if self.rate_limiter is not None:
+            retry_after = self.rate_limiter.retry_after(headers, status_code)
+            if retry_after is not None:
+                return retry_after
+            return self.rate_limiter.backoff_time(attempt, backoff)
+        # Jittered exponential backoff
+        return random.uniform(0.5, 1.0) * backoff * 2 ** (attempt - 1)
+
+    @staticmethod
+    def _estimate_tokens(messages):
+        # Rough estimate (about four characters per token) used for the tokens-per-minute budget
+        return sum(len(m["content"]) for m in messages) // 4 + 16
+
+    def current_limits(self):
+        if self.rate_limiter is None:
+            return {"concurrency_limit": self.concurrency}
+        return self.rate_limiter.current_limits()
+
+    def _sample_indices(self, messages_list, model, temperature, top_p):
+        # With temperature > 0, repeated identical requests are distinct draws, so each repeat gets its own cache key.
+        # Returns None when every request can use sample index 0
+        if self.cache is None or temperature == 0:
+            return None
+
+        seen = Counter()
+        sample_indices = []
+        for m in messages_list:
+            key = ResponseCache.make_key(model, m, temperature, top_p)
+            sample_indices.append(seen[key])
+            seen[key] += 1
+        return sample_indices
+
+    async def _calling_llm_indexed(self, index, messages, model, temperature, top_p, max_tries, backoff,
+                                   sample_index, return_exceptions, response_format=None, phase=None):
+        try:
+            result = await self.calling_llm(messages, model, temperature, top_p, max_tries, backoff, sample_index,
+                                            response_format, phase)
+            error = None
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            print(f"Request {index} failed after {max_tries} attempts; recording it as a failure", file=sys.stderr)
+            result, error = None, e
+
+        return index, result, error
+
+    async def run_bounded(self, coroutines, window: int = None):
+        # Runs coroutines from a (sync or async) iterable with at most `window` tasks alive at once,
+        # yielding their results in completion order. Memory stays O(window) rather than O(N)
+        window = window or 2*self.concurrency
+        if hasattr(coroutines, "__aiter__"):
+            iterator = coroutines.__aiter__()
+        else:
+            iterator = iter(coroutines)
+
+        in_flight = set()
+        exhausted = False
+
+        try:
+            while True:
+                while not exhausted and len(in_flight) < window:
+                    try:
+                        if hasattr(iterator, "__anext__"):
+                            coroutine = await iterator.__anext__()
+                        else:
+                            coroutine = next(iterator)
+                    except (StopIteration, StopAsyncIteration):
+                        exhausted = True
+                        break
+                    in_flight.add(asyncio.ensure_future(coroutine))
+
+                if not in_flight:
+                    return
+
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def stream_process(self,
+                             requests,
+                             model: str = "gpt-4o-mini",
+                             temperature: float = 1.0,
+                             top_p: float = 1.0,
+                             max_tries: int = 3,
+                             backoff: float = 2.0,
+                             return_exceptions: bool = False,
+                             total: int = None,
+                             window: int = None,
+                             phase: str = None):
+        # Takes a (sync or async) iterable of (index, messages), (index, messages, sample_index), or
+        # (index, messages, sample_index, response_format) tuples and yields
+        # (index, result, error) in completion order. If total is given, progress is reported as results arrive.
+        # With return_exceptions=True, requests that fail after max_tries yield a None result instead of raising
+        async def calls():
+            if hasattr(requests, "__aiter__"):
+                async for request in requests:
+                    index, messages, sample_index, response_format = self._unpack_request(request)
+                    yield self._calling_llm_indexed(index, messages, model, temperature, top_p, max_tries, backoff,
+                                                    sample_index, return_exceptions, response_format, phase)
+            else:
+                for request in requests:
+                    index, messages, sample_index, response_format = self._unpack_request(request)
+                    yield self._calling_llm_indexed(index, messages, model, temperature, top_p, max_tries, backoff,
+                                                    sample_index, return_exceptions, response_format, phase)
+
+        progress_bar = None
+        if total is not None and not self.progress_callback:
+            from tqdm.asyncio import tqdm_asyncio
+            progress_bar = tqdm_asyncio(total=total)
+        completed = 0
+
+        try:
+            async for index, result, error in self.run_bounded(calls(), window):
+                completed += 1
+                if self.progress_callback and total is not None:
+                    await self.progress_callback(completed, total)
+                elif progress_bar is not None:
+                    progress_bar.update(1)
+                yield index, result, error
+        finally:
+            if progress_bar is not None:
+                progress_bar.close()
+
+    @staticmethod
+    def _unpack_request(request):
+        if len(request) == 4:
+            return tuple(request)
+        if len(request) == 3:
+            index, messages, sample_index = request
+        else:
+            index, messages = request
+            sample_index = 0
+        return index, messages, sample_index, None
+
     async def prompting_process(self,
                                 messages_list: list,
                                 model: str = "gpt-4o-mini",
                                 temperature: float = 1.0,
                                 top_p: float = 1.0,
                                 max_tries: int = 3,
-                                backoff: float = 2.0):
-        if self.progress_callback:
-            total = len(messages_list)
-            completed = 0
-            results = [None]*total
-
-            async def wrapped_calling_llm(index, messages):
-                nonlocal completed
-                result = await self.calling_llm(messages, model, temperature, top_p, max_tries, backoff)
-                completed += 1
-                await self.progress_callback(completed, total)
-                return index, result
-            
-            tasks = [asyncio.create_task(wrapped_calling_llm(i, m)) for i, m in enumerate(messages_list)]
-            indexed_results = await asyncio.gather(*tasks)
-            
-            for index, result in indexed_results:
-                results[index] = result
-            
-            return results
+                                backoff: float = 2.0,
+                                sample_indices: list = None,
+                                on_result=None,
+                                return_exceptions: bool = False,
+                                phase: str = None):
+        # on_result(index, result, error) is called as each request finishes. With return_exceptions=True,
+        # requests that fail after max_tries come back as None instead of aborting the whole batch
+        if sample_indices is None:
+            sample_indices = self._sample_indices(messages_list, model, temperature, top_p)
 
-        else:
-            tasks = [asyncio.create_task(self.calling_llm(m, model, temperature, top_p, max_tries, backoff))
-                        for m in messages_list]
-            
-            results = await tqdm_asyncio.gather(*tasks)
+        total = len(messages_list)
+        results = [None]*total
+        requests = ((i, m, 0 if sample_indices is None else sample_indices[i]) for i, m in enumerate(messages_list))
+
+        async for index, result, error in self.stream_process(requests, model, temperature, top_p, max_tries, backoff,
+                                                              return_exceptions=return_exceptions, total=total,
+                                                              phase=phase):
+            results[index] = result
+            if on_result is not None:
+                on_result(index, result, error)
+
+        return results
 
-            return results
\ No newline at end of file
+    def cache_stats(self):
+        if self.cache is None:
+            return None
+        return self.cache.stats()
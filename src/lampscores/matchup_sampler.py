@@ -0,0 +1,253 @@
+from collections.abc import Sequence
+
+import numpy as np
+
+SAMPLING_STRATEGIES = ("per_item", "balanced", "uniform", "stratified")
+
+def _pair_codes(a, b, n):
+    # Encodes unordered pairs (a, b) as single int64 codes
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    return np.minimum(a, b) * n + np.maximum(a, b)
+
+def _in_sorted(codes, sorted_codes):
+    # Membership test against a sorted array of codes
+    if len(sorted_codes) == 0:
+        return np.zeros(len(codes), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_codes, codes), len(sorted_codes) - 1)
+    return sorted_codes[positions] == codes
+
+def _first_occurrences(codes):
+    # Positions of the first occurrence of each distinct code, in their original order
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    first = np.ones(len(codes), dtype=bool)
+    first[1:] = sorted_codes[1:] != sorted_codes[:-1]
+    return np.sort(order[first])
+
+def all_pairs(n):
+    """
+    Every pair of members, in the same order as itertools.combinations
+    """
+    idx0, idx1 = np.triu_indices(n, k=1)
+    return idx0.astype(np.int64), idx1.astype(np.int64)
+
+def _draw_partners(n, need, rng, seen, groups=None, same_group=None, max_rounds=20):
+    # Gives member i up to need[i] new partners whose pairs are not in `seen` (a sorted array of pair codes).
+    # Candidates are drawn in vectorized rounds; members still short after max_rounds (or once most draws are
+    # rejected) get an exact pass over their remaining partners, so this always terminates even when a member has
+    # fewer partners left than requested
+    need = np.array(need, dtype=np.int64)
+    owners_out = []
+    partners_out = []
+
+    for _ in range(max_rounds):
+        active = np.flatnonzero(need > 0)
+        if len(active) == 0:
+            break
+
+        owners = np.repeat(active, need[active])
+        partners = rng.integers(0, n - 1, size=len(owners))
+        partners += partners >= owners
+
+        keep = np.ones(len(owners), dtype=bool)
+        if groups is not None:
+            keep &= (groups[owners] == groups[partners]) == same_group
+        eligible = keep.sum()
+        codes = _pair_codes(owners, partners, n)
+        keep &= ~_in_sorted(codes, seen)
+
+        candidates = np.flatnonzero(keep)
+        accepted = candidates[_first_occurrences(codes[candidates])]
+
+        owners_out.append(owners[accepted])
+        partners_out.append(partners[accepted])
+        need -= np.bincount(owners[accepted], minlength=n)
+        seen = np.sort(np.concatenate([seen, codes[accepted]]))
+        # In dense designs most draws hit pairs already taken, and the exact pass is cheaper
+        if len(accepted) < eligible // 4:
+            break
+
+    # The exact pass looks up each member's partners in an adjacency list of seen, built once, and tracks the
+    # pairs it takes per member; seen is merged once at the end, since re-sorting it for every member would be
+    # quadratic in the number of pairs
+    needy = np.flatnonzero(need > 0)
+    if len(needy) > 0:
+        low, high = np.divmod(seen, n)
+        ends = np.concatenate([low, high])
+        order = np.argsort(ends, kind="stable")
+        neighbours = np.concatenate([high, low])[order]
+        starts = np.searchsorted(ends[order], np.arange(n + 1))
+        taken = {}
+        exact = len(owners_out)
+    for i in needy:
+        available = np.ones(n, dtype=bool)
+        available[i] = False
+        available[neighbours[starts[i]:starts[i + 1]]] = False
+        available[taken.get(i, [])] = False
+        if groups is not None:
+            available &= (groups == groups[i]) == same_group
+        chosen = rng.permutation(np.flatnonzero(available))[:need[i]]
+
+        owners_out.append(np.full(len(chosen), i, dtype=np.int64))
+        partners_out.append(chosen.astype(np.int64))
+        for partner in chosen.tolist():
+            taken.setdefault(partner, []).append(i)
+    if len(needy) > 0:
+        seen = np.sort(np.concatenate([seen] + [_pair_codes(owners, partners, n)
+                                               for owners, partners in zip(owners_out[exact:], partners_out[exact:])]))
+
+    owners = np.concatenate(owners_out) if owners_out else np.zeros(0, dtype=np.int64)
+    partners = np.concatenate(partners_out) if partners_out else np.zeros(0, dtype=np.int64)
+    return owners, partners, seen
+
+def _by_owner(owners, partners):
+    order = np.argsort(owners, kind="stable")
+    return owners[order], partners[order]
+
+def sample_per_item(n, k, rng):
+    """
+    Each member starts k matchups with distinct partners (n * k pairs in total), skipping pairs already drawn.
+    Members with fewer than k partners left get as many as remain
+    """
+    owners, partners, _ = _draw_partners(n, np.full(n, min(k, n - 1)), rng, np.zeros(0, dtype=np.int64))
+    return _by_owner(owners, partners)
+
+def sample_balanced(n, k, rng):
+    """
+    k-regular design: every member appears in exactly k matchups (n * k / 2 pairs), built from
+    circulant shifts of a random permutation. k is capped at n - 1, and when both n and k are odd
+    one member appears in k - 1 matchups. With k >= 2 the design is connected
+    """
+    k = min(k, n - 1)
+    perm = rng.permutation(n).astype(np.int64)
+    positions = np.arange(n)
+    idx0 = []
+    idx1 = []
+
+    # Shift 1 is a Hamiltonian cycle over the random permutation, so the design is always connected. The other
+    # shifts are distinct random ones rather than 2, 3, ..., k / 2: consecutive shifts give a ring lattice whose
+    # diameter grows with n, which leaves distant members poorly connected on the latent scale.
+    # With odd n and odd k, the shift (n - 1) / 2 is left for the extra matching below
+    max_shift = (n - 1) // 2 - (n % 2 == 1 and k % 2 == 1)
+    shifts = []
+    if k // 2 > 0:
+        shifts = np.concatenate([[1], np.sort(rng.choice(np.arange(2, max_shift + 1), size=k // 2 - 1, replace=False))])
+    for shift in shifts:
+        idx0.append(perm)
+        idx1.append(perm[(positions + shift) % n])
+
+    if k % 2 == 1:
+        # The "diameter" shift pairs each member with the one opposite it
+        half = n // 2
+        idx0.append(perm[:half])
+        idx1.append(perm[(np.arange(half) + half) % n] if n % 2 == 0 else perm[half:2*half])
+
+    if not idx0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(idx0), np.concatenate(idx1)
+
+def sample_uniform(n, k, rng):
+    """
+    n * k / 2 distinct pairs drawn uniformly from all pairs
+    """
+    total = n * (n - 1) // 2
+    m = min(n * k // 2, total)
+
+    if m > total // 2:
+        idx0, idx1 = all_pairs(n)
+        chosen = np.sort(rng.choice(total, size=m, replace=False))
+        return idx0[chosen], idx1[chosen]
+
+    codes = np.zeros(0, dtype=np.int64)
+    while len(codes) < m:
+        a = rng.integers(0, n, size=2 * (m - len(codes)))
+        b = rng.integers(0, n, size=len(a))
+        keep = a != b
+        new_codes = _pair_codes(a[keep], b[keep], n)
+        codes = np.concatenate([codes, new_codes])
+        codes = codes[_first_occurrences(codes)]
+    codes = rng.permutation(codes)[:m]
+    return codes // n, codes % n
+
+def sample_stratified(n, k, groups, rng, within_share=0.5):
+    """
+    Each member starts round(k * within_share) matchups with members of its own group (e.g. party)
+    and the rest with members of other groups
+    """
+    groups = np.asarray(groups)
+    k = min(k, n - 1)
+    k_within = int(round(k * within_share))
+    k_cross = k - k_within
+
+    seen = np.zeros(0, dtype=np.int64)
+    owners_w, partners_w, seen = _draw_partners(n, np.full(n, k_within), rng, seen, groups=groups, same_group=True)
+    owners_c, partners_c, seen = _draw_partners(n, np.full(n, k_cross), rng, seen, groups=groups, same_group=False)
+    return _by_owner(np.concatenate([owners_w, owners_c]), np.concatenate([partners_w, partners_c]))
+
+def sample_matchups(n, k, strategy="per_item", seed=None, groups=None, within_share=0.5):
+    """
+    Returns (idx0, idx1, flip): member indices of each matchup and whether to swap the order in which
+    the pair is presented. Results are reproducible from the seed
+    """
+    rng = np.random.default_rng(seed)
+
+    if k is None:
+        idx0, idx1 = all_pairs(n)
+    elif strategy == "per_item":
+        idx0, idx1 = sample_per_item(n, k, rng)
+    elif strategy == "balanced":
+        idx0, idx1 = sample_balanced(n, k, rng)
+    elif strategy == "uniform":
+        idx0, idx1 = sample_uniform(n, k, rng)
+    elif strategy == "stratified":
+        if groups is None:
+            raise ValueError("The 'stratified' sampling strategy requires groups.")
+        idx0, idx1 = sample_stratified(n, k, groups, rng, within_share)
+    else:
+        raise ValueError(f"'sampling_strategy' must be one of {SAMPLING_STRATEGIES}.")
+
+    flip = rng.random(len(idx0)) < 0.5
+    return idx0, idx1, flip
+
+def sample_anchor_partners(new, anchors, k, rng):
+    """
+    Pairs each new member with k existing members (anchors, ordered e.g. by their previous abilities): the
+    anchors are split into k contiguous strata and one is drawn from each, so partners span the whole scale.
+    k=None (or k >= len(anchors)) pairs each new member with every anchor
+    """
+    new = np.asarray(new, dtype=np.int64)
+    anchors = np.asarray(anchors, dtype=np.int64)
+    if k is None or k >= len(anchors):
+        return np.repeat(new, len(anchors)), np.tile(anchors, len(new))
+
+    bounds = np.linspace(0, len(anchors), k + 1).astype(np.int64)
+    low, high = bounds[:-1], bounds[1:]
+    picks = low + (rng.random((len(new), k)) * (high - low)).astype(np.int64)
+    return np.repeat(new, k), anchors[picks.ravel()]
+
+class PairColumn(Sequence):
+    """
+    Read-only list of (id, id) tuples for matchups stored as member indices, built when accessed.
+    With sort=True each pair is in sorted-ID order
+    """
+    def __init__(self, ids, idx0, idx1, sort=False):
+        self.ids = ids
+        self.idx0 = idx0
+        self.idx1 = idx1
+        self.sort = sort
+
+    def __len__(self):
+        return len(self.idx0)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._pair(a, b) for a, b in zip(self.ids[self.idx0[i]].tolist(), self.ids[self.idx1[i]].tolist())]
+        return self._pair(self.ids[self.idx0[i]], self.ids[self.idx1[i]])
+
+    def __iter__(self):
+        for start in range(0, len(self.idx0), 10000):
+            yield from self[start:start + 10000]
+
+    def _pair(self, a, b):
+        return (b, a) if self.sort and b < a else (a, b)
@@ -0,0 +1,204 @@
+from collections.abc import Sequence
+from string import Formatter
+
+import numpy as np
+import pandas as pd
+
+class PromptRenderer:
+    """
+    Renders str.format-style prompt templates for many matchups at once. Each template is parsed once,
+    and every field is formatted once per member rather than once per prompt.
+    Fields ending in 0 or 1 (e.g. {name0}) take the member field of that side of the matchup
+    ({name0} -> member_fields["name"][idx0]); any other field is looked up in constants
+    """
+    def __init__(self, member_fields, constants=None):
+        self.member_fields = {name: list(values) for name, values in member_fields.items()}
+        self.constants = dict(constants or {})
+        self._formatter = Formatter()
+        self._compiled = {}
+        self._columns = {}
+        self._arrow_columns = {}
+
+    def compile(self, template):
+        # Returns (format string with one %s per field, [(field key, side or None), ...])
+        if template not in self._compiled:
+            fmt = []
+            fields = []
+            for literal, field_name, format_spec, conversion in self._formatter.parse(template):
+                fmt.append(literal.replace("%", "%%"))
+                if field_name is None:
+                    continue
+                if field_name == "" or field_name.isdigit():
+                    raise ValueError(f"Prompt templates must use named fields, not positional ones: {template!r}")
+                fmt.append("%s")
+                fields.append(self._field_column(field_name, format_spec, conversion))
+            self._compiled[template] = ("".join(fmt), fields)
+        return self._compiled[template]
+
+    def _field_column(self, field_name, format_spec, conversion):
+        # Pre-formats a field for every member (or once, for constants), exactly as str.format would
+        key = (field_name, format_spec, conversion)
+        if key not in self._columns:
+            base = field_name.split(".", 1)[0].split("[", 1)[0]
+            side = None
+            if base in self.constants:
+                values = [self.constants[base]]
+            elif base[-1:] in ("0", "1") and base[:-1] in self.member_fields:
+                side = int(base[-1])
+                values = self.member_fields[base[:-1]]
+            else:
+                raise KeyError(base)
+
+            column = []
+            for value in values:
+                value, _ = self._formatter.get_field(field_name, (), {base: value})
+                value = self._formatter.convert_field(value, conversion)
+                column.append(self._formatter.format_field(value, format_spec))
+            self._columns[key] = (np.array(column, dtype=object), side)
+        return self._columns[key]
+
+    def render(self, template, idx0, idx1):
+        """
+        Renders template for the matchups (idx0[k], idx1[k]), given as member indices, in one columnar pass
+        """
+        fmt, fields = self.compile(template)
+        n = len(idx0)
+        if not fields:
+            return [fmt % ()] * n
+
+        columns = []
+        for column, side in fields:
+            if side is None:
+                columns.append([column[0]] * n)
+            else:
+                columns.append(column[idx0 if side == 0 else idx1].tolist())
+        return [fmt % row for row in zip(*columns)]
+
+    def render_choice(self, templates, choice, idx0, idx1):
+        """
+        Renders templates[choice[k]] for matchup k, e.g. a liberal or a conservative prompt per matchup
+        """
+        choice = np.asarray(choice)
+        idx0 = np.asarray(idx0)
+        idx1 = np.asarray(idx1)
+        if len(templates) == 1:
+            return self.render(templates[0], idx0, idx1)
+
+        prompts = np.empty(len(idx0), dtype=object)
+        for c, template in enumerate(templates):
+            rows = np.flatnonzero(choice == c)
+            if len(rows) > 0:
+                prompts[rows] = self.render(template, idx0[rows], idx1[rows])
+        return prompts.tolist()
+
+    def render_array(self, templates, choice, idx0, idx1):
+        """
+        Renders like render_choice, but returns a pandas string array. With pyarrow the prompts are joined in
+        Arrow from the pre-formatted member fields instead of being formatted one by one in Python
+        """
+        choice = np.asarray(choice)
+        idx0 = np.asarray(idx0)
+        idx1 = np.asarray(idx1)
+        try:
+            import pyarrow as pa
+        except ImportError:
+            return pd.array(np.array(self.render_choice(templates, choice, idx0, idx1), dtype=object), dtype="str")
+
+        layouts = [self._layout(template) for template in templates]
+        if all(keys == layouts[0][1] for _, keys in layouts):
+            # Templates that differ only in their literals (e.g. "liberal" and "conservative") are joined in one pass
+            return pd.array(self._join_arrow(pa, templates, layouts, choice, idx0, idx1), dtype="str")
+
+        parts = []
+        order = []
+        for c, template in enumerate(templates):
+            rows = np.flatnonzero(choice == c)
+            if len(rows) > 0:
+                parts.append(self._join_arrow(pa, [template], [layouts[c]], np.zeros(len(rows), dtype=np.int64),
+                                              idx0[rows], idx1[rows]))
+                order.append(rows)
+        if not parts:
+            return pd.array(np.array([], dtype=object), dtype="str")
+        order = np.concatenate(order)
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        return pd.array(pa.concat_arrays(parts).take(position), dtype="str")
+
+    def _layout(self, template):
+        # Returns ([literal before each field and after the last one], [field key, ...])
+        self.compile(template)
+        literals = [""]
+        keys = []
+        for literal, field_name, format_spec, conversion in self._formatter.parse(template):
+            literals[-1] += literal
+            if field_name is not None:
+                keys.append((field_name, format_spec, conversion))
+                literals.append("")
+        return literals, keys
+
+    def _join_arrow(self, pa, templates, layouts, choice, idx0, idx1):
+        # Joins the literals of templates[choice[k]] and the member field columns (taken at idx0/idx1) element-wise;
+        # the templates must share one field layout. large_string, so that millions of long prompts do not
+        # overflow 32-bit offsets
+        import pyarrow.compute as pc
+
+        string = pa.large_string()
+        pieces = []
+        for slot, key in enumerate(layouts[0][1] + [None]):
+            literals = [literals[slot] for literals, _ in layouts]
+            if len(set(literals)) > 1:
+                pieces.append(pa.array(literals, type=string).take(choice))
+            elif literals[0]:
+                pieces.append(pa.scalar(literals[0], type=string))
+            if key is None:
+                continue
+            column, side = self._field_column(*key)
+            if side is None:
+                pieces.append(pa.scalar(column[0], type=string))
+                continue
+            if key not in self._arrow_columns:
+                self._arrow_columns[key] = pa.array(column, type=string)
+            pieces.append(self._arrow_columns[key].take(idx0 if side == 0 else idx1))
+        if not any(isinstance(piece, pa.Array) for piece in pieces):
+            return pa.array(self.render_choice(templates, choice, idx0, idx1), type=string)
+        return pc.binary_join_element_wise(*pieces, pa.scalar("", type=string))
+
+    def iter_render(self, templates, choice, idx0, idx1, chunk_size=10000):
+        """
+        Generator version of render_choice that renders chunk_size prompts at a time
+        """
+        for start in range(0, len(idx0), chunk_size):
+            stop = start + chunk_size
+            yield from self.render_choice(templates, choice[start:stop], idx0[start:stop], idx1[start:stop])
+
+class PromptColumn(Sequence):
+    """
+    Read-only list of prompts that are rendered when accessed instead of being kept in memory
+    """
+    def __init__(self, renderer, templates, choice, idx0, idx1):
+        self.renderer = renderer
+        self.templates = templates
+        self.choice = np.asarray(choice)
+        self.idx0 = np.asarray(idx0)
+        self.idx1 = np.asarray(idx1)
+
+    def __len__(self):
+        return len(self.idx0)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.renderer.render_choice(self.templates, self.choice[i], self.idx0[i], self.idx1[i])
+        fmt, fields = self.renderer.compile(self.templates[self.choice[i]])
+        return fmt % tuple(column[0] if side is None else column[self.idx0[i] if side == 0 else self.idx1[i]]
+                           for column, side in fields)
+
+    def __iter__(self):
+        return self.renderer.iter_render(self.templates, self.choice, self.idx0, self.idx1)
+
+    def to_array(self, indices=None):
+        """
+        The prompts at indices (all of them if None) as a pandas string array, rendered in one columnar pass
+        """
+        if indices is None:
+            return self.renderer.render_array(self.templates, self.choice, self.idx0, self.idx1)
+        return self.renderer.render_array(self.templates, self.choice[indices], self.idx0[indices], self.idx1[indices])
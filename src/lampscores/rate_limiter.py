@@ -0,0 +1,218 @@
+import asyncio
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+
+class AdaptiveRateLimiter:
+    """
+    AIMD concurrency controller with request/token buckets, tuned from rate-limit headers and 429/5xx responses
+    """
+    def __init__(self,
+                 max_concurrency=100,
+                 min_concurrency=1,
+                 initial_concurrency=None,
+                 requests_per_minute=None,
+                 tokens_per_minute=None,
+                 increase_step=1,
+                 decrease_factor=0.5,
+                 headroom=0.9,
+                 max_backoff=60.0):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = initial_concurrency or max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.headroom = headroom
+        self.max_backoff = max_backoff
+
+        self.in_flight = 0
+        self.rate_limited_count = 0
+        self.server_error_count = 0
+        self._successes_since_increase = 0
+        self._blocked_until = 0.0
+        self._request_bucket = None
+        self._token_bucket = None
+        self._last_refill = time.monotonic()
+        self._condition_obj = None
+        self._condition_loop = None
+
+    @property
+    def _condition(self):
+        # Created inside the running event loop on first use, like LLMOpenAIClient.semaphore
+        loop = asyncio.get_running_loop()
+        if self._condition_obj is None or self._condition_loop is not loop:
+            self._condition_obj = asyncio.Condition()
+            self._condition_loop = loop
+        return self._condition_obj
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens=0):
+        await self.acquire(estimated_tokens)
+        try:
+            yield
+        finally:
+            await self.release()
+
+    async def acquire(self, estimated_tokens=0):
+        async with self._condition:
+            while True:
+                wait = self._wait_time(estimated_tokens)
+                if wait == 0.0:
+                    self.in_flight += 1
+                    if self._request_bucket is not None:
+                        self._request_bucket -= 1
+                    if self._token_bucket is not None:
+                        self._token_bucket -= estimated_tokens
+                    return
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _wait_time(self, estimated_tokens):
+        # Returns 0.0 if a request may start now, otherwise how long to wait before checking again
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self.in_flight >= self.concurrency_limit:
+            return 1.0
+
+        self._refill(now)
+        if self._request_bucket is not None and self._request_bucket < 1:
+            return (1 - self._request_bucket) * 60.0 / (self.requests_per_minute * self.headroom)
+        if self._token_bucket is not None and estimated_tokens > 0:
+            # A request larger than the whole bucket only waits for the bucket to be full
+            capacity = self.tokens_per_minute * self.headroom
+            needed = min(estimated_tokens, capacity)
+            if self._token_bucket < needed:
+                return (needed - self._token_bucket) * 60.0 / capacity
+        return 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            capacity = self.requests_per_minute * self.headroom
+            if self._request_bucket is None:
+                self._request_bucket = capacity
+            self._request_bucket = min(capacity, self._request_bucket + elapsed * capacity / 60.0)
+        if self.tokens_per_minute:
+            capacity = self.tokens_per_minute * self.headroom
+            if self._token_bucket is None:
+                self._token_bucket = capacity
+            self._token_bucket = min(capacity, self._token_bucket + elapsed * capacity / 60.0)
+
+    def on_success(self, headers=None, estimated_tokens=0, used_tokens=None):
+        # Additive increase: one more slot after a full window of successful requests
+        self._successes_since_increase += 1
+        if self._successes_since_increase >= self.concurrency_limit:
+            self._successes_since_increase = 0
+            self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + self.increase_step)
+
+        if used_tokens is not None and self._token_bucket is not None:
+            self._token_bucket -= used_tokens - estimated_tokens
+
+        if headers is not None:
+            self._read_headers(headers)
+
+    def on_error(self, status_code=None, headers=None):
+        if status_code == 429:
+            self.rate_limited_count += 1
+            self._decrease(self.decrease_factor)
+            retry_after = self.retry_after(headers, status_code)
+            if retry_after is not None:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        elif status_code is not None and status_code >= 500:
+            self.server_error_count += 1
+            self._decrease((1 + self.decrease_factor) / 2)
+
+        if headers is not None:
+            self._read_headers(headers)
+
+    def _decrease(self, factor):
+        self._successes_since_increase = 0
+        self.concurrency_limit = max(self.min_concurrency, int(self.concurrency_limit * factor))
+
+    def _read_headers(self, headers):
+        # OpenAI-style x-ratelimit-* headers; providers that do not send them are tuned from 429s alone
+        limit_requests = self._header_number(headers, "x-ratelimit-limit-requests")
+        limit_tokens = self._header_number(headers, "x-ratelimit-limit-tokens")
+        if limit_requests:
+            self.requests_per_minute = limit_requests
+        if limit_tokens:
+            self.tokens_per_minute = limit_tokens
+
+        remaining_requests = self._header_number(headers, "x-ratelimit-remaining-requests")
+        if remaining_requests is not None and remaining_requests <= 0:
+            reset = self._parse_duration(headers.get("x-ratelimit-reset-requests"))
+            if reset is not None:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + reset)
+
+        remaining_tokens = self._header_number(headers, "x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None and self.tokens_per_minute:
+            self._refill(time.monotonic())
+            self._token_bucket = min(self._token_bucket, remaining_tokens)
+
+    def retry_after(self, headers, status_code=None):
+        # Seconds to wait before retrying, from Retry-After or, for a 429, from the reset time of the exhausted
+        # limit. x-ratelimit-* headers come with every response, so otherwise None (jittered exponential backoff)
+        if headers is None:
+            return None
+        retry_after_ms = self._header_number(headers, "retry-after-ms")
+        if retry_after_ms is not None:
+            return retry_after_ms / 1000.0
+        retry_after = self._header_number(headers, "retry-after")
+        if retry_after is not None:
+            return retry_after
+        if status_code != 429:
+            return None
+
+        resets = []
+        for limit in ("requests", "tokens"):
+            remaining = self._header_number(headers, f"x-ratelimit-remaining-{limit}")
+            reset = self._parse_duration(headers.get(f"x-ratelimit-reset-{limit}"))
+            if remaining is not None and remaining <= 0 and reset is not None:
+                resets.append(reset)
+        return max(resets) if resets else None
+
+    @staticmethod
+    def _header_number(headers, name):
+        value = headers.get(name)
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _parse_duration(value):
+        # Durations such as "1s", "6m0s", or "20ms"
+        if not value:
+            return None
+        units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+        parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+        if not parts:
+            return None
+        return sum(float(number) * units[unit] for number, unit in parts)
+
+    def backoff_time(self, attempt, backoff=2.0):
+        # Jittered ("full jitter") exponential backoff
+        return random.uniform(0, min(self.max_backoff, backoff * 2 ** (attempt - 1)))
+
+    def current_limits(self):
+        return {"concurrency_limit": self.concurrency_limit,
+                "in_flight": self.in_flight,
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "rate_limited_count": self.rate_limited_count,
+                "server_error_count": self.server_error_count,
+                "blocked_for": max(0.0, self._blocked_until - time.monotonic())}
@@ -0,0 +1,193 @@
+import io
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pandas as pd
+
+class ReferenceDataStore:
+    """
+    Local copies of the Voteview member lists and the congress-legislators canonical names.
+    Datasets are stored as Parquet (or pickle when no Parquet engine is installed) with a JSON record of
+    each download's ETag/Last-Modified. Copies younger than revalidate_after seconds are used without any
+    network access; older ones are revalidated with a conditional request, and kept if the server answers
+    304 or cannot be reached. With offline=True (or LAMPSCORES_OFFLINE=1) the network is never used, so the
+    directory must be pre-seeded, either by prefetch() or by copying the original CSV files into it
+    """
+    VOTEVIEW_URL = "https://voteview.com/static/data/out/members/{chamber}{congress}_members.csv"
+    LEGISLATORS_CURRENT_URL = "https://unitedstates.github.io/congress-legislators/legislators-current.csv"
+    LEGISLATORS_HISTORICAL_URL = "https://unitedstates.github.io/congress-legislators/legislators-historical.csv"
+
+    def __init__(self, directory=None, offline=None, revalidate_after=24 * 3600, timeout=30):
+        if directory is None:
+            directory = os.environ.get("LAMPSCORES_DATA_DIR", os.path.join(os.path.expanduser("~"), ".cache", "lampscores"))
+        if offline is None:
+            offline = os.environ.get("LAMPSCORES_OFFLINE", "") not in ("", "0", "false", "False")
+
+        self.directory = directory
+        self.offline = offline
+        self.revalidate_after = revalidate_after
+        self.timeout = timeout
+        self._metadata_path = os.path.join(self.directory, "metadata.json")
+        self._metadata = None
+        self._frames = {}
+        self._lock = threading.Lock()
+
+        try:
+            import pyarrow  # noqa: F401
+            self._format = "parquet"
+        except ImportError:
+            self._format = "pickle"
+
+    def voteview_members(self, chamber, congress):
+        """
+        The Voteview member list for one chamber ("S" or "H") and Congress
+        """
+        url = self.VOTEVIEW_URL.format(chamber=chamber, congress=congress)
+        return self._dataset(f"voteview_{chamber}{congress}_members", [url], lambda frames: frames[0])
+
+    def canonical_names(self):
+        """
+        (bioguide_id, bioname_canonical) for every current and historical legislator
+        """
+        def build(frames):
+            df = pd.concat(frames, ignore_index=True)
+            # Drops a trailing parenthetical, e.g. "John Smith (politician)" -> "John Smith"
+            df["bioname_canonical"] = df["wikipedia_id"].str.replace(r"\s*\([^()]*\)$", "", regex=True)
+            return df[["bioguide_id", "bioname_canonical"]].reset_index(drop=True)
+
+        return self._dataset("canonical_names", [self.LEGISLATORS_CURRENT_URL, self.LEGISLATORS_HISTORICAL_URL], build)
+
+    def prefetch(self, chambers=("S", "H"), congresses=()):
+        """
+        Downloads the canonical names and the given Voteview member lists, e.g. to seed a directory for offline use
+        """
+        self.canonical_names()
+        for chamber in chambers:
+            for congress in congresses:
+                self.voteview_members(chamber, congress)
+
+    def _dataset(self, name, urls, build):
+        # One store can be shared by runs loading data in several threads; each dataset is fetched once
+        with self._lock:
+            return self._load_dataset(name, urls, build)
+
+    def _load_dataset(self, name, urls, build):
+        # Returns the stored dataset, downloading or revalidating its sources first when they are stale
+        if name in self._frames:
+            return self._frames[name].copy()
+
+        metadata = self._load_metadata()
+        record = metadata.get(name)
+        stored = self._read_frame(name) if record is not None else None
+
+        if stored is not None and (self.offline or time.time() - record["checked_at"] < self.revalidate_after):
+            self._frames[name] = stored
+            return stored.copy()
+
+        if stored is None:
+            # A pre-seeded directory may hold the original CSV files instead
+            paths = [os.path.join(self.directory, url.rsplit("/", 1)[1]) for url in urls]
+            if all(os.path.exists(path) for path in paths):
+                frame = build([pd.read_csv(path) for path in paths])
+                self._save(name, frame, {"sources": {}, "checked_at": time.time()})
+                self._frames[name] = frame
+                return frame.copy()
+            if self.offline:
+                raise FileNotFoundError(f"'{name}' is not in {self.directory}, and offline mode is on. "
+                                        f"Run ReferenceDataStore.prefetch() with network access or copy {', '.join(urls)} there.")
+
+        sources = dict(record["sources"]) if record is not None else {}
+        contents = {}
+        try:
+            for url in urls:
+                content, sources[url] = self._fetch(url, sources.get(url) if stored is not None else None)
+                if content is not None:
+                    contents[url] = content
+            if contents:
+                # A derived dataset is rebuilt from all of its sources, including those that were unchanged
+                for url in urls:
+                    if url not in contents:
+                        contents[url], sources[url] = self._fetch(url, None)
+        except (urllib.error.URLError, OSError) as e:
+            if stored is None:
+                raise
+            print(f"Could not revalidate '{name}' ({e}); using the copy from {self.directory}", file=sys.stderr)
+            self._frames[name] = stored
+            return stored.copy()
+
+        frame = build([pd.read_csv(io.BytesIO(contents[url])) for url in urls]) if contents else None
+        self._save(name, frame, {"sources": sources, "checked_at": time.time()})
+        if frame is None:
+            frame = stored
+        self._frames[name] = frame
+        return frame.copy()
+
+    def _fetch(self, url, validators):
+        # Conditional GET. Returns (None, validators) if the server reports the copy as unchanged
+        request = urllib.request.Request(url)
+        if validators:
+            if validators.get("etag"):
+                request.add_header("If-None-Match", validators["etag"])
+            if validators.get("last_modified"):
+                request.add_header("If-Modified-Since", validators["last_modified"])
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.read(), {"etag": response.headers.get("ETag"),
+                                         "last_modified": response.headers.get("Last-Modified")}
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None, validators
+            raise
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.{'parquet' if self._format == 'parquet' else 'pkl'}")
+
+    def _read_frame(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path) if self._format == "parquet" else pd.read_pickle(path)
+
+    def _save(self, name, frame, record):
+        os.makedirs(self.directory, exist_ok=True)
+        if frame is not None:
+            # Written under a temporary name first so an interrupted write never leaves a truncated dataset
+            path = self._path(name)
+            if self._format == "parquet":
+                frame.to_parquet(path + ".tmp", index=False)
+            else:
+                frame.to_pickle(path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+        metadata = self._load_metadata()
+        metadata[name] = record
+        with open(self._metadata_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=1)
+        os.replace(self._metadata_path + ".tmp", self._metadata_path)
+
+    def _load_metadata(self):
+        if self._metadata is None:
+            self._metadata = {}
+            if os.path.exists(self._metadata_path):
+                with open(self._metadata_path, encoding="utf-8") as f:
+                    self._metadata = json.load(f)
+        return self._metadata
+
+    def clear(self):
+        """
+        Deletes every stored dataset
+        """
+        for name in list(self._load_metadata()):
+            path = self._path(name)
+            if os.path.exists(path):
+                os.remove(path)
+        self._metadata = {}
+        self._frames = {}
+        if os.path.exists(self._metadata_path):
+            os.remove(self._metadata_path)
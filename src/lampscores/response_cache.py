@@ -0,0 +1,108 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+class ResponseCache:
+    """
+    On-disk (SQLite) cache of chat completion responses, keyed by a hash of
+    (model, messages, temperature, top_p, sample index)
+    """
+    def __init__(self,
+                 path="lampscores_cache.sqlite",
+                 max_entries=None,
+                 max_bytes=None,
+                 max_age=None,
+                 evict_every=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age  # in seconds
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_evict = 0
+
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                          "key TEXT PRIMARY KEY, "
+                          "response TEXT NOT NULL, "
+                          "size INTEGER NOT NULL, "
+                          "created_at REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model, messages, temperature, top_p, sample_index=0, response_format=None):
+        request = {"model": model,
+                   "messages": messages,
+                   "temperature": temperature,
+                   "top_p": top_p,
+                   "sample_index": sample_index}
+        # Only structured-output requests include a response format, so other keys are unchanged
+        if response_format is not None:
+            request["response_format"] = response_format
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        row = self.conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+
+        if row is not None and self.max_age is not None and time.time() - row[1] > self.max_age:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.conn.commit()
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return row[0]
+
+    def set(self, key, response):
+        if response is None:
+            return
+        self.conn.execute("INSERT OR REPLACE INTO responses (key, response, size, created_at) VALUES (?, ?, ?, ?)",
+                          (key, response, len(response.encode("utf-8")), time.time()))
+        self.conn.commit()
+
+        self._writes_since_evict += 1
+        if self._writes_since_evict >= self.evict_every:
+            self.evict()
+
+    def evict(self):
+        self._writes_since_evict = 0
+
+        # Age-based eviction
+        if self.max_age is not None:
+            self.conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+
+        # Size-based eviction drops the oldest entries first
+        if self.max_entries is not None:
+            self.conn.execute("DELETE FROM responses WHERE key IN ("
+                              "SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                              (self.max_entries,))
+        if self.max_bytes is not None:
+            self.conn.execute("DELETE FROM responses WHERE key IN ("
+                              "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY created_at DESC) AS running "
+                              "FROM responses) WHERE running > ?)",
+                              (self.max_bytes,))
+        self.conn.commit()
+
+    def stats(self):
+        entries, total_bytes = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "bytes": total_bytes}
+
+    def clear(self):
+        self.conn.execute("DELETE FROM responses")
+        self.conn.commit()
+
+    def close(self):
+        self.evict()
+        self.conn.close()
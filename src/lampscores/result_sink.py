@@ -0,0 +1,202 @@
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+# Columns that repeat a few values across many rows, stored dictionary-encoded (categorical in pandas)
+CATEGORICAL_COLUMNS = ("name0", "name1", "bioguide_id0", "bioguide_id1", "chamber0", "chamber1", "party0", "party1",
+                       "extracted_answer", "comparison_direction")
+# Long free-text columns, which can be kept in a separate file linked by matchup_id
+TEXT_COLUMNS = ("prompt", "llm_response")
+FORMATS = {".parquet": "parquet", ".pq": "parquet", ".arrow": "arrow", ".arrows": "arrow", ".ipc": "arrow", ".csv": "csv"}
+
+def _format_of(path, format):
+    if format is None:
+        format = FORMATS.get(os.path.splitext(path)[1].lower())
+        if format is None:
+            raise ValueError(f"Cannot tell the format of '{path}'; pass format='parquet', 'arrow', or 'csv'.")
+    if format not in ("parquet", "arrow", "csv"):
+        raise ValueError("'format' must be one of 'parquet', 'arrow', or 'csv'.")
+    return format
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Arrow results require pyarrow; install it with 'pip install lampscores[parquet]' "
+                          "or use format='csv'.") from None
+    return pyarrow
+
+def compact_results(df):
+    """
+    A copy of a matchup results table with the member and answer columns as categoricals
+    """
+    df = df.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    return df
+
+class ResultSink:
+    """
+    Writes matchup results to Parquet (row groups), an Arrow IPC stream (record batches), or CSV as they are
+    produced, so a run never has to hold or encode the whole table at once. Rows passed to write() are buffered
+    and written every row_group_size rows. Member and answer columns are dictionary-encoded. With text_path, the
+    prompt and llm_response columns go to a second file of the same format, linked to the results by matchup_id.
+    The format is taken from the file extension (.parquet, .arrow/.arrows, .csv) unless given
+    """
+    def __init__(self, path, format=None, text_path=None, row_group_size=65536):
+        if row_group_size < 1:
+            raise ValueError("'row_group_size' must be at least 1.")
+        self.path = path
+        self.format = _format_of(path, format)
+        self.text_path = text_path
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._buffer = []
+        self._buffered = 0
+        self._writers = {}
+        self._schemas = {}
+        if self.format != "csv":
+            self._pa = _import_pyarrow()
+
+    def write(self, df):
+        """
+        Appends rows of a matchup results table; a matchup_id column is added from the index if there is none
+        """
+        if len(df) == 0:
+            return
+        if "matchup_id" not in df.columns:
+            df = df.copy()
+            df.insert(0, "matchup_id", np.asarray(df.index, dtype=np.int64))
+        self._buffer.append(df.reset_index(drop=True))
+        self._buffered += len(df)
+        while self._buffered >= self.row_group_size:
+            self._flush(self.row_group_size)
+
+    def flush(self):
+        if self._buffered > 0:
+            self._flush(self._buffered)
+
+    def _flush(self, size):
+        chunk = pd.concat(self._buffer, ignore_index=True) if len(self._buffer) > 1 else self._buffer[0]
+        rest = chunk.iloc[size:].reset_index(drop=True)
+        chunk = chunk.iloc[:size]
+        self._buffer = [rest] if len(rest) > 0 else []
+        self._buffered = len(rest)
+
+        if self.text_path is None:
+            self._write_chunk(self.path, chunk)
+        else:
+            text = [column for column in TEXT_COLUMNS if column in chunk.columns]
+            self._write_chunk(self.text_path, chunk[["matchup_id"] + text])
+            self._write_chunk(self.path, chunk.drop(columns=text))
+        self.rows += len(chunk)
+
+    def _write_chunk(self, path, chunk):
+        if self.format == "csv":
+            header = path not in self._writers
+            self._writers[path] = True
+            chunk.to_csv(path, mode="w" if header else "a", header=header, index=False, quoting=csv.QUOTE_MINIMAL)
+            return
+
+        pa = self._pa
+        if path not in self._writers:
+            self._schemas[path] = self._schema(chunk)
+            self._writers[path] = self._open_writer(path, self._schemas[path])
+        table = pa.Table.from_pandas(chunk, schema=self._schemas[path], preserve_index=False)
+        if self.format == "parquet":
+            self._writers[path].write_table(table, row_group_size=len(chunk))
+        else:
+            for batch in table.to_batches():
+                self._writers[path].write_batch(batch)
+
+    def _schema(self, chunk):
+        # Fixed from the first chunk; a column that is all missing there is taken to be text
+        pa = self._pa
+        fields = []
+        for field in pa.Schema.from_pandas(chunk, preserve_index=False):
+            if field.name in CATEGORICAL_COLUMNS:
+                field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+            elif pa.types.is_null(field.type):
+                field = field.with_type(pa.string())
+            fields.append(field)
+        return pa.schema(fields)
+
+    def _open_writer(self, path, schema):
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(path, schema, compression="zstd")
+        # The stream format, unlike the file format, allows each batch its own dictionaries
+        return self._pa.ipc.new_stream(path, schema, options=self._pa.ipc.IpcWriteOptions(compression="zstd"))
+
+    def close(self):
+        self.flush()
+        for writer in self._writers.values():
+            if writer is not True:
+                writer.close()
+        self._writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def write_results(df, path, format=None, text_path=None, row_group_size=65536):
+    """
+    Writes a matchup results table (e.g. matchup_results_df) with a ResultSink, adding matchup_id from its
+    row positions
+    """
+    with ResultSink(path, format=format, text_path=text_path, row_group_size=row_group_size) as sink:
+        for start in range(0, len(df), row_group_size):
+            chunk = df.iloc[start:start + row_group_size]
+            if "matchup_id" not in chunk.columns:
+                chunk = chunk.reset_index(drop=True)
+                chunk.insert(0, "matchup_id", np.arange(start, start + len(chunk), dtype=np.int64))
+            sink.write(chunk)
+    return path
+
+def read_results(path, format=None, text_path=None, columns=None):
+    """
+    Reads results written by ResultSink or write_results, ordered by matchup_id. Dictionary-encoded columns
+    become categoricals. columns selects a subset (e.g. only what a Bradley-Terry fit needs), and text_path
+    joins the text columns kept in a separate file back on
+    """
+    format = _format_of(path, format)
+    df = _read_table(path, format, columns)
+    if text_path is not None:
+        text_columns = None if columns is None else ["matchup_id"] + [c for c in columns if c in TEXT_COLUMNS]
+        if text_columns is None or len(text_columns) > 1:
+            text = _read_table(text_path, format, text_columns)
+            df = df.merge(text, how="left", on="matchup_id", validate="one_to_one")
+            # Back in their place in matchup_results_df, before extracted_answer
+            text = [c for c in text.columns if c != "matchup_id"]
+            rest = [c for c in df.columns if c not in text]
+            at = rest.index("extracted_answer") if "extracted_answer" in rest else len(rest)
+            df = df[rest[:at] + text + rest[at:]]
+    if "matchup_id" in df.columns:
+        df = df.sort_values("matchup_id", kind="stable", ignore_index=True)
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+def _read_table(path, format, columns):
+    if format == "csv":
+        if columns is None:
+            return pd.read_csv(path)
+        return pd.read_csv(path, usecols=lambda c: c in columns or c == "matchup_id")
+
+    pa = _import_pyarrow()
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(path)
+        selected = None if columns is None else [c for c in schema.names if c in columns or c == "matchup_id"]
+        table = pq.read_table(path, columns=selected)
+    else:
+        with pa.ipc.open_stream(path) as reader:
+            table = reader.read_all()
+        if columns is not None:
+            table = table.select([c for c in table.schema.names if c in columns or c == "matchup_id"])
+    return table.to_pandas()
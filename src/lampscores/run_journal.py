@@ -0,0 +1,57 @@
+import json
+import os
+
+class RunJournal:
+    """
+    Append-only JSONL log of completed comparisons and extractions, used to resume interrupted runs
+    """
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.records = {}
+
+        if resume and os.path.exists(self.path):
+            self.records = self.load()
+            mode = "a"
+        else:
+            mode = "w"
+
+        self.file = open(self.path, mode, encoding="utf-8")
+
+    def load(self):
+        # Later records for the same (phase, index) supersede earlier ones, e.g. an extraction that was retried
+        records = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A partially written final line from a crash is ignored
+                    continue
+                records[(record["phase"], record["index"])] = record
+        return records
+
+    def append(self, phase, index, matchup, result, error=None):
+        record = {"phase": phase,
+                  "index": index,
+                  "matchup": list(matchup),
+                  "status": "failed" if error is not None else "ok",
+                  "result": result,
+                  "error": None if error is None else str(error)}
+        self.records[(phase, index)] = record
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def completed(self, phase, index, matchup):
+        record = self.records.get((phase, index))
+        if record is None or record["status"] != "ok":
+            return None
+        if tuple(record["matchup"]) != tuple(matchup):
+            raise ValueError(f"Journal {self.path} does not match the current matchups. "
+                             "Resuming requires the same data, prompts, and randomize_pairwise_order_seed.")
+        return record
+
+    def close(self):
+        self.file.close()
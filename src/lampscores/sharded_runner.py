@@ -0,0 +1,456 @@
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+
+import pandas as pd
+
+from .lampscores import LaMPscores
+
+# Member columns that create_matchups() and the prompts use; workers rebuild the matchups from these
+MEMBER_COLUMNS = ["bioname_canonical", "bioguide_id", "chamber", "congress", "party_code", "state_abbrev"]
+
+# LaMPscores arguments that each worker chooses for itself; all others define the run and are stored in the queue
+WORKER_ARGUMENTS = ("concurrency", "progress_callback", "cache", "rate_limiter", "backend", "batch_poll_interval",
+                    "coalesce", "telemetry")
+
+class ShardQueue:
+    """
+    Durable (SQLite) queue of shards, i.e. ranges of matchup indices. A worker claims a shard with a lease of
+    lease_seconds, which it renews while working; if the worker crashes, the lease expires and another worker
+    reclaims the shard. A shard is marked failed after max_attempts attempts. The rollback journal is used
+    rather than WAL so several machines can share the file over a network filesystem with working locks;
+    their clocks should agree to within a small fraction of lease_seconds. Its methods block (for up to timeout
+    seconds while another worker holds the lock), so async code calls them through asyncio.to_thread; the
+    connection is shared by those threads, one call at a time
+    """
+    def __init__(self, path, lease_seconds=600, max_attempts=3, timeout=60):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS shards ("
+                          "shard INTEGER PRIMARY KEY, "
+                          "start INTEGER NOT NULL, "
+                          "stop INTEGER NOT NULL, "
+                          "status TEXT NOT NULL DEFAULT 'pending', "
+                          "worker TEXT, "
+                          "lease_expires REAL, "
+                          "attempts INTEGER NOT NULL DEFAULT 0, "
+                          "result TEXT, "
+                          "error TEXT, "
+                          "updated_at REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS shards_status ON shards (status, lease_expires)")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same shard
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _execute(self, sql, parameters=()):
+        # Number of rows changed
+        with self.lock:
+            return self.conn.execute(sql, parameters).rowcount
+
+    def _fetch(self, sql, parameters=()):
+        with self.lock:
+            return self.conn.execute(sql, parameters).fetchall()
+
+    def get_meta(self, key):
+        rows = self._fetch("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def initialize(self, total, shard_size, meta):
+        """
+        Stores meta and splits range(total) into shards, unless the queue already holds a run
+        """
+        with self._transaction() as conn:
+            if conn.execute("SELECT COUNT(*) FROM meta").fetchone()[0] > 0:
+                return False
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+            conn.executemany("INSERT INTO shards (shard, start, stop) VALUES (?, ?, ?)",
+                             ((k, start, min(start + shard_size, total))
+                              for k, start in enumerate(range(0, total, shard_size))))
+        return True
+
+    def claim(self, worker):
+        """
+        Leases the next available shard to worker and returns (shard, start, stop), or None if there is none
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE shards SET status = 'failed', worker = NULL, lease_expires = NULL, updated_at = ?, "
+                         "error = 'Lease expired on every attempt' "
+                         "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                         (now, now, self.max_attempts))
+            row = conn.execute("SELECT shard, start, stop FROM shards "
+                               "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                               "ORDER BY attempts, shard LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE shards SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                         "updated_at = ? WHERE shard = ?", (worker, now + self.lease_seconds, now, row[0]))
+        return row
+
+    def renew(self, shard, worker):
+        # False if the lease has been lost, e.g. reclaimed by another worker after it expired
+        changed = self._execute("UPDATE shards SET lease_expires = ?, updated_at = ? "
+                                "WHERE shard = ? AND worker = ? AND status = 'leased'",
+                                (time.time() + self.lease_seconds, time.time(), shard, worker))
+        return changed > 0
+
+    def complete(self, shard, result):
+        # The first result for a shard is kept, even from a worker whose lease has expired
+        changed = self._execute("UPDATE shards SET status = 'done', result = ?, error = NULL, lease_expires = NULL, "
+                                "updated_at = ? WHERE shard = ? AND status != 'done'", (result, time.time(), shard))
+        return changed > 0
+
+    def fail(self, shard, worker, error):
+        self._execute("UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                      "worker = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+                      "WHERE shard = ? AND worker = ? AND status = 'leased'",
+                      (self.max_attempts, str(error), time.time(), shard, worker))
+
+    def retry_failed(self):
+        return self._execute("UPDATE shards SET status = 'pending', attempts = 0, updated_at = ? WHERE status = 'failed'",
+                             (time.time(),))
+
+    def counts(self):
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        for status, count in self._fetch("SELECT status, COUNT(*) FROM shards GROUP BY status"):
+            counts[status] = count
+        counts["total"] = sum(counts.values())
+        return counts
+
+    def unfinished(self):
+        return self._fetch("SELECT COUNT(*) FROM shards WHERE status IN ('pending', 'leased')")[0][0]
+
+    def results(self):
+        # (start, stop, result) of every finished shard
+        return self._fetch("SELECT start, stop, result FROM shards WHERE status = 'done' ORDER BY shard")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class ShardedLaMPscores:
+    """
+    Runs one large LaMPscores job across worker processes, possibly on several machines that share a filesystem.
+    submit() builds the matchups, splits them into shards of shard_size, and stores the shards with everything
+    needed to rebuild the run in a ShardQueue at path. Each worker (work(), run(), or "python -m
+    lampscores.sharded_runner work PATH") rebuilds the same matchups, then claims shards and runs them with its
+    own client, concurrency, rate limiter, and cache. merge() combines the finished shards into one
+    matchup_results_df.
+
+    Keyword arguments are LaMPscores arguments; those that define the run must be JSON-serializable (apart from
+    voteview_df and reference_data, which are only used by submit()). journal_path, resume, and adaptive are not
+    supported, since the queue itself records finished shards; to save the merged results as Parquet or Arrow, pass
+    merge()'s result to write_results
+    """
+    def __init__(self,
+                 path,
+                 model=None,
+                 shard_size=1000,
+                 lease_seconds=600,
+                 max_attempts=3,
+                 **lamp_kwargs):
+        for name in ("journal_path", "resume", "adaptive", "llm_client", "results_path", "results_text_path"):
+            if lamp_kwargs.get(name):
+                raise ValueError(f"'{name}' cannot be used with ShardedLaMPscores.")
+        if shard_size < 1:
+            raise ValueError("'shard_size' must be at least 1.")
+
+        self.path = path
+        self.model = model
+        self.shard_size = shard_size
+        self.worker_kwargs = {name: lamp_kwargs.pop(name) for name in WORKER_ARGUMENTS if name in lamp_kwargs}
+        self.voteview_df = lamp_kwargs.pop("voteview_df", None)
+        self.canonical_names = lamp_kwargs.pop("canonical_names", None)
+        self.reference_data = lamp_kwargs.pop("reference_data", None)
+        self.lamp_kwargs = lamp_kwargs
+        try:
+            json.dumps(self.lamp_kwargs)
+        except TypeError as e:
+            raise ValueError(f"ShardedLaMPscores arguments must be JSON-serializable: {e}") from None
+
+        self.queue = ShardQueue(path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+        self.matchup_results_df = None
+
+    @classmethod
+    def open(cls, path):
+        """
+        Opens a queue created by submit(), e.g. to run workers or merge on another machine
+        """
+        sharded = cls(path)
+        config = sharded.queue.get_meta("config")
+        if config is None:
+            raise ValueError(f"{path} does not hold a submitted run.")
+        config = json.loads(config)
+        sharded.model = config["model"]
+        sharded.shard_size = config["shard_size"]
+        sharded.lamp_kwargs = config["lamp_kwargs"]
+        sharded.queue.lease_seconds = config["lease_seconds"]
+        sharded.queue.max_attempts = config["max_attempts"]
+        return sharded
+
+    def submit(self):
+        """
+        Creates the shards, or checks that an existing queue at path holds the same run, so submitting again resumes it
+        """
+        lamp = LaMPscores(None,
+                          self.model,
+                          voteview_df=self.voteview_df,
+                          canonical_names=self.canonical_names,
+                          reference_data=self.reference_data,
+                          **self.lamp_kwargs)
+        lamp.load_data()
+        members = lamp.voteview_df[MEMBER_COLUMNS].reset_index(drop=True).to_json(orient="split", index=False)
+        config = json.dumps({"model": self.model,
+                             "shard_size": self.shard_size,
+                             "lease_seconds": self.queue.lease_seconds,
+                             "max_attempts": self.queue.max_attempts,
+                             "lamp_kwargs": self.lamp_kwargs})
+
+        existing = self.queue.get_meta("config")
+        if existing is not None and (existing != config or self.queue.get_meta("members") != members):
+            raise ValueError(f"{self.path} already holds a different run; use a new path.")
+
+        self._members = members
+        lamp = self._make_lamp(None)
+        lamp.create_matchups()
+        fingerprint = self._fingerprint(lamp)
+        total = len(lamp.matchup_idx0)
+        if self.queue.initialize(total, self.shard_size, {"config": config, "members": members, "fingerprint": fingerprint}):
+            print(f"Submitted {total} matchups in {self.queue.counts()['total']} shards to {self.path}")
+        else:
+            counts = self.queue.counts()
+            print(f"Resuming {self.path}: {counts['done']} of {counts['total']} shards already done")
+
+    def _make_lamp(self, client, **worker_kwargs):
+        # The same run, rebuilt from the stored member table, so every worker gets identical matchups and prompts
+        members = getattr(self, "_members", None) or self.queue.get_meta("members")
+        voteview_df = pd.read_json(io.StringIO(members), orient="split", dtype=False, convert_dates=False)
+        return LaMPscores(client,
+                          self.model,
+                          voteview_df=voteview_df,
+                          canonical_names=False,
+                          **self.lamp_kwargs,
+                          **worker_kwargs)
+
+    @staticmethod
+    def _fingerprint(lamp):
+        digest = hashlib.sha256()
+        digest.update(json.dumps(lamp.id_list.tolist()).encode("utf-8"))
+        digest.update(lamp.matchup_idx0.tobytes())
+        digest.update(lamp.matchup_idx1.tobytes())
+        return digest.hexdigest()
+
+    def _prepare_lamp(self, client, **worker_kwargs):
+        lamp = self._make_lamp(client, **worker_kwargs)
+        lamp.create_matchups()
+        if self._fingerprint(lamp) != self.queue.get_meta("fingerprint"):
+            raise ValueError(f"The matchups rebuilt from {self.path} do not match the submitted ones. "
+                             "Workers need the same versions of lampscores, pandas, and numpy as the coordinator.")
+        lamp.create_prompts()
+        return lamp
+
+    async def work(self, client, worker_id=None, poll_interval=5.0, quiet=False, **worker_kwargs):
+        """
+        Claims and runs shards until none are left, renewing each lease while its shard runs, and abandons a shard
+        whose lease is lost. Queue operations run in worker threads, so a busy queue does not stall the requests in
+        flight. quiet hides the per-phase messages of each shard. Returns the number of shards this worker finished
+        """
+        worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        worker_kwargs = {**self.worker_kwargs, **worker_kwargs}
+        if quiet and worker_kwargs.get("progress_callback") is None:
+            async def quiet_progress(completed, total):
+                pass
+            worker_kwargs["progress_callback"] = quiet_progress
+        lamp = await asyncio.to_thread(self._prepare_lamp, client, **worker_kwargs)
+
+        finished = 0
+        while True:
+            claim = await asyncio.to_thread(self.queue.claim, worker_id)
+            if claim is None:
+                if await asyncio.to_thread(self.queue.unfinished) == 0:
+                    break
+                # Other workers hold the remaining shards; wait in case one of their leases expires
+                await asyncio.sleep(poll_interval)
+                continue
+
+            shard, start, stop = claim
+            run = asyncio.create_task(self._run_shard(lamp, start, stop, quiet))
+            keep_lease = asyncio.create_task(self._keep_lease(shard, worker_id, run))
+            try:
+                await run
+            except asyncio.CancelledError:
+                if not keep_lease.done() or keep_lease.cancelled():
+                    raise
+                # The lease was lost and the shard belongs to another worker now
+                continue
+            except Exception as e:
+                traceback.print_exc()
+                await asyncio.to_thread(self.queue.fail, shard, worker_id, e)
+                print(f"Worker {worker_id}: shard {shard} failed: {e}")
+                continue
+            finally:
+                keep_lease.cancel()
+                run.cancel()
+
+            result = json.dumps({"pc_results": lamp.pc_results[start:stop],
+                                 "extraction_results": lamp.extraction_results[start:stop],
+                                 "extraction_error": lamp.extraction_error[start:stop]}, ensure_ascii=False)
+            if await asyncio.to_thread(self.queue.complete, shard, result):
+                finished += 1
+                print(f"Worker {worker_id}: shard {shard} done ({stop - start} matchups)")
+        return finished
+
+    @staticmethod
+    async def _run_shard(lamp, start, stop, quiet):
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            await lamp._run_llm(range(start, stop))
+
+    async def _keep_lease(self, shard, worker_id, run):
+        # Renews the lease until the shard's task ends, and stops the task if the lease is lost
+        while not run.done():
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            if not await asyncio.to_thread(self.queue.renew, shard, worker_id):
+                print(f"Worker {worker_id}: lease on shard {shard} was lost; abandoning it")
+                run.cancel()
+                return
+
+    def status(self):
+        return self.queue.counts()
+
+    async def run(self, workers=4, client_factory=None, poll_interval=5.0, **worker_kwargs):
+        """
+        Submits the run, starts workers local worker processes, and merges their results once every shard is
+        done or failed. client_factory (a picklable callable, by default openai.AsyncOpenAI) builds each
+        worker's client. Worker processes are started with "spawn", so scripts need an
+        if __name__ == "__main__" guard. Workers on other machines can join with "python -m
+        lampscores.sharded_runner work PATH"
+        """
+        self.submit()
+        processes = _start_workers(self.path, workers, client_factory, poll_interval, {**self.worker_kwargs, **worker_kwargs})
+        last = None
+        try:
+            while any(process.is_alive() for process in processes):
+                await asyncio.sleep(min(poll_interval, 1.0))
+                counts = await asyncio.to_thread(self.queue.counts)
+                if counts != last:
+                    print(f"Shards: {counts['done']}/{counts['total']} done, {counts['leased']} running, "
+                          f"{counts['failed']} failed")
+                    last = counts
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+        return self.merge()
+
+    def merge(self):
+        """
+        Combines the finished shards into matchup_results_df. Matchups in unfinished or failed shards are
+        recorded as failures (extraction_error 1)
+        """
+        lamp = self._prepare_lamp(None)
+        n = len(lamp.matchup_idx0)
+        lamp.pc_results = [None] * n
+        lamp.extraction_results = [None] * n
+        lamp.extraction_error = [1] * n
+        for start, stop, result in self.queue.results():
+            result = json.loads(result)
+            lamp.pc_results[start:stop] = result["pc_results"]
+            lamp.extraction_results[start:stop] = result["extraction_results"]
+            lamp.extraction_error[start:stop] = result["extraction_error"]
+
+        counts = self.queue.counts()
+        if counts["done"] < counts["total"]:
+            print(f"{counts['total'] - counts['done']} of {counts['total']} shards are not done; "
+                  "their matchups are recorded as failures")
+        lamp.make_final_df()
+        self.lamp = lamp
+        self.matchup_results_df = lamp.matchup_results_df
+        return self.matchup_results_df
+
+def _start_workers(path, workers, client_factory, poll_interval, worker_kwargs):
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_worker_process,
+                                 args=(path, client_factory, f"{socket.gethostname()}-{os.getpid()}-{k}",
+                                       poll_interval, worker_kwargs))
+                 for k in range(workers)]
+    for process in processes:
+        process.start()
+    return processes
+
+def _worker_process(path, client_factory, worker_id, poll_interval, worker_kwargs):
+    if client_factory is None:
+        from openai import AsyncOpenAI
+        client_factory = AsyncOpenAI
+    sharded = ShardedLaMPscores.open(path)
+    asyncio.run(sharded.work(client_factory(), worker_id=worker_id, poll_interval=poll_interval, quiet=True,
+                             **worker_kwargs))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m lampscores.sharded_runner",
+                                     description="Workers, status, and merging for runs submitted by ShardedLaMPscores.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    work = commands.add_parser("work", help="run worker processes on this machine until no shards are left")
+    work.add_argument("path")
+    work.add_argument("--workers", type=int, default=1)
+    work.add_argument("--base-url", help="API base URL (the API key is read from OPENAI_API_KEY)")
+    work.add_argument("--concurrency", type=int, default=125)
+    work.add_argument("--rate-limiter", action="store_true", help="adapt concurrency to the provider's rate limits")
+    work.add_argument("--cache", help="path of a ResponseCache for this machine")
+    work.add_argument("--poll-interval", type=float, default=5.0)
+    status = commands.add_parser("status", help="count shards by status")
+    status.add_argument("path")
+    merge = commands.add_parser("merge", help="merge the finished shards into a CSV file")
+    merge.add_argument("path")
+    merge.add_argument("output")
+    retry = commands.add_parser("retry-failed", help="queue failed shards again")
+    retry.add_argument("path")
+    args = parser.parse_args(argv)
+
+    sharded = ShardedLaMPscores.open(args.path)
+    if args.command == "work":
+        client_factory = None
+        if args.base_url:
+            import functools
+            from openai import AsyncOpenAI
+            client_factory = functools.partial(AsyncOpenAI, base_url=args.base_url)
+        worker_kwargs = {"concurrency": args.concurrency, "rate_limiter": args.rate_limiter, "cache": args.cache}
+        processes = _start_workers(args.path, args.workers, client_factory, args.poll_interval, worker_kwargs)
+        for process in processes:
+            process.join()
+        print(json.dumps(sharded.status()))
+    elif args.command == "status":
+        print(json.dumps(sharded.status()))
+    elif args.command == "merge":
+        sharded.merge().to_csv(args.output, index=False)
+        print(f"Saved {len(sharded.matchup_results_df)} matchups to {args.output}")
+    else:
+        print(f"{sharded.queue.retry_failed()} failed shards queued again")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+import json
+import logging
+import math
+import os
+import time
+from array import array
+from collections import Counter
+
+# USD per million (input, output) tokens for standard requests; the Batch API is billed at batch_discount of these.
+# Model names match by their longest listed prefix, e.g. "gpt-4o-mini-2024-07-18" uses "gpt-4o-mini"
+DEFAULT_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "o4-mini": (1.10, 4.40),
+    "o3": (2.00, 8.00),
+}
+
+class Telemetry:
+    """
+    Collects one event per LLM request and aggregates latency percentiles, queue wait and service time,
+    retries, token usage, and estimated cost by phase and model.
+
+    Request events are dicts with: phase, model, status ("ok", "failed", "cached", or "coalesced"), latency
+    (seconds from the call to its result), queue_wait (waiting for a concurrency slot), service_time (in
+    API calls), attempts, prompt_tokens, completion_tokens, cost, batch, and error. Every failed attempt also
+    emits a "retry" event. Each event is passed to every sink: a callable, or an object with emit(event) and
+    optionally report(summary) and close()
+    """
+    def __init__(self, sinks=(), prices=None, batch_discount=0.5):
+        self.sinks = []
+        for sink in sinks:
+            self.add_sink(sink)
+        self.prices = dict(DEFAULT_PRICES if prices is None else prices)
+        self.batch_discount = batch_discount
+        self.reset()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink if hasattr(sink, "emit") else CallbackSink(sink))
+
+    def reset(self):
+        self._groups = {}
+        self._errors = Counter()
+        self._unpriced = set()
+        self.started_at = time.time()
+
+    def price(self, model):
+        # (input, output) USD per million tokens, or None if the model is not in the price table
+        if model in self.prices:
+            return self.prices[model]
+        matches = [name for name in self.prices if model and model.startswith(name)]
+        return self.prices[max(matches, key=len)] if matches else None
+
+    def cost(self, model, prompt_tokens, completion_tokens, batch=False):
+        price = self.price(model)
+        if price is None:
+            if prompt_tokens or completion_tokens:
+                self._unpriced.add(model)
+            return 0.0
+        cost = (prompt_tokens * price[0] + completion_tokens * price[1]) / 1e6
+        return cost * self.batch_discount if batch else cost
+
+    def request(self, phase, model, status, latency, queue_wait=0.0, service_time=0.0, attempts=0,
+                prompt_tokens=0, completion_tokens=0, batch=False, error=None):
+        """
+        Records one finished request
+        """
+        self.record({"type": "request",
+                     "phase": phase or "other",
+                     "model": model,
+                     "status": status,
+                     "latency": latency,
+                     "queue_wait": queue_wait,
+                     "service_time": service_time,
+                     "attempts": attempts,
+                     "prompt_tokens": prompt_tokens,
+                     "completion_tokens": completion_tokens,
+                     "cost": self.cost(model, prompt_tokens, completion_tokens, batch),
+                     "batch": batch,
+                     "error": None if error is None else str(error)})
+
+    def retry(self, phase, model, attempt, status_code, error, wait):
+        """
+        Records one failed attempt that will be retried after wait seconds (or not, if it was the last one)
+        """
+        self.record({"type": "retry",
+                     "phase": phase or "other",
+                     "model": model,
+                     "attempt": attempt,
+                     "status_code": status_code,
+                     "error": str(error),
+                     "wait": wait})
+
+    def record(self, event):
+        if event["type"] == "request":
+            key = (event["phase"], event["model"])
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = _Group()
+            group.add(event)
+        elif event["type"] == "retry":
+            # Failed attempts by HTTP status, with "other" for errors that have none (e.g. timeouts)
+            self._errors["other" if event["status_code"] is None else str(event["status_code"])] += 1
+
+        for sink in self.sinks:
+            sink.emit(event)
+
+    def summary(self):
+        """
+        Totals, latency/queue wait/service time percentiles, tokens, and cost: overall, by phase, and by model
+        """
+        summary = _Group.merge(self._groups.values()).summary()
+        summary["by_phase"] = {}
+        summary["by_model"] = {}
+        for field, position in (("by_phase", 0), ("by_model", 1)):
+            names = sorted({key[position] for key in self._groups}, key=str)
+            for name in names:
+                summary[field][name] = _Group.merge(group for key, group in self._groups.items()
+                                                    if key[position] == name).summary()
+        summary["errors"] = dict(self._errors)
+        summary["unpriced_models"] = sorted(self._unpriced, key=str)
+        summary["wall_seconds"] = time.time() - self.started_at
+        return summary
+
+    def report(self):
+        # Passes the current summary to the sinks that produce reports, and returns it
+        summary = self.summary()
+        for sink in self.sinks:
+            if hasattr(sink, "report"):
+                sink.report(summary)
+        return summary
+
+    def close(self):
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+
+    @staticmethod
+    def format_summary(summary):
+        latency = summary["latency"]
+        return (f"{summary['requests']} requests ({summary['api_calls']} API calls, {summary['retries']} retries, "
+                f"{summary['cached']} cached, {summary['coalesced']} coalesced, {summary['failed']} failed); "
+                f"latency p50 {latency['p50']:.2f}s, p95 {latency['p95']:.2f}s, p99 {latency['p99']:.2f}s; "
+                f"{summary['prompt_tokens']} prompt and {summary['completion_tokens']} completion tokens; "
+                f"estimated cost ${summary['cost']:.4f}")
+
+class _Group:
+    # Aggregates for one (phase, model); timings are kept in compact arrays for the percentiles
+    def __init__(self):
+        self.counts = Counter()
+        self.latency = array("d")
+        self.queue_wait = array("d")
+        self.service_time = array("d")
+
+    def add(self, event):
+        counts = self.counts
+        counts["requests"] += 1
+        counts[event["status"]] += 1
+        counts["api_calls"] += event["attempts"]
+        counts["retries"] += max(0, event["attempts"] - 1)
+        counts["prompt_tokens"] += event["prompt_tokens"]
+        counts["completion_tokens"] += event["completion_tokens"]
+        counts["cost"] += event["cost"]
+        self.latency.append(event["latency"])
+        if event["attempts"] > 0:
+            self.queue_wait.append(event["queue_wait"])
+            self.service_time.append(event["service_time"])
+
+    @classmethod
+    def merge(cls, groups):
+        merged = cls()
+        for group in groups:
+            merged.counts.update(group.counts)
+            merged.latency.extend(group.latency)
+            merged.queue_wait.extend(group.queue_wait)
+            merged.service_time.extend(group.service_time)
+        return merged
+
+    def summary(self):
+        counts = self.counts
+        return {"requests": counts["requests"],
+                "api_calls": counts["api_calls"],
+                "retries": counts["retries"],
+                "ok": counts["ok"],
+                "cached": counts["cached"],
+                "coalesced": counts["coalesced"],
+                "failed": counts["failed"],
+                "prompt_tokens": counts["prompt_tokens"],
+                "completion_tokens": counts["completion_tokens"],
+                "cost": counts["cost"],
+                "latency": _distribution(self.latency),
+                "queue_wait": _distribution(self.queue_wait),
+                "service_time": _distribution(self.service_time)}
+
+def _distribution(values):
+    if len(values) == 0:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(values)
+
+    def percentile(q):
+        # Nearest-rank percentile
+        return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+    return {"mean": sum(ordered) / len(ordered),
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "max": ordered[-1]}
+
+class CallbackSink:
+    """
+    Passes every event to a function, e.g. one that updates Prometheus or StatsD metrics
+    """
+    def __init__(self, callback):
+        self.callback = callback
+
+    def emit(self, event):
+        self.callback(event)
+
+class LoggingSink:
+    """
+    Logs request events at level (failures and retries at WARNING) and the summary at INFO
+    """
+    def __init__(self, logger="lampscores", level=logging.DEBUG):
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.level = level
+
+    def emit(self, event):
+        if event["type"] == "retry":
+            self.logger.warning("%s request to %s failed (attempt %d, status %s): %s",
+                                event["phase"], event["model"], event["attempt"], event["status_code"], event["error"])
+        elif event["status"] == "failed":
+            self.logger.warning("%s request to %s failed after %d attempts: %s",
+                                event["phase"], event["model"], event["attempts"], event["error"])
+        elif self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "%s request to %s: %s in %.3fs (queue %.3fs), %d+%d tokens",
+                            event["phase"], event["model"], event["status"], event["latency"], event["queue_wait"],
+                            event["prompt_tokens"], event["completion_tokens"])
+
+    def report(self, summary):
+        self.logger.info("LLM telemetry: %s", Telemetry.format_summary(summary))
+
+class JSONLinesSink:
+    """
+    Appends every event to a JSONL file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+
+    def emit(self, event):
+        self.file.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def report(self, summary):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class JSONReportSink:
+    """
+    Writes the run summary to a JSON file whenever a report is made
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, event):
+        pass
+
+    def report(self, summary):
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=1)
+        os.replace(self.path + ".tmp", self.path)
@@ -0,0 +1,46 @@
+import asyncio
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lampscores import FakeAsyncOpenAI, LaMPscores
+
+@pytest.fixture(scope="session")
+def roster():
+    """
+    Makes a roster of n members with mixed parties, in the shape of voteview_df
+    """
+    def make(n):
+        return pd.DataFrame({"bioname_canonical": [f"Member {i}" for i in range(n)],
+                             "bioguide_id": [f"M{i:05d}" for i in range(n)],
+                             "chamber": "House",
+                             "congress": 117,
+                             "party_code": np.random.default_rng(n).choice([100, 200], n),
+                             "state_abbrev": "CA"})
+    return make
+
+@pytest.fixture(scope="session")
+def make_lamp(roster):
+    """
+    Makes a LaMPscores run over a roster of n members, answered by a FakeAsyncOpenAI, without a progress bar
+    """
+    def make(n, client=None, **kwargs):
+        async def quiet(completed, total):
+            pass
+        return LaMPscores(client or FakeAsyncOpenAI(), "fake", voteview_df=roster(n),
+                          politician_type="representative", progress_callback=quiet, **kwargs)
+    return make
+
+@pytest.fixture(scope="session")
+def run_quietly():
+    """
+    Runs a coroutine to completion and returns its result and everything it printed
+    """
+    def run(coroutine):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            result = asyncio.run(coroutine)
+        return result, output.getvalue()
+    return run
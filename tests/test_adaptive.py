@@ -0,0 +1,76 @@
+import re
+
+import numpy as np
+import pytest
+
+from lampscores import FakeAsyncOpenAI, fit_bradley_terry
+from lampscores.adaptive import bridging_pairs, comparison_components
+
+@pytest.fixture
+def run_adaptive(make_lamp, run_quietly):
+    def run(n, seed, malformed_rate=0.0, answer=None, **kwargs):
+        lamp = make_lamp(n, FakeAsyncOpenAI(seed=seed, malformed_rate=malformed_rate, answer=answer), adaptive=True,
+                         randomize_pairwise_order_seed=seed, **kwargs)
+        _, output = run_quietly(lamp.run())
+        return lamp, output
+    return run
+
+def test_components_match_union_find():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        n = int(rng.integers(1, 60))
+        m = int(rng.integers(0, 80))
+        idx0, idx1 = rng.integers(0, n, m), rng.integers(0, n, m)
+
+        parent = list(range(n))
+        def root(i):
+            while parent[i] != i:
+                i = parent[i]
+            return i
+        for a, b in zip(idx0.tolist(), idx1.tolist()):
+            ra, rb = root(a), root(b)
+            parent[max(ra, rb)] = min(ra, rb)
+
+        labels = comparison_components(idx0, idx1, n)
+        assert labels.tolist() == [root(i) for i in range(n)]
+
+        bridge0, bridge1 = bridging_pairs(labels, rng)
+        assert len(bridge0) == len(np.unique(labels)) - 1
+        joined = comparison_components(np.concatenate([idx0, bridge0]), np.concatenate([idx1, bridge1]), n)
+        assert len(np.unique(joined)) == 1
+
+@pytest.mark.parametrize("seed", range(5))
+def test_small_roster_adaptive_run_finishes(run_adaptive, seed):
+    lamp, _ = run_adaptive(20, seed, adaptive_max_rounds=3)
+    assert len(lamp.matchup_results_df) == len(lamp.matchup_idx0)
+    assert len(lamp.adaptive_stats) >= 1
+
+def test_adaptive_run_bridges_split_outcomes(run_adaptive):
+    # With most extractions unusable and no retries, the valid outcomes split apart; the run bridges them
+    bridged = 0
+    for seed in range(6):
+        lamp, output = run_adaptive(40, seed, adaptive_initial_per_item=2, adaptive_max_rounds=4, extraction_retries=0,
+                                    malformed_rate=0.6)
+        bridged += "bridging comparisons" in output
+        assert len(lamp.matchup_results_df) == len(lamp.matchup_idx0)
+    assert bridged > 0
+
+def test_adaptive_run_stops_at_target_on_lampscore_scale(run_adaptive):
+    # Consistent outcomes stretch the logit scale, so the target is on the lampscore scale
+    lamp, _ = run_adaptive(60, 0, adaptive_target_se=0.15)
+    stats = lamp.adaptive_stats
+    assert len(stats) < lamp.adaptive_max_rounds
+    assert stats[-1]["max_se"] <= 0.15 < stats[0]["max_se"]
+    assert stats[-1]["max_se"] == pytest.approx(fit_bradley_terry(lamp.matchup_results_df)["qse"].max())
+
+def test_member_without_valid_outcomes_is_bridged(run_adaptive):
+    # Every extraction about Member 7 fails, so it never joins the fitted group and the run cannot converge
+    def answer(messages, response_format):
+        if len(messages) > 1 and any(re.search(r"Member 7\b", message["content"]) for message in messages):
+            return "It is not possible to tell."
+        return None
+
+    lamp, output = run_adaptive(40, 0, answer=answer, adaptive_max_rounds=4, adaptive_target_se=0.01)
+    assert output.count("adding 1 bridging comparisons") == 4
+    assert [entry["max_se"] for entry in lamp.adaptive_stats] == [1.0] * 4
+    assert (lamp.matchup_idx0 == 7).sum() + (lamp.matchup_idx1 == 7).sum() > 4
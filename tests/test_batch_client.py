@@ -0,0 +1,84 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+import pytest
+
+from lampscores import FakeAsyncOpenAI, LLMOpenAIBatchClient
+
+def messages(n, size=0):
+    return [[{"role": "user", "content": "x" * size + f" question {i}"}] for i in range(n)]
+
+def run(client, messages_list, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        return asyncio.run(client.prompting_process(messages_list, **kwargs))
+
+def read_shard(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return len(data), [json.loads(line)["custom_id"] for line in data.splitlines()]
+
+def test_shards_split_at_50000_requests(tmp_path):
+    client = LLMOpenAIBatchClient(None)
+    requests = [(i, {"messages": m}) for i, m in enumerate(messages(50001))]
+    paths = client._write_shards(requests, str(tmp_path))
+    counts = [len(read_shard(path)[1]) for path in paths]
+    assert counts == [50000, 1]
+    assert read_shard(paths[1])[1] == ["request-50000"]
+
+def test_shards_split_at_200_megabytes(tmp_path):
+    client = LLMOpenAIBatchClient(None)
+    requests = [(i, {"messages": m}) for i, m in enumerate(messages(201, size=1024 * 1024))]
+    paths = client._write_shards(requests, str(tmp_path))
+    shards = [read_shard(path) for path in paths]
+    assert len(shards) == 2
+    assert all(size <= 200 * 1024 * 1024 for size, _ in shards)
+    assert [custom_id for _, ids in shards for custom_id in ids] == [f"request-{i}" for i in range(201)]
+
+def test_requests_are_split_across_batches(tmp_path):
+    fake = FakeAsyncOpenAI(answer=lambda messages, response_format: messages[0]["content"])
+    client = LLMOpenAIBatchClient(fake, poll_interval=0, work_dir=str(tmp_path), max_requests_per_file=20,
+                                  max_bytes_per_file=8000)
+    messages_list = messages(100, size=20) + messages(20, size=400)
+    results = run(client, messages_list, max_tries=1)
+    assert results == [m[0]["content"] for m in messages_list]
+    # Files given a work_dir are kept
+    paths = sorted(os.listdir(tmp_path), key=lambda path: int(path.split("_")[2].split(".")[0]))
+    shards = [read_shard(tmp_path / path) for path in paths]
+    assert len(shards) == len(fake.batches._batches)
+    assert all(size <= 8000 and len(ids) <= 20 for size, ids in shards)
+    # Both limits split files: the short requests by count, the long ones by size
+    assert [len(ids) for _, ids in shards[:5]] == [20] * 5
+    assert all(len(ids) < 20 for _, ids in shards[5:]) and len(shards) > 6
+
+def test_failed_requests_are_resubmitted():
+    fake = FakeAsyncOpenAI(answer=lambda messages, response_format: "ok", server_error_rate=0.4)
+    client = LLMOpenAIBatchClient(fake, poll_interval=0)
+    results = run(client, messages(200), max_tries=10)
+    assert results == ["ok"] * 200
+    assert fake.server_errors > 0
+    assert len(fake.batches._batches) > 1
+
+def test_requests_failing_every_attempt():
+    fake = FakeAsyncOpenAI(answer=lambda messages, response_format: "ok", server_error_rate=1.0)
+    client = LLMOpenAIBatchClient(fake, poll_interval=0)
+    assert run(client, messages(5), max_tries=3, return_exceptions=True) == [None] * 5
+    assert len(fake.batches._batches) == 3
+    with pytest.raises(RuntimeError):
+        run(client, messages(5), max_tries=2)
+
+def test_temporary_batch_files_are_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    fake = FakeAsyncOpenAI(answer=lambda messages, response_format: "ok", server_error_rate=0.3)
+    client = LLMOpenAIBatchClient(fake, poll_interval=0)
+    assert run(client, messages(50), max_tries=10) == ["ok"] * 50
+    assert os.listdir(tmp_path) == []
+    assert client.work_dir is None
+
+    fake.server_error_rate = 1.0
+    with pytest.raises(RuntimeError):
+        run(client, messages(5), max_tries=1)
+    assert os.listdir(tmp_path) == []
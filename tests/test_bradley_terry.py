@@ -0,0 +1,74 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lampscores import fit_bradley_terry
+from lampscores.bradley_terry import _quasi_variances, fit_bradley_terry_arrays
+
+def random_graph(rng, n, extra):
+    # A random spanning tree plus extra random matchups, so the graph is connected
+    idx0 = np.concatenate([np.arange(1, n), rng.integers(0, n, extra)])
+    idx1 = np.concatenate([rng.integers(0, np.arange(1, n)), rng.integers(0, n, extra)])
+    keep = idx0 != idx1
+    return idx0[keep], idx1[keep]
+
+def two_components(rng, one_sided):
+    n0, n1 = rng.integers(2, 15, 2)
+    a0, b0 = random_graph(rng, n0, 2 * n0)
+    a1, b1 = random_graph(rng, n1, 2 * n1)
+    idx0 = np.concatenate([a0, a1 + n0])
+    idx1 = np.concatenate([b0, b1 + n0])
+    win0 = rng.integers(0, 3, len(idx0)).astype(float)
+    win1 = np.zeros(len(idx0)) if one_sided else rng.integers(0, 3, len(idx0)).astype(float)
+    win0[win0 + win1 == 0] = 1.0
+    return idx0, idx1, win0, win1, n0 + n1
+
+@pytest.mark.parametrize("dense_limit", [2000, 0])
+def test_disconnected_graphs_are_rejected(dense_limit):
+    rng = np.random.default_rng(0)
+    for k in range(50):
+        idx0, idx1, win0, win1, n = two_components(rng, one_sided=k % 3 == 0)
+        with pytest.raises(ValueError, match="not connected"):
+            fit_bradley_terry_arrays(idx0, idx1, win0, win1, n, dense_limit=dense_limit)
+
+def test_matchups_without_outcome_do_not_connect():
+    # Members 0-1 and 2-3 are joined only by a matchup that has no valid outcome
+    with pytest.raises(ValueError, match="not connected"):
+        fit_bradley_terry_arrays([0, 2, 1], [1, 3, 2], [1.0, 2.0, 0.0], [1.0, 0.0, 0.0], 4)
+
+def test_member_without_matchups_is_rejected():
+    with pytest.raises(ValueError, match="not connected"):
+        fit_bradley_terry_arrays([0, 1], [1, 2], [1.0, 1.0], [1.0, 1.0], 4)
+
+def test_disconnected_results_table_is_rejected():
+    df = pd.DataFrame({"bioguide_id0": ["A", "C"], "bioguide_id1": ["B", "D"],
+                       "name0": ["a", "c"], "name1": ["b", "d"], "party0": ["D", "R"], "party1": ["R", "D"],
+                       "win0": [1.0, 0.0], "win1": [0.0, 1.0]})
+    with pytest.raises(ValueError, match="not connected"):
+        fit_bradley_terry(df)
+
+def test_connected_graphs_fit_without_warnings():
+    rng = np.random.default_rng(1)
+    for k in range(30):
+        n = int(rng.integers(3, 30))
+        idx0, idx1 = random_graph(rng, n, 2 * n)
+        win0 = rng.integers(0, 3, len(idx0)).astype(float)
+        # Every third graph is fully one-sided, i.e. completely separated; Firth keeps it finite
+        win1 = np.zeros(len(idx0)) if k % 3 == 0 else rng.integers(0, 3, len(idx0)).astype(float)
+        win0[win0 + win1 == 0] = 1.0
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            ability, quasi_variance = fit_bradley_terry_arrays(idx0, idx1, win0, win1, n)
+        assert np.isfinite(ability).all() and abs(ability.sum()) < 1e-6
+        assert np.isfinite(quasi_variance).all() and (quasi_variance > 0).all()
+
+def test_quasi_variances_of_degenerate_covariance():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert _quasi_variances(np.zeros((4, 4))).tolist() == [0.0] * 4
+        assert _quasi_variances(np.zeros((1, 1))).tolist() == [0.0]
+        # Unequal variances whose best fit has a negative quasi-variance stay positive
+        covariance = np.diag([1e-6, 1.0, 1.0, 1.0, 1.0])
+        assert (_quasi_variances(covariance) > 0).all()
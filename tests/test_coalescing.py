@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from lampscores import FakeAsyncOpenAI, LLMOpenAIClient
+
+MESSAGES = [{"role": "user", "content": "Which representative was more liberal: Member 1 or Member 2?"}]
+
+def call(client):
+    return client.calling_llm(MESSAGES, "fake", temperature=0.0, top_p=1.0, max_tries=1)
+
+async def start(client, waiters):
+    # One request in flight and duplicates waiting on it
+    owner = asyncio.create_task(call(client))
+    await asyncio.sleep(0.01)
+    duplicates = [asyncio.create_task(call(client)) for _ in range(waiters)]
+    await asyncio.sleep(0.01)
+    return owner, duplicates
+
+def test_duplicates_share_one_request():
+    async def main():
+        fake = FakeAsyncOpenAI(latency=0.1)
+        client = LLMOpenAIClient(fake)
+        owner, duplicates = await start(client, 2)
+        return fake, client, await asyncio.gather(owner, *duplicates)
+
+    fake, client, results = asyncio.run(main())
+    assert len(set(results)) == 1 and results[0] is not None
+    assert fake.calls == 1 and client.coalesce_stats()["in_flight"] == 2
+
+def test_cancelled_owner_does_not_cancel_duplicates():
+    async def main():
+        fake = FakeAsyncOpenAI(latency=0.1)
+        client = LLMOpenAIClient(fake)
+        owner, duplicates = await start(client, 2)
+        owner.cancel()
+        results = await asyncio.gather(*duplicates)
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return fake, client, results
+
+    fake, client, results = asyncio.run(main())
+    assert len(set(results)) == 1 and results[0] is not None
+    # The first duplicate to wake up sent the request again, and the other waited for it
+    assert fake.calls == 2 and client.coalesce_stats()["in_flight"] == 1
+    assert client._in_flight == {}
+
+def test_cancelled_duplicate_does_not_cancel_owner():
+    async def main():
+        fake = FakeAsyncOpenAI(latency=0.1)
+        client = LLMOpenAIClient(fake)
+        owner, duplicates = await start(client, 2)
+        duplicates[0].cancel()
+        results = await asyncio.gather(owner, duplicates[1])
+        assert duplicates[0].cancelled()
+        return fake, results
+
+    fake, results = asyncio.run(main())
+    assert len(set(results)) == 1 and fake.calls == 1
+
+def test_failed_request_fails_duplicates():
+    async def main():
+        fake = FakeAsyncOpenAI(latency=0.05, server_error_rate=1.0)
+        client = LLMOpenAIClient(fake)
+        owner, duplicates = await start(client, 2)
+        return fake, await asyncio.gather(owner, *duplicates, return_exceptions=True)
+
+    fake, results = asyncio.run(main())
+    assert all(getattr(result, "status_code", None) == 500 for result in results)
+
+def test_cancelled_job_does_not_stop_job_sharing_the_client():
+    # As when LaMPscoresBatch runs several Congresses through one client and one of them is cancelled
+    messages_list = [[{"role": "user", "content": f"Which representative was more liberal: Member {i} or Member {i + 1}?"}]
+                     for i in range(20)]
+
+    async def main():
+        fake = FakeAsyncOpenAI(latency=0.1)
+        client = LLMOpenAIClient(fake, concurrency=5)
+        jobs = [asyncio.create_task(client.prompting_process(messages_list, "fake", temperature=0.0)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        jobs[0].cancel()
+        return await asyncio.gather(*jobs, return_exceptions=True)
+
+    cancelled, results = asyncio.run(main())
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert len(results) == 20 and all(result is not None for result in results)
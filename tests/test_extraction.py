@@ -0,0 +1,60 @@
+import pytest
+
+from lampscores import FakeAsyncOpenAI, LaMPscores
+
+@pytest.fixture
+def matcher(roster):
+    def make(**kwargs):
+        voteview_df = roster(2)
+        voteview_df["bioname_canonical"] = ["Joe Manchin", "Bernie Sanders"]
+        lamp = LaMPscores(None, "fake", voteview_df=voteview_df, politician_type="senator", **kwargs)
+        lamp.load_data()
+        lamp.create_matchups()
+        return lambda answer: lamp._match_extracted_answer(0, answer)
+    return make
+
+@pytest.mark.parametrize("answer, expected", [("Joe Manchin", "Joe Manchin"),
+                                              ("joe manchin", "Joe Manchin"),
+                                              ("\"Bernie Sanders.\"", "Bernie Sanders"),
+                                              ("**Bernie Sanders**", "Bernie Sanders"),
+                                              ("Senator Joe Manchin.", "Joe Manchin"),
+                                              ("  TIE ", "Tie"),
+                                              ("Joe Machin", "Joe Manchin"),
+                                              ("Bernie Sander", "Bernie Sanders")])
+def test_whole_answer_is_normalized(matcher, answer, expected):
+    assert matcher()(answer) == expected
+
+@pytest.mark.parametrize("answer", ["Joe Manchin is more moderate",
+                                    "Not Bernie Sanders",
+                                    "The answer is Joe Manchin, since Bernie Sanders is more liberal.",
+                                    "Neither",
+                                    "",
+                                    None])
+def test_sentences_are_not_matched(matcher, answer):
+    assert matcher()(answer) is None
+
+def test_sentence_matching_credits_the_only_name(matcher):
+    match = matcher(sentence_matching=True)
+    assert match("The more liberal senator is Bernie Sanders.") == "Bernie Sanders"
+    assert match("Joe Manchin is more moderate") == "Joe Manchin"
+    assert match("Joe Manchin, not Bernie Sanders") is None
+
+def test_exact_matching(matcher):
+    match = matcher(fuzzy_matching=False)
+    assert match("Joe Manchin") == "Joe Manchin" and match("Tie") == "Tie"
+    assert match("joe manchin") is None and match("Senator Joe Manchin.") is None
+
+def test_sentence_answers_are_retried(make_lamp, run_quietly):
+    # The first extraction of every matchup answers with a sentence naming one politician; retries answer properly
+    answered = set()
+    def answer(messages, response_format):
+        if len(messages) == 1 or messages[-1]["content"] in answered:
+            return None
+        answered.add(messages[-1]["content"])
+        return "Member 0 is more moderate"
+
+    lamp = make_lamp(6, FakeAsyncOpenAI(answer=answer), sample_per_item=2)
+    run_quietly(lamp.run())
+    stats = lamp.extraction_retry_stats
+    assert stats[0]["retried"] == len(lamp.matchup_idx0) and stats[0]["remaining"] == 0
+    assert lamp.matchup_results_df["extraction_error"].sum() == 0
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+@pytest.fixture(scope="module")
+def previous_results_df(make_lamp, run_quietly):
+    lamp = make_lamp(30, sample_per_item=6)
+    run_quietly(lamp.run())
+    return lamp.matchup_results_df
+
+def new_member_se(lamp):
+    new = lamp.scores_df[~lamp.scores_df["bioguide_id"].isin([f"M{i:05d}" for i in range(30)])]
+    return new["qse"].to_numpy()
+
+@pytest.mark.parametrize("max_rounds", [1, 2, 5])
+def test_stats_describe_every_refit(make_lamp, run_quietly, previous_results_df, max_rounds):
+    lamp = make_lamp(33, adaptive=True, adaptive_initial_per_item=2, adaptive_target_se=0.01,
+                     adaptive_max_rounds=max_rounds)
+    run_quietly(lamp.run_incremental(previous_results_df))
+    stats = lamp.incremental_stats
+    assert [entry["round"] for entry in stats] == list(range(len(stats)))
+    assert len(stats) == max_rounds + 1
+    # The last entry describes the final fit
+    assert stats[-1]["new_comparisons"] == len(lamp.new_matchup_results_df)
+    assert stats[-1]["max_se"] == pytest.approx(new_member_se(lamp).max())
+
+def test_non_adaptive_run_has_one_round(make_lamp, run_quietly, previous_results_df):
+    lamp = make_lamp(33, sample_per_item=5)
+    run_quietly(lamp.run_incremental(previous_results_df))
+    assert len(lamp.incremental_stats) == 1
+    assert lamp.incremental_stats[0]["max_se"] == pytest.approx(new_member_se(lamp).max())
+
+def test_results_file_is_closed_when_run_fails(make_lamp, run_quietly, previous_results_df, tmp_path):
+    lamp = make_lamp(33, sample_per_item=5, results_path=str(tmp_path / "results.csv"))
+    def fail(*args):
+        raise RuntimeError("refit failed")
+    lamp._refit_incremental = fail
+    with pytest.raises(RuntimeError):
+        run_quietly(lamp.run_incremental(previous_results_df))
+    assert lamp.result_sink is None
+    assert len(pd.read_csv(tmp_path / "results.csv")) == 15
+
+def test_adaptive_run_stops_at_target_on_lampscore_scale(make_lamp, run_quietly, previous_results_df):
+    lamp = make_lamp(33, adaptive=True, adaptive_initial_per_item=2, adaptive_target_se=0.2)
+    run_quietly(lamp.run_incremental(previous_results_df))
+    stats = lamp.incremental_stats
+    assert len(stats) < lamp.adaptive_max_rounds + 1
+    assert stats[-1]["max_se"] == pytest.approx(new_member_se(lamp).max()) and stats[-1]["max_se"] <= 0.2
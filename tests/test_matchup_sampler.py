@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+import pytest
+
+from lampscores.matchup_sampler import sample_balanced, sample_per_item, sample_stratified
+
+def n_components(n, idx0, idx1):
+    labels = np.arange(n)
+    while True:
+        low = np.minimum(labels[idx0], labels[idx1])
+        updated = labels.copy()
+        np.minimum.at(updated, idx0, low)
+        np.minimum.at(updated, idx1, low)
+        updated = updated[updated]
+        if (updated == labels).all():
+            return len(np.unique(labels))
+        labels = updated
+
+@pytest.mark.parametrize("n", [5, 20, 97, 100, 101, 435, 436, 441])
+@pytest.mark.parametrize("k", [2, 3, 4, 6])
+def test_balanced_design_is_connected(n, k):
+    for seed in range(200):
+        idx0, idx1 = sample_balanced(n, k, np.random.default_rng(seed))
+        assert n_components(n, idx0, idx1) == 1, seed
+
+@pytest.mark.parametrize("n", [2, 3, 4, 7, 10, 11])
+def test_balanced_design_is_regular(n):
+    for k in range(1, n + 1):
+        idx0, idx1 = sample_balanced(n, k, np.random.default_rng(k))
+        k_used = min(k, n - 1)
+        pairs = {(min(a, b), max(a, b)) for a, b in zip(idx0.tolist(), idx1.tolist())}
+        assert len(pairs) == len(idx0) and (idx0 != idx1).all()
+
+        degree = np.bincount(np.concatenate([idx0, idx1]), minlength=n)
+        assert set(degree.tolist()) <= {k_used - 1, k_used}
+        assert (degree == k_used - 1).sum() == (1 if n % 2 == 1 and k_used % 2 == 1 else 0)
+
+def check_distinct_pairs(n, idx0, idx1):
+    codes = np.minimum(idx0, idx1) * n + np.maximum(idx0, idx1)
+    assert (idx0 != idx1).all() and len(np.unique(codes)) == len(codes)
+
+@pytest.mark.parametrize("n, k", [(2, 1), (3, 5), (10, 9), (50, 49), (51, 40), (200, 150)])
+def test_dense_per_item_design(n, k):
+    for seed in range(5):
+        idx0, idx1 = sample_per_item(n, k, np.random.default_rng(seed))
+        check_distinct_pairs(n, idx0, idx1)
+        # Every member starts min(k, n - 1) matchups unless it has run out of partners
+        started = np.bincount(idx0, minlength=n)
+        degree = np.bincount(np.concatenate([idx0, idx1]), minlength=n)
+        assert ((started == min(k, n - 1)) | (degree == n - 1)).all()
+
+def test_complete_design_from_per_item():
+    idx0, idx1 = sample_per_item(60, 59, np.random.default_rng(0))
+    assert len(idx0) == 60 * 59 // 2
+
+@pytest.mark.parametrize("k", [4, 30, 99])
+def test_dense_stratified_design(k):
+    n = 100
+    groups = np.random.default_rng(0).choice([100, 200, 328], n, p=[0.45, 0.45, 0.1])
+    idx0, idx1 = sample_stratified(n, k, groups, np.random.default_rng(k))
+    check_distinct_pairs(n, idx0, idx1)
+    within = groups[idx0] == groups[idx1]
+    k_within = int(round(min(k, n - 1) * 0.5))
+    _, inverse, counts = np.unique(groups, return_inverse=True, return_counts=True)
+    group_size = counts[inverse]
+    started = np.bincount(idx0[within], minlength=n)
+    degree = np.bincount(np.concatenate([idx0[within], idx1[within]]), minlength=n)
+    # Members of the small group run out of partners within it
+    assert ((started == k_within) | (degree == group_size - 1)).all()
+    assert (degree < k_within).any() == (k_within > (groups == 328).sum() - 1)
+
+def test_dense_design_is_fast():
+    # The exact pass used to re-sort every pair drawn so far once per member (about 10 s here)
+    start = time.perf_counter()
+    idx0, idx1 = sample_per_item(1000, 900, np.random.default_rng(0))
+    assert time.perf_counter() - start < 5.0
+    assert len(idx0) == 1000 * 999 // 2
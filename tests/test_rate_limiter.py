@@ -0,0 +1,45 @@
+import pytest
+
+from lampscores import AdaptiveRateLimiter, LLMOpenAIClient
+
+# What OpenAI sends with every response: a few milliseconds until the per-minute windows roll over
+HEADERS = {"x-ratelimit-limit-requests": "500",
+           "x-ratelimit-limit-tokens": "200000",
+           "x-ratelimit-remaining-requests": "499",
+           "x-ratelimit-remaining-tokens": "199000",
+           "x-ratelimit-reset-requests": "120ms",
+           "x-ratelimit-reset-tokens": "6ms"}
+
+def backoff_times(status_code, headers, attempt=3, draws=200):
+    client = LLMOpenAIClient(None, rate_limiter=AdaptiveRateLimiter(max_backoff=60.0))
+    return [client._backoff_time(attempt, 2.0, headers, status_code) for _ in range(draws)]
+
+def test_server_error_ignores_reset_headers():
+    assert AdaptiveRateLimiter().retry_after(HEADERS, 500) is None
+    waits = backoff_times(500, HEADERS)
+    # Full-jitter exponential backoff: spread over [0, 2 * 2 ** 2], not the 120ms reset
+    assert all(0 <= wait <= 8.0 for wait in waits)
+    assert max(waits) > 1.0 and len(set(waits)) > 1
+
+def test_token_rate_limit_waits_for_token_reset():
+    headers = {**HEADERS, "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "1.5s"}
+    assert AdaptiveRateLimiter().retry_after(headers, 429) == pytest.approx(1.5)
+    assert backoff_times(429, headers, draws=5) == [pytest.approx(1.5)] * 5
+
+def test_request_rate_limit_waits_for_request_reset():
+    headers = {**HEADERS, "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s"}
+    assert AdaptiveRateLimiter().retry_after(headers, 429) == pytest.approx(2.0)
+
+def test_both_limits_exhausted_waits_for_later_reset():
+    headers = {**HEADERS, "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s",
+               "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "1m0s"}
+    assert AdaptiveRateLimiter().retry_after(headers, 429) == pytest.approx(60.0)
+
+def test_rate_limit_without_exhausted_limit_backs_off():
+    assert AdaptiveRateLimiter().retry_after(HEADERS, 429) is None
+    assert len(set(backoff_times(429, HEADERS))) > 1
+
+def test_retry_after_header_is_honored():
+    limiter = AdaptiveRateLimiter()
+    assert limiter.retry_after({**HEADERS, "retry-after": "3"}, 500) == 3.0
+    assert limiter.retry_after({**HEADERS, "retry-after-ms": "250"}, 429) == pytest.approx(0.25)
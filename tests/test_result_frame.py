@@ -0,0 +1,76 @@
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lampscores import LaMPscores
+from lampscores.prompt_renderer import PromptColumn, PromptRenderer
+
+TEMPLATES = [("Which {kind} was more liberal: {name0} or {name1}?",
+              "Which {kind} was more conservative: {name0} or {name1}?"),
+             ("{name0!r:>12} vs {name1} ({count:03d}%)", "{name1} vs. {party0[0]} {name0} ({count}% sure)"),
+             ("No fields at all",)]
+
+@pytest.fixture(params=[True, False], ids=["pyarrow", "no pyarrow"])
+def renderer(request, monkeypatch):
+    if not request.param:
+        monkeypatch.setitem(sys.modules, "pyarrow", None)
+    return PromptRenderer({"name": ["Ann", "Bo", "Cy", "Di"], "party": ["D", "R", "D", "I"]},
+                          constants={"kind": "senator", "count": 7})
+
+@pytest.mark.parametrize("templates", TEMPLATES)
+def test_render_array_matches_render_choice(renderer, templates):
+    rng = np.random.default_rng(0)
+    idx0, idx1 = rng.integers(0, 4, (2, 50))
+    choice = rng.integers(0, len(templates), 50)
+    expected = renderer.render_choice(templates, choice, idx0, idx1)
+    prompts = renderer.render_array(templates, choice, idx0, idx1)
+    assert prompts.tolist() == expected and prompts.dtype == pd.array(["x"], dtype="str").dtype
+    assert renderer.render_array(templates, choice[:0], idx0[:0], idx1[:0]).tolist() == []
+
+def test_prompt_column_to_array(renderer):
+    rng = np.random.default_rng(1)
+    idx0, idx1 = rng.integers(0, 4, (2, 30))
+    column = PromptColumn(renderer, TEMPLATES[0], rng.integers(0, 2, 30), idx0, idx1)
+    assert column.to_array().tolist() == list(column)
+    assert column.to_array([7, 2, 2]).tolist() == [column[7], column[2], column[2]]
+
+@pytest.mark.parametrize("lazy_prompts", [True, False])
+@pytest.mark.parametrize("unidirectional", [True, False])
+def test_result_frame(roster, lazy_prompts, unidirectional):
+    voteview_df = roster(12)
+    # Two members with the same name are credited by name, as before
+    voteview_df.loc[3, "bioname_canonical"] = "Member 4"
+    lamp = LaMPscores(None, "fake", voteview_df=voteview_df, politician_type="representative",
+                      lazy_prompts=lazy_prompts, unidirectional=unidirectional)
+    lamp.load_data()
+    lamp.create_matchups()
+    lamp.create_prompts()
+
+    n = len(lamp.matchup_idx0)
+    names = lamp.members["name"].to_numpy(dtype=object)
+    lamp.extraction_results = [[names[lamp.matchup_idx0[i]], names[lamp.matchup_idx1[i]], "Tie", None, "Neither",
+                                "Member 11"][i % 6] for i in range(n)]
+    lamp.pc_results = [f"Response {i}" for i in range(n)]
+    lamp.extraction_error = [int(i % 6 > 2) for i in range(n)]
+    lamp.make_final_df()
+    df = lamp.matchup_results_df
+
+    assert df["prompt"].tolist() == [lamp.prompts[i] for i in range(n)]
+    pd.testing.assert_series_equal(df["extracted_answer"], pd.Series(lamp.extraction_results, dtype="str"), check_names=False)
+    assert df["llm_response"].tolist() == lamp.pc_results
+    assert df["extraction_error"].tolist() == lamp.extraction_error
+    # Every row names one of its own members, a tie, or has no outcome
+    outcome = df["win0"] + df["win1"]
+    named = (df["extracted_answer"] == df["name0"]) | (df["extracted_answer"] == df["name1"])
+    assert ((outcome == 1.0) == (named | (df["extracted_answer"] == "Tie"))).all()
+    assert (df.loc[df["extracted_answer"] == "Tie", "win0"] == 0.5).all()
+    if not unidirectional:
+        assert df["comparison_direction"].tolist() == np.where(lamp.matchup_direction == 1, "conservative", "liberal").tolist()
+
+    # The rows written for a subset of matchups are the same as in the full frame
+    indices = np.array([n - 1, 0, 5, 3])
+    frame, defective = lamp._result_frame(not unidirectional, indices)
+    pd.testing.assert_frame_equal(frame, df.loc[indices])
+    assert defective.tolist() == (df.loc[indices, "win0"] + df.loc[indices, "win1"] == 0).tolist()
@@ -0,0 +1,65 @@
+import asyncio
+import contextlib
+import io
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from lampscores import FakeAsyncOpenAI
+from lampscores.sharded_runner import ShardedLaMPscores
+
+@pytest.fixture
+def submitted(roster, tmp_path):
+    def submit(**kwargs):
+        sharded = ShardedLaMPscores(str(tmp_path / "queue.sqlite"), "fake", voteview_df=roster(20),
+                                    politician_type="representative", sample_per_item=4, unidirectional=False,
+                                    **kwargs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            sharded.submit()
+        return sharded
+    return submit
+
+def test_locked_queue_does_not_block_event_loop(submitted, tmp_path):
+    sharded = submitted(shard_size=20)
+    # Another process holds the database for a second
+    other = sqlite3.connect(str(tmp_path / "queue.sqlite"), isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def main():
+        gaps = []
+        async def tick():
+            while True:
+                before = time.monotonic()
+                await asyncio.sleep(0.01)
+                gaps.append(time.monotonic() - before)
+        ticker = asyncio.create_task(tick())
+        await asyncio.sleep(0.05)
+        threading.Timer(1.0, other.commit).start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            finished = await sharded.work(FakeAsyncOpenAI(), worker_id="w", quiet=True)
+        ticker.cancel()
+        return finished, gaps
+
+    finished, gaps = asyncio.run(main())
+    other.close()
+    assert finished == sharded.status()["total"]
+    assert max(gaps) < 0.5
+
+def test_lost_lease_stops_shard(submitted, run_quietly):
+    sharded = submitted(shard_size=20, lease_seconds=0.3)
+    shard, _, _ = sharded.queue.claim("w")
+    # Another worker takes over the shard
+    sharded.queue._execute("UPDATE shards SET worker = 'other' WHERE shard = ?", (shard,))
+
+    async def main():
+        run = asyncio.create_task(asyncio.sleep(30))
+        await asyncio.wait_for(sharded._keep_lease(shard, "w", run), 5)
+        await asyncio.sleep(0)
+        return run
+
+    run, output = run_quietly(main())
+    assert run.cancelled()
+    assert "was lost" in output
+    assert sharded.queue.counts()["leased"] == 1